@@ -26,10 +26,11 @@ a time, so each Python module is free to assume it has the whole machine at its
 disposal, giving it the option of running subprocesses or multiple threads if
 desired.
 
-When a set of jobs is complete, the standard output and error of each is written
-back to the database.  The exit code of each job is returned to Gearman and
-communicated back to the MCP Server (where it is ultimately used to decide which
-task to run next).
+As jobs complete, their exit code, standard output and error are written back
+to the database (see ``task_results``), and the progress of the set of jobs is
+reported to Gearman.  When the set of jobs is complete, the exit code of each
+job is returned to Gearman and communicated back to the MCP Server (where it is
+ultimately used to decide which task to run next).
 """
 
 # This file is part of Archivematica.
@@ -54,7 +55,6 @@ task to run next).
 # @author Joseph Perry <joseph@artefactual.com>
 
 import ConfigParser
-import cPickle
 from functools import partial
 import logging
 import os
@@ -68,15 +68,15 @@ import gearman
 
 from main.models import Task
 from databaseFunctions import getUTCDate, retryOnFailure
+import task_payloads
 
-from django.db import transaction
-from django.utils import six
 import shlex
 import importlib
 
 from databaseFunctions import auto_close_db
 import fork_runner
 from job import Job
+from task_results import TaskResults
 
 logger = logging.getLogger('archivematica.mcp.client')
 
@@ -100,28 +100,26 @@ def get_supported_modules(file_):
 
 
 @auto_close_db
-def handle_batch_task(gearman_job, supported_modules):
+def handle_batch_task(gearman_job, supported_modules, task_results):
     module_name = supported_modules.get(gearman_job.task)
-    gearman_data = cPickle.loads(gearman_job.data)
+    gearman_data = task_payloads.loads(gearman_job.data)
 
     utc_date = getUTCDate()
+    # The same for every task of the batch
+    batch_replacements = (replacement_dict.items() +
+                          {'%date%': utc_date.isoformat(),
+                           '%jobCreatedDate%': gearman_data['createdDate']}.items())
     jobs = []
-    for task_uuid in gearman_data['tasks']:
-        task_data = gearman_data['tasks'][task_uuid]
+    for task_data in gearman_data['tasks']:
+        task_uuid = task_data['uuid']
         arguments = task_data['arguments']
-        if isinstance(arguments, six.text_type):
-            arguments = arguments.encode('utf-8')
 
-        replacements = (replacement_dict.items() +
-                        {'%date%': utc_date.isoformat(),
-                         '%taskUUID%': task_uuid,
-                         '%jobCreatedDate%': task_data['createdDate']}.items())
-
-        for var, val in replacements:
-            arguments = arguments.replace(var, val)
+        if '%' in arguments:
+            for var, val in batch_replacements + [('%taskUUID%', task_uuid)]:
+                arguments = arguments.replace(var, val)
 
         job = Job(gearman_job.task,
-                  task_data['uuid'],
+                  task_uuid,
                   _parse_command_line(arguments),
                   caller_wants_output=task_data['wants_output'])
         jobs.append(job)
@@ -135,13 +133,17 @@ def handle_batch_task(gearman_job, supported_modules):
     retryOnFailure("Set task start times", set_start_times)
 
     module = importlib.import_module("clientScripts." + module_name)
+    task_results.track(jobs)
 
     # Our module can indicate that it should be run concurrently...
     if hasattr(module, 'concurrent_instances'):
-        fork_runner.call("clientScripts." + module_name, jobs, task_count=module.concurrent_instances())
+        min_chunk_size = module.min_chunk_size() if hasattr(module, 'min_chunk_size') else 1
+        fork_runner.call("clientScripts." + module_name, jobs, task_count=module.concurrent_instances(),
+                         finished_callback=Job.finished, min_chunk_size=min_chunk_size)
     else:
         module.call(jobs)
 
+    task_results.record_all()
     return jobs
 
 
@@ -156,8 +158,18 @@ def _shlex_unescape(s):
     return ''.join(c1 for c1, c2 in zip(s, s[1:] + '.') if (c1, c2) != ('\\', '`'))
 
 
-def fail_all_tasks(gearman_job, reason):
-    gearman_data = cPickle.loads(gearman_job.data)
+def fail_all_tasks(gearman_job, reason, recorded_exit_codes=None):
+    """Fail every task of ``gearman_job``, except the ones whose results
+    were recorded already (``recorded_exit_codes``, by task UUID)."""
+    if recorded_exit_codes is None:
+        recorded_exit_codes = {}
+    try:
+        task_uuids = [task_data['uuid'] for task_data in task_payloads.loads(gearman_job.data)['tasks']]
+    except task_payloads.PayloadError:
+        logger.exception("Unable to decode the tasks of %s", gearman_job.task)
+        task_uuids = []
+    failed_tasks = [task_uuid for task_uuid in task_uuids
+                    if task_uuid not in recorded_exit_codes]
 
     result = {}
 
@@ -166,70 +178,62 @@ def fail_all_tasks(gearman_job, reason):
     # work...
     try:
         def fail_all_tasks_callback():
-            for task_uuid in gearman_data['tasks']:
+            for task_uuid in failed_tasks:
                 Task.objects.filter(taskuuid=task_uuid).update(stderror=str(reason),
                                                                exitcode=1,
                                                                endtime=getUTCDate())
 
-            retryOnFailure("Fail all tasks", fail_all_tasks_callback)
+        retryOnFailure("Fail all tasks", fail_all_tasks_callback)
 
     except Exception as e:
         logger.exception("Failed to update tasks in DB: %s", e)
 
     # But we can at least send an exit code back to Gearman
-    for task_uuid in gearman_data['tasks']:
-        result[task_uuid] = {'exitCode': 1}
+    for task_uuid in task_uuids:
+        result[task_uuid] = {'exitCode': recorded_exit_codes.get(task_uuid, 1)}
+
+    return task_payloads.dumps({'task_results': result})
+
 
-    return cPickle.dumps({'task_results': result})
+def _send_progress(gearman_worker, gearman_job, finished, total):
+    """Tell MCP Server how many tasks of ``gearman_job`` finished."""
+    gearman_worker.send_job_status(gearman_job, finished, total)
 
 
 @auto_close_db
 def execute_command(supported_modules, gearman_worker, gearman_job):
     """Execute the command encoded in ``gearman_job`` and return its exit code,
-    standard output and standard error as a pickled dict.
+    standard output and standard error as a dict encoded by ``task_payloads``.
     """
     logger.info("\n\n*** RUNNING TASK: %s", gearman_job.task)
 
+    task_results = TaskResults(
+        progress_callback=partial(_send_progress, gearman_worker, gearman_job))
     try:
-        jobs = handle_batch_task(gearman_job, supported_modules)
+        jobs = handle_batch_task(gearman_job, supported_modules, task_results)
         results = {}
 
-        def write_task_results_callback():
-            with transaction.atomic():
-                for job in jobs:
-                    logger.info("\n\n*** Completed job: %s", job.dump())
-
-                    kwargs = {
-                        'exitcode': job.get_exit_code(),
-                        'endtime': getUTCDate(),
-                    }
-                    if django_settings.CAPTURE_CLIENT_SCRIPT_OUTPUT:
-                        kwargs.update({
-                            'stdout': job.get_stdout(),
-                            'stderror': job.get_stderr(),
-                        })
-                    Task.objects.filter(taskuuid=job.UUID).update(**kwargs)
-
-                    results[job.UUID] = {'exitCode': job.get_exit_code()}
-
-                    if job.caller_wants_output:
-                        # Send back stdout/stderr so it can be written to files.
-                        # Most cases don't require this (logging to the database is
-                        # enough), but the ones that do are coordinated through the
-                        # MCP Server so that multiple MCP Client instances don't try
-                        # to write the same file at the same time.
-                        results[job.UUID]['stdout'] = job.get_stdout()
-                        results[job.UUID]['stderror'] = job.get_stderr()
-
-        retryOnFailure("Write task results", write_task_results_callback)
-
-        return cPickle.dumps({'task_results': results})
+        for job in jobs:
+            logger.info("\n\n*** Completed job: %s", job.dump())
+
+            results[job.UUID] = {'exitCode': job.get_exit_code()}
+
+            if job.caller_wants_output:
+                # Send back stdout/stderr so it can be written to files.
+                # Most cases don't require this (logging to the database is
+                # enough), but the ones that do are coordinated through the
+                # MCP Server so that multiple MCP Client instances don't try
+                # to write the same file at the same time.
+                results[job.UUID]['stdout'] = job.get_stdout()
+                results[job.UUID]['stderror'] = job.get_stderr()
+
+        return task_payloads.dumps({'task_results': results})
     except SystemExit:
         logger.error("IMPORTANT: Task %s attempted to call exit()/quit()/sys.exit(). This module should be fixed!", gearman_job.task)
-        return fail_all_tasks(gearman_job, "Module attempted exit")
+        return fail_all_tasks(gearman_job, "Module attempted exit", task_results.recorded_exit_codes())
     except Exception as e:
         logger.exception("Exception while processing task %s: %s", gearman_job.task, e)
-        return fail_all_tasks(gearman_job, e)
+        return fail_all_tasks(gearman_job, e, task_results.recorded_exit_codes())
 
 
 def start_gearman_worker(supported_modules):
@@ -48,6 +48,8 @@ from fileOperations import addFileToSIP
 
 import metsrw
 
+import mets_cache
+
 
 logger = get_script_logger('archivematica.mcp.client.assignFileUUID')
 
@@ -76,17 +78,15 @@ def get_file_info_from_mets(job, sip_directory, file_path_relative_to_sip):
         return {}
     job.print_output('Reading METS file', mets_file, 'for reingested file information.')
     logger.info('Archivematica AIP: reading METS file %s.', mets_file)
-    mets = metsrw.METSDocument.fromfile(mets_file)
+    mets = mets_cache.get(mets_file)
 
     current_path = file_path_relative_to_sip
 
     file_path_relative_to_sip = file_path_relative_to_sip.replace('%transferDirectory%', '', 1).replace('%SIPDirectory%', '', 1)
 
-    # Warning! This is not the fastest way to achieve this. But we will focus
-    # on optimizations later.
     # TODO: is it ok to assume that the file structure is flat?
     # TODO will this work with original vs normalized paths?
-    entry = mets.get_file(path=file_path_relative_to_sip)
+    entry = mets.get_file_by_path(file_path_relative_to_sip)
     if not entry:
         job.print_output('Could not find', file_path_relative_to_sip, 'in METS.')
         logger.info('Archivematica AIP: file UUID has not been found in the METS document: %s', file_path_relative_to_sip)
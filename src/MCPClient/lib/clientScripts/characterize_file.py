@@ -17,11 +17,12 @@ from django.conf import settings as mcpclient_settings
 
 # dashboard
 from main.models import FPCommandOutput
-from fpr.models import FPRule, FormatVersion
+from fpr.models import FormatVersion
 
 # archivematicaCommon
 from executeOrRunSubProcess import executeOrRun
-from databaseFunctions import insertIntoFPCommandOutput
+from databaseFunctions import buffered_writes, insertIntoFPCommandOutput
+import fpr_cache
 from dicts import replace_string_values, ReplacementDict
 
 from lib import setup_dicts
@@ -47,13 +48,12 @@ def main(job, file_path, file_uuid, sip_uuid):
         rules = format = None
 
     if format:
-        rules = FPRule.active.filter(format=format.uuid,
-                                     purpose='characterization')
+        rules = fpr_cache.get_fprules('characterization', format.uuid)
 
     # Characterization always occurs - if nothing is specified, get one or more
     # defaults specified in the FPR.
     if not rules:
-        rules = FPRule.active.filter(purpose='default_characterization')
+        rules = fpr_cache.get_fprules('default_characterization')
 
     for rule in rules:
         if rule.command.script_type == 'bashScript' or rule.command.script_type == 'command':
@@ -101,7 +101,7 @@ def main(job, file_path, file_uuid, sip_uuid):
 
 
 def call(jobs):
-    with transaction.atomic():
+    with transaction.atomic(), buffered_writes():
         for job in jobs:
             with job.JobContext():
                 job.set_status(main(job, *job.args[1:]))
@@ -1,25 +1,39 @@
 #!/usr/bin/env python2
 
 import argparse
+import json
 import multiprocessing
 import uuid
 
 import django
 django.setup()
 # dashboard
-from fpr.models import IDCommand, IDRule, FormatVersion
+from fpr.models import IDRule, FormatVersion
 from main.models import FileFormatVersion, File, FileID, UnitVariable
 from django.db import transaction
 
 # archivematicaCommon
 from executeOrRunSubProcess import executeOrRun
-from databaseFunctions import getUTCDate, insertIntoEvents
+from databaseFunctions import buffered_writes, create_object, getUTCDate, insertIntoEvents, update_object
+import fpr_cache
+
+# Files identified by each worker with one run of a batch IDCommand: starting
+# the tool (e.g. loading the signatures of Fido) takes longer than identifying
+# a few files.
+BATCH_MIN_CHUNK_SIZE = 50
 
 
 def concurrent_instances():
     return multiprocessing.cpu_count()
 
 
+def min_chunk_size():
+    command = _default_idcommand()
+    if command is not None and command.batch:
+        return BATCH_MIN_CHUNK_SIZE
+    return 1
+
+
 def _save_id_preference(file_, value):
     """
     Saves whether file format identification is being used.
@@ -41,7 +55,7 @@ def _save_id_preference(file_, value):
         "%IDCommand%": value
     }
 
-    UnitVariable.objects.create(unituuid=unit.pk, variable='replacementDict', variablevalue=str(rd))
+    create_object(UnitVariable, unituuid=unit.pk, variable='replacementDict', variablevalue=str(rd))
 
 
 def write_identification_event(file_uuid, command, format=None, success=True):
@@ -84,7 +98,8 @@ def write_file_id(file_uuid, format, output):
     # Sometimes, this is null instead of an empty string
     version = format.version or ''
 
-    FileID.objects.create(
+    create_object(
+        FileID,
         file_id=file_uuid,
         format_name=format.format.description,
         format_version=version,
@@ -98,21 +113,24 @@ def _default_idcommand():
 
     We only expect to find one command enabled/active.
     """
-    return IDCommand.active.first()
+    return fpr_cache.get_default_idcommand()
 
 
-def main(job, enabled, file_path, file_uuid, disable_reidentify):
+def _check_file(job, enabled, file_path, file_uuid, disable_reidentify, command):
+    """Decide whether the file needs to be identified.
+
+    Returns the exit code of the job if it is already done, or ``None`` if
+    the IDCommand has to be run on the file.
+    """
     enabled = True if enabled == "True" else False
     if not enabled:
         job.print_output("Skipping file format identification")
         return 0
 
-    command = _default_idcommand()
     if command is None:
         job.write_error("Unable to determine IDCommand.\n")
         return 255
 
-    command_uuid = command.uuid
     job.print_output("IDCommand:", command.description)
     job.print_output("IDCommand UUID:", command.uuid)
     job.print_output("IDTool:", command.tool.description)
@@ -130,12 +148,13 @@ def main(job, enabled, file_path, file_uuid, disable_reidentify):
     # chain.
     _save_id_preference(file_, enabled)
 
-    exitcode, output, _ = executeOrRun(command.script_type, command.script, arguments=[file_path], printing=False,
-                                       capture_output=True)
+
+def _record_output(job, command, file_path, file_uuid, exitcode, output):
+    """Look up the format matching the output of the IDCommand and save it."""
     output = output.strip()
 
     if exitcode != 0:
-        job.print_error('Error: IDCommand with UUID {} exited non-zero.'.format(command_uuid))
+        job.print_error('Error: IDCommand with UUID {} exited non-zero.'.format(command.uuid))
         return 255
 
     job.print_output('Command output:', output)
@@ -143,9 +162,9 @@ def main(job, enabled, file_path, file_uuid, disable_reidentify):
     # go straight to the FormatVersion table to see if there's a matching PUID
     try:
         if command.config == 'PUID':
-            version = FormatVersion.active.get(pronom_id=output)
+            version = fpr_cache.get_format_version_by_puid(output)
         else:
-            rule = IDRule.active.get(command_output=output, command=command)
+            rule = fpr_cache.get_idrule(command, output)
             version = rule.format
     except IDRule.DoesNotExist:
         job.print_error('Error: No FPR identification rule for tool output "{}" found'.format(output))
@@ -160,10 +179,12 @@ def main(job, enabled, file_path, file_uuid, disable_reidentify):
         write_identification_event(file_uuid, command, success=False)
         return 255
 
-    (ffv, created) = FileFormatVersion.objects.get_or_create(file_uuid=file_, defaults={'format_version': version})
-    if not created:  # Update the version if it wasn't created new
-        ffv.format_version = version
-        ffv.save()
+    try:
+        ffv_pk = FileFormatVersion.objects.values_list('pk', flat=True).get(file_uuid_id=file_uuid)
+    except FileFormatVersion.DoesNotExist:
+        create_object(FileFormatVersion, file_uuid_id=file_uuid, format_version=version)
+    else:  # Update the version if it wasn't created new
+        update_object(FileFormatVersion, ffv_pk, format_version=version)
     job.print_output("{} identified as a {}".format(file_path, version.description))
 
     write_identification_event(file_uuid, command, format=version.pronom_id)
@@ -172,6 +193,73 @@ def main(job, enabled, file_path, file_uuid, disable_reidentify):
     return 0
 
 
+def main(job, enabled, file_path, file_uuid, disable_reidentify):
+    command = _default_idcommand()
+    status = _check_file(job, enabled, file_path, file_uuid, disable_reidentify, command)
+    if status is not None:
+        return status
+
+    exitcode, output, _ = executeOrRun(command.script_type, command.script, arguments=[file_path], printing=False,
+                                       capture_output=True)
+    return _record_output(job, command, file_path, file_uuid, exitcode, output)
+
+
+def _parse_batch_output(output):
+    """Parse the JSON object printed by a batch IDCommand.
+
+    Returns ``None`` if the output is not a JSON object.
+    """
+    try:
+        results = json.loads(output)
+    except ValueError:
+        return None
+    if not isinstance(results, dict):
+        return None
+    return results
+
+
+def main_batch(jobs_and_args, command):
+    """Identify the files of a whole batch with a single run of ``command``.
+
+    Batch IDCommands receive the paths of every file as arguments and print a
+    JSON object mapping each path to what the command prints for that file
+    in single file mode, or to null if the file could not be identified.
+    This saves starting the tool (and loading its signatures) for every file.
+    """
+    pending = []
+    for job, args in jobs_and_args:
+        with job.JobContext():
+            status = _check_file(job, args.idcommand, args.file_path, args.file_uuid,
+                                 args.disable_reidentify, command)
+            if status is None:
+                pending.append((job, args))
+            else:
+                job.set_status(status)
+
+    if not pending:
+        return
+
+    exitcode, output, _ = executeOrRun(command.script_type, command.script,
+                                       arguments=[args.file_path for _, args in pending],
+                                       printing=False, capture_output=True)
+    results = _parse_batch_output(output) if exitcode == 0 else None
+
+    for job, args in pending:
+        with job.JobContext():
+            if exitcode != 0:
+                job.set_status(_record_output(job, command, args.file_path, args.file_uuid, exitcode, output))
+            elif results is None:
+                job.print_error('Error: Unable to parse the output of IDCommand with UUID {}.'.format(command.uuid))
+                job.set_status(255)
+            elif results.get(args.file_path) is None:
+                job.print_error('Error: IDCommand with UUID {} did not identify {}.'.format(
+                    command.uuid, args.file_path))
+                job.set_status(255)
+            else:
+                job.set_status(_record_output(job, command, args.file_path, args.file_uuid,
+                                              0, results[args.file_path]))
+
+
 def call(jobs):
     parser = argparse.ArgumentParser(description='Identify file formats.')
 
@@ -185,7 +273,16 @@ def call(jobs):
     parser.add_argument('file_uuid', type=str, help='%fileUUID%')
     parser.add_argument('--disable-reidentify', action='store_true', help='Disable identification if it has already happened for this file.')
 
-    with transaction.atomic():
+    with transaction.atomic(), buffered_writes():
+        command = _default_idcommand()
+        if command is not None and command.batch:
+            jobs_and_args = []
+            for job in jobs:
+                with job.JobContext():
+                    jobs_and_args.append((job, parser.parse_args(job.args[1:])))
+            main_batch(jobs_and_args, command)
+            return
+
         for job in jobs:
             with job.JobContext():
                 args = parser.parse_args(job.args[1:])
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Cache of parsed METS documents.
+
+The client scripts processing the files of an Archivematica AIP transfer
+(re-ingest) look up every file in the original METS document of the AIP.
+Parsing that document again for each file of a batch is very slow with
+large AIPs, so the parsed documents are kept, along with indexes of their
+files, as long as the METS file on disk doesn't change (same path, mtime
+and size). At most ``MAX_DOCUMENTS`` documents are kept in memory.
+
+Cached documents are shared by every caller: treat them as read-only.
+"""
+from __future__ import absolute_import
+
+import collections
+import os
+import threading
+
+import metsrw
+
+# Number of parsed METS documents kept in memory. Batches are processed one
+# unit at a time, so this only needs to cover the units being processed
+# concurrently.
+MAX_DOCUMENTS = 2
+
+
+class ParsedMETS(object):
+    """A METS document with its files indexed by UUID and path."""
+
+    def __init__(self, path):
+        self.path = path
+        self.document = metsrw.METSDocument.fromfile(path)
+        self.files_by_uuid = {}
+        self.files_by_path = {}
+        for entry in self.document.all_files():
+            # The first entry wins, like in ``METSDocument.get_file``.
+            if entry.file_uuid is not None:
+                self.files_by_uuid.setdefault(entry.file_uuid, entry)
+            if entry.path is not None:
+                self.files_by_path.setdefault(entry.path, entry)
+        self.premis_objects = {}
+
+    def get_file_by_uuid(self, file_uuid):
+        """Return the ``FSEntry`` of the file with UUID ``file_uuid``, or
+        ``None``."""
+        return self.files_by_uuid.get(file_uuid)
+
+    def get_file_by_path(self, path):
+        """Return the ``FSEntry`` of the file at ``path``, relative to the
+        unit directory, or ``None``."""
+        return self.files_by_path.get(path)
+
+    def get_premis_object(self, file_uuid):
+        """Return the first PREMIS object of the file with UUID
+        ``file_uuid``, or ``None``.
+
+        The PREMIS objects are parsed from the amdSec of the file the first
+        time they are requested.
+        """
+        try:
+            return self.premis_objects[file_uuid]
+        except KeyError:
+            pass
+        entry = self.get_file_by_uuid(file_uuid)
+        premis_objects = entry.get_premis_objects() if entry else []
+        premis_object = premis_objects[0] if premis_objects else None
+        self.premis_objects[file_uuid] = premis_object
+        return premis_object
+
+
+class METSCache(object):
+    def __init__(self, max_documents=MAX_DOCUMENTS):
+        self.max_documents = max_documents
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.documents = collections.OrderedDict()
+
+    def get(self, path):
+        """Return the ``ParsedMETS`` of the METS file at ``path``, parsing it
+        unless the file is unchanged since it was last parsed."""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+        with self.lock:
+            try:
+                parsed = self.documents.pop(key)
+            except KeyError:
+                parsed = ParsedMETS(path)
+            # Keep the most recently used documents at the end.
+            self.documents[key] = parsed
+            while len(self.documents) > self.max_documents:
+                self.documents.popitem(last=False)
+            return parsed
+
+
+_cache = METSCache()
+
+
+def clear():
+    """Drop every cached document."""
+    _cache.clear()
+
+
+def get(path):
+    """Return the ``ParsedMETS`` of the METS file at ``path``."""
+    return _cache.get(path)
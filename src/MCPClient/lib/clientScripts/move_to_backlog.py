@@ -17,20 +17,9 @@ class StorageServiceCreateFileError(Exception):
     pass
 
 
-def _create_file(transfer_uuid, current_location, relative_transfer_path,
-                 backlog, backlog_path, size):
-    try:
-        new_file = storage_service.create_file(
-            uuid=transfer_uuid,
-            origin_location=current_location['resource_uri'],
-            origin_path=relative_transfer_path,
-            current_location=backlog['resource_uri'],
-            current_path=backlog_path,
-            package_type='transfer',  # TODO use constant from storage service
-            size=size,
-        )
-    except storage_service.Error as err:
-        raise StorageServiceCreateFileError(err)
+def _check_new_file(new_file, error):
+    if error is not None:
+        raise StorageServiceCreateFileError(error)
     if new_file is None:
         raise StorageServiceCreateFileError(
             'Value returned by Storage Service is unexpected')
@@ -40,7 +29,9 @@ def _create_file(transfer_uuid, current_location, relative_transfer_path,
     return new_file
 
 
-def main(job, transfer_uuid, transfer_path):
+def get_transfer_package(transfer_uuid, transfer_path):
+    """Returns the arguments of ``storage_service.create_file`` moving the
+    transfer to the backlog."""
     current_location = storage_service.get_location(purpose="CP")[0]
     backlog = storage_service.get_location(purpose="BL")[0]
 
@@ -60,10 +51,20 @@ def main(job, transfer_uuid, transfer_path):
     transfer_name = os.path.basename(transfer_path.rstrip('/'))
     backlog_path = os.path.join('originals', transfer_name)
 
+    return {
+        'uuid': transfer_uuid,
+        'origin_location': current_location['resource_uri'],
+        'origin_path': relative_transfer_path,
+        'current_location': backlog['resource_uri'],
+        'current_path': backlog_path,
+        'package_type': 'transfer',  # TODO use constant from storage service
+        'size': size,
+    }
+
+
+def finish_moving_to_backlog(job, transfer_path, new_file, error):
     try:
-        new_file = _create_file(
-            transfer_uuid, current_location, relative_transfer_path,
-            backlog, backlog_path, size)
+        _check_new_file(new_file, error)
     except StorageServiceCreateFileError as err:
         errmsg = 'Moving to backlog failed: {}.'.format(err)
         logging.warning(errmsg)
@@ -81,8 +82,21 @@ def main(job, transfer_uuid, transfer_path):
 
 def call(jobs):
     with transaction.atomic():
+        # The transfers of the batch are registered with the storage service
+        # together, so that their async requests are awaited together.
+        transfers = []
         for job in jobs:
             with job.JobContext():
                 transfer_uuid = job.args[1]
                 transfer_path = job.args[2]
-                job.set_status(main(job, transfer_uuid, transfer_path))
+                transfers.append((job, transfer_path, get_transfer_package(
+                    transfer_uuid, transfer_path)))
+
+        try:
+            results = storage_service.create_files([package for _, _, package in transfers])
+        except Exception as err:
+            results = [(None, err)] * len(transfers)
+
+        for (job, transfer_path, _), (new_file, error) in zip(transfers, results):
+            with job.JobContext():
+                job.set_status(finish_moving_to_backlog(job, transfer_path, new_file, error))
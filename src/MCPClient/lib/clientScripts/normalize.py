@@ -1,10 +1,17 @@
 #!/usr/bin/env python2
 
 import argparse
+from contextlib import contextmanager
 import csv
 import errno
+import fcntl
+import multiprocessing
 import os
+import random
+import re
 import shutil
+import tempfile
+import time
 import traceback
 import uuid
 
@@ -17,22 +24,125 @@ django.setup()
 # dashboard
 from fpr.models import FPRule
 from main.models import Derivation, FileFormatVersion, File, FileID
-from django.db import transaction
+from django.db import OperationalError, transaction
 
 # archivematicaCommon
+from custom_handlers import get_script_logger
 import databaseFunctions
 import fileOperations
+import fpr_cache
 from dicts import ReplacementDict
 
 from django.conf import settings as mcpclient_settings
 from .lib import setup_dicts
 
+logger = get_script_logger("archivematica.mcp.client.normalize")
+
 
 # Return codes
 SUCCESS = 0
 RULE_FAILED = 1
 NO_RULE_FOUND = 2
 
+# Number of attempts at writing the results of a normalization, see
+# ``write_atomically``.
+DB_WRITE_ATTEMPTS = 5
+
+# Seconds between checks for a free slot of a limited tool, see ``tool_slot``.
+TOOL_SLOT_POLL_INTERVAL = 1
+
+
+def concurrent_instances():
+    return multiprocessing.cpu_count()
+
+
+def write_atomically(callback):
+    """Run the database writes of ``callback`` in a transaction of their own.
+
+    Normalization runs in several processes at once, so MySQL may abort one of
+    the transactions with a deadlock or a lock wait timeout. The transaction
+    is retried in that case.
+    """
+    for attempt in range(1, DB_WRITE_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                return callback()
+        except OperationalError:
+            if attempt == DB_WRITE_ATTEMPTS:
+                raise
+            time.sleep(random.uniform(0, attempt))
+
+
+def parse_tool_limits(value):
+    """Parse the ``NORMALIZE_TOOL_LIMITS`` setting, e.g. ``ffmpeg:1, inkscape:2``,
+    into a dict of limits keyed by lowercased tool description. Invalid
+    entries are ignored with a warning."""
+    limits = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        tool, _, limit = item.rpartition(':')
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not tool.strip() or limit < 1:
+            logger.warning('Ignoring invalid NORMALIZE_TOOL_LIMITS entry: %r', item.strip())
+            continue
+        limits[tool.strip().lower()] = limit
+    return limits
+
+
+def _acquire_slot(lock_dir, name, limit):
+    """Lock one of the ``limit`` slot files of ``name`` without blocking and
+    return it, or return ``None`` if they are all taken."""
+    for slot in range(limit):
+        lock_file = open(os.path.join(lock_dir, '{}.{}.lock'.format(name, slot)), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            lock_file.close()
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+        else:
+            return lock_file
+
+
+@contextmanager
+def tool_slot(job, fpcommand):
+    """Wait until the tool of ``fpcommand`` is allowed to run.
+
+    The tools listed in ``NORMALIZE_TOOL_LIMITS`` can only have that many
+    commands running at once across every normalize process of this host. Each
+    running command holds an exclusive lock on one of the slot files of its
+    tool; the locks are released by the kernel if the process dies.
+    """
+    tool = fpcommand.tool.description if fpcommand.tool_id else ''
+    limit = parse_tool_limits(mcpclient_settings.NORMALIZE_TOOL_LIMITS).get(tool.lower())
+    if not limit:
+        yield
+        return
+
+    lock_dir = os.path.join(tempfile.gettempdir(), 'archivematica-normalize')
+    try:
+        os.makedirs(lock_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    name = re.sub(r'[^a-z0-9]+', '-', tool.lower())
+
+    lock_file = _acquire_slot(lock_dir, name, limit)
+    if lock_file is None:
+        job.print_output('Waiting for one of the', limit, 'slots of', tool)
+    while lock_file is None:
+        time.sleep(TOOL_SLOT_POLL_INTERVAL)
+        lock_file = _acquire_slot(lock_dir, name, limit)
+    try:
+        yield
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
 
 def get_replacement_dict(job, opts):
     """ Generates values for all knows %var% replacement variables. """
@@ -197,66 +307,72 @@ def once_normalized(job, command, opts, replacement_dict):
     for ef in transcoded_files:
         if "thumbnails" in opts.purpose:
             continue
+        write_atomically(lambda: save_derivative(
+            command, opts, ef, derivation_event_uuid, event_detail_output))
+
+
+def save_derivative(command, opts, ef, derivation_event_uuid, event_detail_output):
+    """ Add the normalized file ``ef`` to the SIP, with its derivation and
+    format information. """
+    today = timezone.now()
+    output_file_uuid = opts.task_uuid  # Match the UUID on disk
+    # TODO Add manual normalization for files of same name mapping?
+    # Add the new file to the SIP
+    path_relative_to_sip = ef.replace(opts.sip_path, "%SIPDirectory%", 1)
+    fileOperations.addFileToSIP(
+        path_relative_to_sip,
+        output_file_uuid,  # File UUID
+        opts.sip_uuid,  # SIP UUID
+        opts.task_uuid,  # Task UUID
+        today,  # Current date
+        sourceType="creation",
+        use=opts.purpose,
+    )
 
-        today = timezone.now()
-        output_file_uuid = opts.task_uuid  # Match the UUID on disk
-        # TODO Add manual normalization for files of same name mapping?
-        # Add the new file to the SIP
-        path_relative_to_sip = ef.replace(opts.sip_path, "%SIPDirectory%", 1)
-        fileOperations.addFileToSIP(
-            path_relative_to_sip,
-            output_file_uuid,  # File UUID
-            opts.sip_uuid,  # SIP UUID
-            opts.task_uuid,  # Task UUID
-            today,  # Current date
-            sourceType="creation",
-            use=opts.purpose,
-        )
+    # Calculate new file checksum
+    fileOperations.updateSizeAndChecksum(
+        output_file_uuid,  # File UUID, same as task UUID for preservation
+        ef,  # File path
+        today,  # Date
+        str(uuid.uuid4()),  # Event UUID, new UUID
+    )
 
-        # Calculate new file checksum
-        fileOperations.updateSizeAndChecksum(
-            output_file_uuid,  # File UUID, same as task UUID for preservation
-            ef,  # File path
-            today,  # Date
-            str(uuid.uuid4()),  # Event UUID, new UUID
+    # Add derivation link and associated event
+    #
+    # Track both events and insert into Derivations table for
+    # preservation copies
+    if "preservation" in opts.purpose:
+        insert_derivation_event(
+            original_uuid=opts.file_uuid,
+            output_uuid=output_file_uuid,
+            derivation_uuid=derivation_event_uuid,
+            event_detail_output=event_detail_output,
+            outcome_detail_note=path_relative_to_sip,
+            today=today,
         )
-
-        # Add derivation link and associated event
-        #
-        # Track both events and insert into Derivations table for
-        # preservation copies
-        if "preservation" in opts.purpose:
-            insert_derivation_event(
-                original_uuid=opts.file_uuid,
-                output_uuid=output_file_uuid,
-                derivation_uuid=derivation_event_uuid,
-                event_detail_output=event_detail_output,
-                outcome_detail_note=path_relative_to_sip,
-                today=today,
-            )
-        # Other derivatives go into the Derivations table, but
-        # don't get added to the PREMIS Events because they will
-        # not appear in the METS.
-        else:
-            d = Derivation(
-                source_file_id=opts.file_uuid,
-                derived_file_id=output_file_uuid,
-                event=None
-            )
-            d.save()
-
-        # Use the format info from the normalization command
-        # to save identification into the DB
-        ffv = FileFormatVersion(
-            file_uuid_id=output_file_uuid,
-            format_version=command.fpcommand.output_format
+    # Other derivatives go into the Derivations table, but
+    # don't get added to the PREMIS Events because they will
+    # not appear in the METS.
+    else:
+        d = Derivation(
+            source_file_id=opts.file_uuid,
+            derived_file_id=output_file_uuid,
+            event=None
         )
-        ffv.save()
+        d.save()
 
-        FileID.objects.create(
-            file_id=output_file_uuid,
-            format_name=command.fpcommand.output_format.format.description
-        )
+    # Use the format info from the normalization command
+    # to save identification into the DB
+    ffv = FileFormatVersion(
+        file_uuid_id=output_file_uuid,
+        format_version=command.fpcommand.output_format
+    )
+    ffv.save()
+
+    FileID.objects.create(
+        file_id=output_file_uuid,
+        format_name=command.fpcommand.output_format.format.description
+    )
 
 
 def once_normalized_callback(job):
@@ -291,7 +407,7 @@ def insert_derivation_event(original_uuid, output_uuid, derivation_uuid,
 
 
 def get_default_rule(purpose):
-    return FPRule.active.get(purpose='default_' + purpose)
+    return fpr_cache.get_fprule('default_' + purpose)
 
 
 def main(job, opts):
@@ -321,17 +437,20 @@ def main(job, opts):
 
     # For re-ingest: clean up old derivations
     # If the file already has a Derivation with the same purpose, remove it and mark the derived file as deleted
-    derivatives = Derivation.objects.filter(source_file=file_, derived_file__filegrpuse=opts.purpose)
-    for derivative in derivatives:
-        job.print_output(opts.purpose, 'derivative', derivative.derived_file_id, 'already exists, marking as deleted')
-        File.objects.filter(uuid=derivative.derived_file_id).update(filegrpuse='deleted')
-        # Don't create events for thumbnail files
-        if opts.purpose != 'thumbnail':
-            databaseFunctions.insertIntoEvents(
-                fileUUID=derivative.derived_file_id,
-                eventType='deletion',
-            )
-    derivatives.delete()
+    def delete_derivatives():
+        derivatives = Derivation.objects.filter(source_file=file_, derived_file__filegrpuse=opts.purpose)
+        for derivative in derivatives:
+            job.print_output(opts.purpose, 'derivative', derivative.derived_file_id, 'already exists, marking as deleted')
+            File.objects.filter(uuid=derivative.derived_file_id).update(filegrpuse='deleted')
+            # Don't create events for thumbnail files
+            if opts.purpose != 'thumbnail':
+                databaseFunctions.insertIntoEvents(
+                    fileUUID=derivative.derived_file_id,
+                    eventType='deletion',
+                )
+        derivatives.delete()
+
+    write_atomically(delete_derivatives)
 
     # If a file has been manually normalized for this purpose, skip it
     manually_normalized_file = check_manual_normalization(job, opts)
@@ -339,13 +458,13 @@ def main(job, opts):
         job.print_output(os.path.basename(opts.file_path), 'was already manually normalized into', manually_normalized_file.currentlocation)
         if 'preservation' in opts.purpose:
             # Add derivation link and associated event
-            insert_derivation_event(
+            write_atomically(lambda: insert_derivation_event(
                 original_uuid=opts.file_uuid,
                 output_uuid=manually_normalized_file.uuid,
                 derivation_uuid=str(uuid.uuid4()),
                 event_detail_output="manual normalization",
                 outcome_detail_note=None,
-            )
+            ))
         return SUCCESS
 
     do_fallback = False
@@ -358,8 +477,7 @@ def main(job, opts):
     if format_id:
         job.print_output('File format:', format_id.format_version)
         try:
-            rule = FPRule.active.get(format=format_id.format_version,
-                                     purpose=opts.purpose)
+            rule = fpr_cache.get_fprule(opts.purpose, format_id.format_version_id)
         except FPRule.DoesNotExist:
             if opts.purpose == 'thumbnail' and opts.thumbnail_mode == 'generate_non_default':
                 job.pyprint('Thumbnail not generated as no rule found for format')
@@ -384,7 +502,8 @@ def main(job, opts):
 
     replacement_dict = get_replacement_dict(job, opts)
     cl = transcoder.CommandLinker(job, rule, command, replacement_dict, opts, once_normalized_callback(job))
-    exitstatus = cl.execute()
+    with tool_slot(job, command):
+        exitstatus = cl.execute()
 
     # If the access/thumbnail normalization command has errored AND a
     # derivative was NOT created, then we run the default access/thumbnail
@@ -415,7 +534,8 @@ def main(job, opts):
 
             # Use existing replacement dict
             cl = transcoder.CommandLinker(job, fallback_rule, command, replacement_dict, opts, once_normalized_callback(job))
-            exitstatus = cl.execute()
+            with tool_slot(job, command):
+                exitstatus = cl.execute()
 
     # Store thumbnails locally for use during AIP searches
     # TODO is this still needed, with the storage service?
@@ -462,18 +582,20 @@ def call(jobs):
     parser.add_argument('normalize_file_grp_use', type=str, help='"service", "original", "submissionDocumentation", etc')
     parser.add_argument('--thumbnail_mode', type=str, default='generate', help='"generate", "generate_non_default", "do_not_generate"')
 
-    with transaction.atomic():
-        for job in jobs:
-            with job.JobContext():
-                opts = parser.parse_args(job.args[1:])
-
-                if opts.purpose == 'thumbnail' and opts.thumbnail_mode == 'do_not_generate':
-                    job.pyprint('Thumbnail generation has been disabled')
-                    job.set_status(SUCCESS)
-                    continue
-
-                try:
-                    job.set_status(main(job, opts))
-                except Exception as e:
-                    job.print_error(str(e))
-                    job.set_status(1)
+    # The jobs don't share a transaction: normalization commands can run for
+    # a long time and other normalize processes write to the same tables.
+    # The writes of each step are atomic instead, see ``write_atomically``.
+    for job in jobs:
+        with job.JobContext():
+            opts = parser.parse_args(job.args[1:])
+
+            if opts.purpose == 'thumbnail' and opts.thumbnail_mode == 'do_not_generate':
+                job.pyprint('Thumbnail generation has been disabled')
+                job.set_status(SUCCESS)
+                continue
+
+            try:
+                job.set_status(main(job, opts))
+            except Exception as e:
+                job.print_error(str(e))
+                job.set_status(1)
@@ -19,11 +19,12 @@ import django
 django.setup()
 from django.conf import settings as mcpclient_settings
 from django.db import transaction
-from fpr.models import FPRule, FormatVersion
+from fpr.models import FormatVersion
 from main.models import Derivation, File, SIP, Transfer
 
 from executeOrRunSubProcess import executeOrRun
 import databaseFunctions
+import fpr_cache
 from dicts import replace_string_values
 from lib import setup_dicts
 
@@ -207,11 +208,10 @@ class PolicyChecker(object):
         except FormatVersion.DoesNotExist:
             rules = fmt = None
         if fmt:
-            rules = FPRule.active.filter(format=fmt.uuid, purpose=self.purpose)
+            rules = fpr_cache.get_fprules(self.purpose, fmt.uuid)
         # Check for default rules.
         if not rules:
-            rules = FPRule.active.filter(
-                purpose='default_{}'.format(self.purpose))
+            rules = fpr_cache.get_fprules('default_{}'.format(self.purpose))
         return rules
 
     def _execute_rule_command(self, rule):
@@ -48,26 +48,9 @@ class StorageServiceCreateFileError(Exception):
     pass
 
 
-def _create_file(uuid, current_location, relative_aip_path,
-                 aip_destination_uri, current_path, package_type, aip_subtype,
-                 size, sip_type, related_package_uuid):
-    try:
-        new_file = storage_service.create_file(
-            uuid=uuid,
-            origin_location=current_location['resource_uri'],
-            origin_path=relative_aip_path,
-            current_location=aip_destination_uri,
-            current_path=current_path,
-            package_type=package_type,
-            aip_subtype=aip_subtype,
-            size=size,
-            update='REIN' in sip_type,
-            related_package_uuid=related_package_uuid,
-            events=get_events_from_db(uuid),
-            agents=get_agents_from_db(uuid)
-        )
-    except storage_service.Error as err:
-        raise StorageServiceCreateFileError(err)
+def _check_new_file(new_file, error):
+    if error is not None:
+        raise StorageServiceCreateFileError(error)
     if new_file is None:
         raise StorageServiceCreateFileError(
             'Value returned by Storage Service is unexpected')
@@ -106,8 +89,9 @@ def rmtree_upload_dip_transitory_loc(package_type, unit_path):
         logger.error("Directory removal failed with: %s", e)
 
 
-def store_aip(job, aip_destination_uri, aip_path, sip_uuid, sip_name, sip_type):
-    """ Stores an AIP with the storage service.
+def get_aip_package(job, aip_destination_uri, aip_path, sip_uuid, sip_name,
+                    sip_type):
+    """ Returns what's needed to store an AIP with the storage service.
 
     aip_destination_uri = storage service destination URI, should be of purpose
         AIP Store (AS)
@@ -116,6 +100,10 @@ def store_aip(job, aip_destination_uri, aip_path, sip_uuid, sip_name, sip_type):
     sip_uuid = UUID of the SIP, which will become the UUID of the AIP
     sip_name = SIP name.  Not used directly, but part of the AIP name
 
+    Returns a dict with the ``package`` (the arguments of
+    ``storage_service.create_file``), the ``aip_path``, ``package_type`` and
+    ``sip_type``, used by ``finish_storing_aip``.
+
     Example inputs:
     storeAIP.py
         "/api/v1/location/9c2b5bb7-abd6-477b-88e0-57107219dace/"
@@ -204,12 +192,32 @@ def store_aip(job, aip_destination_uri, aip_path, sip_uuid, sip_name, sip_type):
     else:
         aip_subtype = dc.type
 
-    # Store the AIP
+    return {
+        'package': {
+            'uuid': uuid,
+            'origin_location': current_location['resource_uri'],
+            'origin_path': relative_aip_path,
+            'current_location': aip_destination_uri,
+            'current_path': current_path,
+            'package_type': package_type,
+            'aip_subtype': aip_subtype,
+            'size': size,
+            'update': 'REIN' in sip_type,
+            'related_package_uuid': related_package_uuid,
+            'events': get_events_from_db(uuid),
+            'agents': get_agents_from_db(uuid),
+        },
+        'aip_path': aip_path,
+        'package_type': package_type,
+        'sip_type': sip_type,
+    }
+
+
+def finish_storing_aip(job, aip, new_file, error):
+    """Reports the result of storing ``aip``, returned by ``get_aip_package``."""
+    sip_type = aip['sip_type']
     try:
-        new_file = _create_file(
-            uuid, current_location, relative_aip_path, aip_destination_uri,
-            current_path, package_type, aip_subtype, size, sip_type,
-            related_package_uuid)
+        _check_new_file(new_file, error)
     except StorageServiceCreateFileError as err:
         errmsg = '{} creation failed: {}.'.format(sip_type, err)
         logger.warning(errmsg)
@@ -223,7 +231,7 @@ def store_aip(job, aip_destination_uri, aip_path, sip_uuid, sip_name, sip_type):
     # Once the DIP is stored, remove it from the uploadDIP watched directory as
     # it will no longer need to be referenced from there by the user or the
     # system.
-    rmtree_upload_dip_transitory_loc(package_type, aip_path)
+    rmtree_upload_dip_transitory_loc(aip['package_type'], aip['aip_path'])
     return 0
 
     # FIXME this should be moved to the storage service and areas that rely
@@ -305,9 +313,21 @@ def call(jobs):
     parser.add_argument('sip_type', type=str, help='%SIPType%')
 
     with transaction.atomic():
+        # The packages of the batch are registered with the storage service
+        # together, so that their async requests are awaited together.
+        aips = []
         for job in jobs:
             with job.JobContext(logger=logger):
                 args = parser.parse_args(job.args[1:])
-                job.set_status(store_aip(
+                aips.append((job, get_aip_package(
                     job, args.aip_destination_uri, args.aip_filename,
-                    args.sip_uuid, args.sip_name, args.sip_type))
+                    args.sip_uuid, args.sip_name, args.sip_type)))
+
+        try:
+            results = storage_service.create_files([aip['package'] for _, aip in aips])
+        except Exception as err:
+            results = [(None, err)] * len(aips)
+
+        for (job, aip), (new_file, error) in zip(aips, results):
+            with job.JobContext(logger=logger):
+                job.set_status(finish_storing_aip(job, aip, new_file, error))
@@ -32,7 +32,7 @@ django.setup()
 from django.db import transaction
 
 # archivematicaCommon
-from archivematicaFunctions import get_file_checksum
+import file_checksums
 from fileOperations import getFileUUIDLike
 import databaseFunctions
 
@@ -72,7 +72,9 @@ def call(jobs):
                             exitCode += 1
                             continue
 
-                        objectMD5 = get_file_checksum(filePath, 'md5')
+                        # This is a fixity check: the file is read again,
+                        # stored digests are not reused.
+                        objectMD5 = file_checksums.compute_checksums(filePath, ['md5'])['md5']
 
                         if objectMD5 == xmlMD5:
                             job.pyprint('File OK: ', xmlMD5, filePath.replace(transferPath, '%TransferDirectory%'))
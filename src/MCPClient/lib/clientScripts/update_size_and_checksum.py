@@ -29,12 +29,15 @@ django.setup()
 
 from main.models import File, FileFormatVersion
 
+from archivematicaFunctions import get_setting
 from custom_handlers import get_script_logger
-from databaseFunctions import insertIntoDerivations
+from databaseFunctions import buffered_writes, create_object, insertIntoDerivations
+import file_checksums
 from fileOperations import updateSizeAndChecksum
 
 import metsrw
 
+import mets_cache
 import parse_mets_to_db
 
 logger = get_script_logger('archivematica.mcp.client.updateSizeAndChecksum')
@@ -68,19 +71,17 @@ def get_file_info_from_mets(job, shared_path, file_):
                     transfer_location)
         return {}
     logger.info('Archivematica AIP: reading METS file %s.', mets_file)
-    mets = metsrw.METSDocument.fromfile(mets_file)
-    fsentry = mets.get_file(file_uuid=file_.uuid)
+    mets = mets_cache.get(mets_file)
+    fsentry = mets.get_file_by_uuid(file_.uuid)
     if not fsentry:
         logger.error('Archivematica AIP: FSEntry with UUID %s not found', file_.uuid)
         return {}
 
     # Get the UUID of a preservation derivative, if one exists
-    try:
-        premis_object = fsentry.get_premis_objects()[0]
-    except IndexError:
+    premis_object = mets.get_premis_object(file_.uuid)
+    if premis_object is None:
         logger.error('Archivematica AIP: PREMIS:OBJECT could not be found')
         return {}
-    premis_object = fsentry.get_premis_objects()[0]
     related_object_uuid = None
     for relationship in premis_object.relationship:
         if relationship.sub_type != 'is source of':
@@ -90,7 +91,7 @@ def get_file_info_from_mets(job, shared_path, file_):
         if (not event) or (event.type != 'normalization'):
             continue
         rel_obj_uuid = relationship.related_object_identifier_value
-        related_object_fsentry = mets.get_file(file_uuid=rel_obj_uuid)
+        related_object_fsentry = mets.get_file_by_uuid(rel_obj_uuid)
         if getattr(related_object_fsentry, 'use', None) != 'preservation':
             continue
         related_object_uuid = rel_obj_uuid
@@ -113,6 +114,29 @@ def get_file_info_from_mets(job, shared_path, file_):
     return ret
 
 
+def compute_checksums(jobs_args):
+    """Compute the checksums of the files of the batch in parallel, before
+    they are processed one by one by ``main``, which reuses them.
+
+    The checksums of the files of Archivematica AIP transfers are not
+    computed, since they are read from the METS document.
+    """
+    reingested = set(File.objects.filter(
+        uuid__in=[args.file_uuid for _, args in jobs_args],
+        sip__isnull=True,
+        transfer__type='Archivematica AIP',
+    ).values_list('uuid', flat=True))
+    files = [
+        (args.file_uuid, args.file_path) for _, args in jobs_args
+        if args.file_uuid not in reingested and os.path.isfile(args.file_path)
+    ]
+    try:
+        file_checksums.get_checksums(files, [get_setting('checksum_type', 'sha256')])
+    except (IOError, OSError):
+        # Each file will be read again, and its error reported, by ``main``.
+        logger.exception('Unable to compute the checksums of the batch.')
+
+
 def main(job, shared_path, file_uuid, file_path, date, event_uuid):
     try:
         file_ = File.objects.get(uuid=file_uuid)
@@ -138,7 +162,8 @@ def main(job, shared_path, file_uuid, file_path, date, event_uuid):
                 derivedFileUUID=info['derivation'],
             )
         if info.get('format_version'):
-            FileFormatVersion.objects.create(
+            create_object(
+                FileFormatVersion,
                 file_uuid_id=file_uuid,
                 format_version=info['format_version']
             )
@@ -156,13 +181,18 @@ def call(jobs):
     parser.add_argument('-d', '--date', action='store', dest='date', default='')
     parser.add_argument('-u', '--eventIdentifierUUID', type=lambda x: str(uuid.UUID(x)), dest='event_uuid')
 
-    with transaction.atomic():
+    with transaction.atomic(), buffered_writes():
+        jobs_args = []
         for job in jobs:
             with job.JobContext(logger=logger):
                 logger.info('Invoked as %s.', ' '.join(job.args))
 
-                args = parser.parse_args(job.args[1:])
+                jobs_args.append((job, parser.parse_args(job.args[1:])))
 
+        compute_checksums(jobs_args)
+
+        for job, args in jobs_args:
+            with job.JobContext(logger=logger):
                 job.set_status(main(
                     job,
                     args.sharedPath,
@@ -23,11 +23,12 @@ import sys
 import django
 from django.db import transaction
 django.setup()
-from fpr.models import FPRule, FormatVersion
+from fpr.models import FormatVersion
 from main.models import Derivation, File, SIP
 
 from custom_handlers import get_script_logger
 import databaseFunctions
+import fpr_cache
 from executeOrRunSubProcess import executeOrRun
 from dicts import replace_string_values
 
@@ -107,11 +108,10 @@ class Validator(object):
         except FormatVersion.DoesNotExist:
             rules = fmt = None
         if fmt:
-            rules = FPRule.active.filter(format=fmt.uuid, purpose=self.purpose)
+            rules = fpr_cache.get_fprules(self.purpose, fmt.uuid)
         # Check default rules.
         if not rules:
-            rules = FPRule.active.filter(
-                purpose='default_{}'.format(self.purpose))
+            rules = fpr_cache.get_fprules('default_{}'.format(self.purpose))
         return rules
 
     def _execute_rule_command(self, rule):
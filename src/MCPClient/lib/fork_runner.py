@@ -4,140 +4,303 @@
 Execute the .call(jobs) function of a clientScripts module from multiple
 processes.
 
-Takes a list of jobs to be executed and split them across a specified number of
-subprocesses.  Once the subprocesses complete, gather up the results and return
+Takes a list of jobs to be executed and distributes them across a pool of
+worker processes.  Once the workers complete, gather up the results and return
 them to the MCP Client.
 
+Each clientScripts module gets its own pool of long-lived workers, which are
+reused by the following batches: a worker sets up Django and imports the
+module once, and keeps its database connections open between batches.  Pools
+that haven't been used for `POOL_IDLE_TIMEOUT` seconds are shut down.
+
+The jobs of a batch are split into small chunks that idle workers take from a
+shared queue, so a slow job only delays the few jobs of its chunk.
+
 This is invoked when a clientScripts module provides a `concurrent_instances`
-function (indicating that it supports being run as a subprocess).
+function (indicating that it supports being run as a subprocess).  Modules
+that process the jobs of a chunk together (e.g. with one run of an external
+tool) can also provide a `min_chunk_size` function, returning the number of
+jobs below which a chunk isn't worth running.
 """
 
 
 import cPickle
 import importlib
 import logging
+import math
 import multiprocessing
 import os
+import Queue
+import subprocess
 import sys
-import tempfile
+import threading
+import time
 import traceback
 
-from databaseFunctions import auto_close_db
-from executeOrRunSubProcess import launchSubProcess
-
 logger = logging.getLogger('archivematica.mcp.client')
 
 # Using this instead of __file__ to ensure we don't get fork_runner.pyc!
 THIS_SCRIPT = 'fork_runner.py'
 
+# Number of chunks the jobs of a batch are split into for each worker.
+# Smaller chunks balance the load better, larger ones let the client scripts
+# process more jobs at once.  Client scripts can ask for larger chunks, see
+# `chunk_size`.
+CHUNKS_PER_WORKER = 4
 
-def call(module_name, jobs, task_count=multiprocessing.cpu_count()):
-    """
-    Split `jobs` into `task_count` groups and fork a subprocess to run
-    `module_name`.call() for each of them.
+# Seconds after which an unused pool of workers is shut down.
+POOL_IDLE_TIMEOUT = 600
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def chunk_size(job_count, worker_count, min_chunk_size=1):
+    """Return the number of jobs per chunk for a batch of `job_count` jobs.
+
+    Chunks hold at least `min_chunk_size` jobs, unless that would leave some
+    of the `worker_count` workers without a chunk: small batches (e.g. the
+    last ones of a unit) are still spread across all the workers.
     """
-    jobs_by_uuid = {}
-    for job in jobs:
-        jobs_by_uuid[job.UUID] = job
+    size = int(math.ceil(job_count / float(worker_count * CHUNKS_PER_WORKER)))
+    per_worker = int(math.ceil(job_count / float(worker_count)))
+    return max(size, min(min_chunk_size, per_worker), 1)
+
+
+class WorkerError(Exception):
+    """A worker process died while running jobs."""
+
+
+class Worker(object):
+    """A worker process running the `call` function of a clientScripts
+    module for the jobs sent to it."""
+
+    def __init__(self, module_name):
+        self.module_name = module_name
+        # Re-execute ourselves (fork_runner.py) as a standalone script rather
+        # than forking. This ensures that the worker runs in a clean
+        # environment (avoiding issues with things like forking while holding
+        # a connection to the database).
+        #
+        # We send pickled requests on the standard input of the worker, which
+        # writes pickled responses on its standard output.
+        self.process = subprocess.Popen(
+            [sys.executable,
+             os.path.join(os.path.dirname(os.path.abspath(__file__)), THIS_SCRIPT),
+             module_name],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+        self._send(sys.path)
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def _send(self, obj):
+        cPickle.dump(obj, self.process.stdin, cPickle.HIGHEST_PROTOCOL)
+        self.process.stdin.flush()
+
+    def run(self, jobs):
+        """Run `jobs` in the worker and return them once finished."""
+        try:
+            self._send(jobs)
+            result = cPickle.load(self.process.stdout)
+        except (EOFError, IOError, cPickle.UnpicklingError) as e:
+            self.stop()
+            raise WorkerError(
+                "Worker running '%s' died: %s" % (self.module_name, e))
+
+        if isinstance(result, dict) and result['uncaught_exception']:
+            e = result['uncaught_exception']
+            # Something went wrong with our client script.  This shouldn't
+            # happen under normal operation, but might happen during
+            # development.
+            logger.error(("Failure while executing '%s':\n" % (self.module_name)) + e['traceback'])
+            raise Exception(e['type'] + ": " + e['message'])
+        return result
+
+    def stop(self):
+        """Stop the worker. Closing its standard input makes it exit."""
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        if self.is_alive():
+            self.process.terminate()
+        self.process.wait()
+
+
+class WorkerPool(object):
+    """Pool of workers running the same clientScripts module."""
+
+    def __init__(self, module_name, size):
+        self.module_name = module_name
+        self.size = size
+        self.workers = []
+        self.last_used = time.time()
+        self._start_workers()
+
+    def _start_workers(self):
+        """Replace the dead workers and start the missing ones. Workers set
+        up Django and import the module as soon as they start."""
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        while len(self.workers) < self.size:
+            self.workers.append(Worker(self.module_name))
+
+    def run(self, jobs, finished_callback=None, min_chunk_size=1):
+        """Run `jobs` in the workers and return them once finished.
 
-    pool = multiprocessing.Pool(processes=task_count)
+        `finished_callback` is called, in this thread, with each chunk of
+        jobs as soon as it's finished.
+        """
+        self.last_used = time.time()
+        self._start_workers()
 
-    try:
-        results = []
-        for job_subset in _split_jobs(jobs, task_count):
-            results.append(pool.apply_async(_run_jobs, (module_name, job_subset)))
+        size = chunk_size(len(jobs), self.size, min_chunk_size)
+        chunks = Queue.Queue()
+        for start in range(0, len(jobs), size):
+            chunks.put(jobs[start:start + size])
+
+        # Finished chunks, and None when a worker is done.
+        finished_chunks = Queue.Queue()
+        errors = []
+
+        def feed(worker):
+            try:
+                # Stop taking chunks once a worker failed, the batch has failed.
+                while not errors:
+                    try:
+                        chunk = chunks.get_nowait()
+                    except Queue.Empty:
+                        return
+                    try:
+                        finished_chunks.put(worker.run(chunk))
+                    except Exception as e:
+                        errors.append(e)
+            finally:
+                finished_chunks.put(None)
+
+        threads = [threading.Thread(target=feed, args=(worker,))
+                   for worker in self.workers[:chunks.qsize()]]
+        for thread in threads:
+            thread.start()
 
         finished_jobs = []
-        for result in results:
-            finished_jobs += result.get()
+        running = len(threads)
+        while running:
+            chunk = finished_chunks.get()
+            if chunk is None:
+                running -= 1
+                continue
+            finished_jobs.extend(chunk)
+            if finished_callback is not None:
+                finished_callback(chunk)
 
-        for finished_job in finished_jobs:
-            job = jobs_by_uuid[finished_job.UUID]
-            job.load_from(finished_job)
-    finally:
-        pool.terminate()
+        self.last_used = time.time()
+        if errors:
+            raise errors[0]
+        return finished_jobs
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
 
 
-def _split_jobs(jobs, n):
-    "Split `jobs` into n approximately equally-sized pieces"
-    chunk_size = len(jobs) / n
-    result = []
+def _get_pool(module_name, size):
+    """Return the pool of workers of `module_name`, creating it if needed,
+    and shut down the pools that haven't been used for a while."""
+    with _pools_lock:
+        now = time.time()
+        for name, pool in _pools.items():
+            if name != module_name and now - pool.last_used > POOL_IDLE_TIMEOUT:
+                logger.info("Stopping idle workers of '%s'", name)
+                pool.stop()
+                del _pools[name]
+        pool = _pools.get(module_name)
+        if pool is None or pool.size != size:
+            if pool is not None:
+                pool.stop()
+            pool = _pools[module_name] = WorkerPool(module_name, size)
+        return pool
+
+
+def call(module_name, jobs, task_count=multiprocessing.cpu_count(), finished_callback=None,
+         min_chunk_size=1):
+    """
+    Run `module_name`.call() for `jobs` in a pool of `task_count` workers.
+
+    `finished_callback` is called with each job as soon as it's finished.
+    Workers are sent chunks of at least `min_chunk_size` jobs when there are
+    enough jobs for all of them (see `chunk_size`).
+    """
+    jobs_by_uuid = {}
+    for job in jobs:
+        jobs_by_uuid[job.UUID] = job
 
-    while jobs:
-        # Last chunk might be a little bigger
-        if len(result) == (n - 1):
-            result.append(jobs)
-            jobs = []
-        else:
-            result.append(jobs[0:chunk_size])
+    def load_finished_jobs(finished_jobs):
+        for finished_job in finished_jobs:
+            job = jobs_by_uuid[finished_job.UUID]
+            job.load_from(finished_job)
+            if finished_callback is not None:
+                finished_callback(job)
 
-        jobs = jobs[chunk_size:]
+    _get_pool(module_name, task_count).run(
+        jobs, finished_callback=load_finished_jobs, min_chunk_size=min_chunk_size)
 
-    return result
 
+def _ensure_usable_connections():
+    """Close the database connections that can't be used anymore (e.g.
+    after a database restart), so that they are opened again when needed.
+    Other connections are kept open between batches."""
+    from django.db import connections
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
 
-@auto_close_db
-def _run_jobs(module_name, jobs):
-    (fd, output_file) = tempfile.mkstemp()
 
-    try:
-        environment = {'jobs': jobs,
-                       'sys.path': sys.path,
-                       'output_file': output_file}
+def _worker(module_name, requests, responses):
+    """Run the jobs received on `requests` until it is closed, writing the
+    finished jobs on `responses`."""
+    # Django and the module are only importable with the path of the client.
+    sys.path = cPickle.load(requests)
 
-        # A bit of trickiness: Re-execute ourselves (fork_runner.py) in a
-        # subprocess as a standalone script.  This ensures that we're running in
-        # a clean environment (avoiding issues with things like forking while
-        # holding a connection to the database)
-        #
-        # We communicate with our subprocess by supplying our `environment` map
-        # on stdin.  It gives results back to us by writing them to a temporary
-        # file.
-        (status, stdout, stderr) = launchSubProcess([os.path.join(os.path.dirname(os.path.abspath(__file__)), THIS_SCRIPT),
-                                                     module_name],
-                                                    cPickle.dumps(environment),
-                                                    printing=False,
-                                                    capture_output=True)
-
-        with os.fdopen(fd) as f:
-            result = cPickle.load(f)
-
-            if isinstance(result, dict) and result['uncaught_exception']:
-                e = result['uncaught_exception']
-                # Something went wrong with our client script.  This shouldn't
-                # happen under normal operation, but might happen during
-                # development.
-                logging.error(("Failure while executing '%s':\n" % (module_name)) + e['traceback'])
-                raise Exception(e['type'] + ": " + e['message'])
-            else:
-                return result
-
-    finally:
-        os.unlink(output_file)
-
-
-# Executed in our subprocess (see note in _run_jobs above).
-if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        raise Exception("Must be called with a module name (and a list of pickled jobs on stdin)")
+    import django
+    django.setup()
+    from databaseFunctions import auto_close_db
+    module = importlib.import_module(module_name)
+    auto_close_db(_run_jobs)(module, requests, responses)
 
-    module_to_run = sys.argv[1]
-    environment = cPickle.load(sys.stdin)
 
-    sys.path = environment['sys.path']
-    jobs = environment['jobs']
-    output_file = environment['output_file']
+def _run_jobs(module, requests, responses):
+    while True:
+        try:
+            jobs = cPickle.load(requests)
+        except EOFError:
+            return
 
-    with open(output_file, 'w') as f:
+        _ensure_usable_connections()
         try:
-            module = importlib.import_module(module_to_run)
             module.call(jobs)
-            cPickle.dump(jobs, f)
+            result = jobs
         except Exception as e:
-            cPickle.dump({
+            result = {
                 'uncaught_exception': {
                     'message': e.message,
                     'type': type(e).__name__,
                     'traceback': traceback.format_exc(),
                 }
-            }, f)
+            }
+        cPickle.dump(result, responses, cPickle.HIGHEST_PROTOCOL)
+        responses.flush()
+
+
+# Executed in our worker processes (see Worker above).
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        raise Exception("Must be called with a module name (and pickled requests on stdin)")
+
+    # Keep the standard output for the responses, and send anything printed
+    # by the client scripts to the standard error instead.
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    _worker(sys.argv[1], sys.stdin, responses)
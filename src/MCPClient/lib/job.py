@@ -16,6 +16,10 @@ LOGGER = logging.getLogger('archivematica.mcp.client.job')
 
 
 class Job():
+    # Called with the job once it has run (see ``finished``).  Not pickled:
+    # it stays in the process that set it.
+    finished_callback = None
+
     def __init__(self, name, uuid, args, caller_wants_output=False):
         self.name = name
         self.UUID = uuid
@@ -25,6 +29,12 @@ class Job():
         self.status_code = 'success'
         self.output = ""
         self.error = ""
+        self.is_finished = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('finished_callback', None)
+        return state
 
     def dump(self):
         return (("#<%s; exit=%d; code=%s uuid=%s\n" +
@@ -46,6 +56,18 @@ class Job():
         self.output = other_job.output
         self.error = other_job.error
 
+    def finished(self):
+        """Report that the job has run, once its status is final.
+
+        Only the first call counts.  Client scripts that run their jobs in
+        several passes must only call it after the last one.
+        """
+        if self.is_finished:
+            return
+        self.is_finished = True
+        if self.finished_callback is not None:
+            self.finished_callback(self)
+
     def set_status(self, int_code, status_code='success'):
         if int_code:
             self.int_code = int_code
@@ -45,6 +45,7 @@ CONFIG_MAPPING = {
     'storage_service_client_timeout': {'section': 'MCPClient', 'option': 'storage_service_client_timeout', 'type': 'float'},
     'storage_service_client_quick_timeout': {'section': 'MCPClient', 'option': 'storage_service_client_quick_timeout', 'type': 'float'},
     'agentarchives_client_timeout': {'section': 'MCPClient', 'option': 'agentarchives_client_timeout', 'type': 'float'},
+    'normalize_tool_limits': {'section': 'MCPClient', 'option': 'normalize_tool_limits', 'type': 'string'},
 
     # [antivirus]
     'clamav_server': {'section': 'MCPClient', 'option': 'clamav_server', 'type': 'string'},
@@ -88,6 +89,7 @@ clamav_pass_by_stream = True
 storage_service_client_timeout = 86400
 storage_service_client_quick_timeout = 5
 agentarchives_client_timeout = 300
+normalize_tool_limits = ffmpeg:1
 clamav_client_timeout = 86400
 clamav_client_backend = clamdscanner    ; Options: clamdscanner or clamscanner
 clamav_client_max_file_size = 42        ; MB
@@ -225,6 +227,7 @@ CLAMAV_CLIENT_MAX_SCAN_SIZE = config.get('clamav_client_max_scan_size')
 STORAGE_SERVICE_CLIENT_TIMEOUT = config.get('storage_service_client_timeout')
 STORAGE_SERVICE_CLIENT_QUICK_TIMEOUT = config.get('storage_service_client_quick_timeout')
 AGENTARCHIVES_CLIENT_TIMEOUT = config.get('agentarchives_client_timeout')
+NORMALIZE_TOOL_LIMITS = config.get('normalize_tool_limits')
 SEARCH_ENABLED = config.get('search_enabled')
 INDEX_AIP_CONTINUE_ON_ERROR = config.get('index_aip_continue_on_error')
 CAPTURE_CLIENT_SCRIPT_OUTPUT = config.get('capture_client_script_output')
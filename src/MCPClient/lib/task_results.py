@@ -0,0 +1,141 @@
+"""
+Records the results of the jobs run by MCP Client in the Tasks table.
+
+Rather than waiting for the whole batch to complete, the jobs that finished
+are written every ``FLUSH_INTERVAL`` seconds while the batch runs, so that the
+dashboard shows the progress of long batches and the results of the finished
+jobs survive a failure of the rest of the batch.  After each write, the
+progress of the batch is reported (e.g. to MCP Server, as a Gearman
+WORK_STATUS update).
+
+A job is finished when fork_runner returns it, or when the client script
+calls ``Job.finished``; the results of the other jobs are written at the end
+of the batch.  No client script calls ``Job.finished`` itself yet, so only the
+batches of the scripts run through fork_runner (the ones that define
+``concurrent_instances``) are written while they run; the others are written
+at once when the whole batch returns.  Client scripts running their jobs
+inside a transaction only have their results written at the end of the batch,
+since the writes wouldn't be visible before the transaction commits anyway.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings as django_settings
+from django.db import transaction
+
+from databaseFunctions import getUTCDate, retryOnFailure
+from main.models import Task
+
+logger = logging.getLogger('archivematica.mcp.client')
+
+# Seconds between the writes of the results of the jobs finished so far.
+FLUSH_INTERVAL = 5
+
+
+def _atomic_depth():
+    """The number of nested transactions open on the database connection."""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return 0
+    return 1 + len(connection.savepoint_ids)
+
+
+def _job_state(job):
+    """What gets written for ``job``, to detect changes."""
+    return (job.get_exit_code(), len(job.get_stdout()), len(job.get_stderr()))
+
+
+class TaskResults(object):
+    """
+    The results of a batch of jobs.
+
+    :param progress_callback: called with the number of jobs recorded and the
+        total number of jobs after each write of the finished jobs.
+    """
+
+    def __init__(self, progress_callback=None):
+        self.progress_callback = progress_callback
+        self.jobs = []
+        self.lock = threading.Lock()
+        # Jobs finished since the last write, and their end times
+        self.finished = []
+        self.endtimes = {}
+        # What has been written for each job, by task UUID
+        self.recorded = {}
+        self.last_flush = time.time()
+        # Only this thread writes to the database: client scripts may run
+        # their jobs in other threads.
+        self.thread = threading.current_thread()
+        # Writes are delayed while client scripts open transactions.
+        self.atomic_depth = _atomic_depth()
+
+    def track(self, jobs):
+        """Record the results of ``jobs`` as they finish."""
+        self.jobs.extend(jobs)
+        for job in jobs:
+            job.finished_callback = self.job_finished
+
+    def job_finished(self, job):
+        with self.lock:
+            self.finished.append(job)
+            self.endtimes[job.UUID] = getUTCDate()
+        if time.time() - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Write the results of the jobs finished so far."""
+        if threading.current_thread() is not self.thread:
+            return
+        if _atomic_depth() > self.atomic_depth:
+            return
+        with self.lock:
+            finished, self.finished = self.finished, []
+            self.last_flush = time.time()
+        if not finished:
+            return
+
+        try:
+            self._record(finished)
+        except Exception:
+            logger.exception('Unable to write the results of %d tasks, will retry', len(finished))
+            with self.lock:
+                self.finished = finished + self.finished
+            return
+
+        if self.progress_callback is not None:
+            try:
+                self.progress_callback(len(self.recorded), len(self.jobs))
+            except Exception:
+                logger.exception('Unable to report the progress of the tasks')
+
+    def record_all(self):
+        """Write the results of every job, unless they were written already."""
+        with self.lock:
+            self.finished = []
+        retryOnFailure("Write task results", lambda: self._record(self.jobs))
+
+    def recorded_exit_codes(self):
+        """The exit codes written so far, by task UUID."""
+        return {task_uuid: state[0] for task_uuid, state in self.recorded.items()}
+
+    def _record(self, jobs):
+        updates = []
+        with transaction.atomic():
+            for job in jobs:
+                state = _job_state(job)
+                if self.recorded.get(job.UUID) == state:
+                    continue
+                kwargs = {
+                    'exitcode': job.get_exit_code(),
+                    'endtime': self.endtimes.get(job.UUID) or getUTCDate(),
+                }
+                if django_settings.CAPTURE_CLIENT_SCRIPT_OUTPUT:
+                    kwargs.update({
+                        'stdout': job.get_stdout(),
+                        'stderror': job.get_stderr(),
+                    })
+                Task.objects.filter(taskuuid=job.UUID).update(**kwargs)
+                updates.append((job.UUID, state))
+        self.recorded.update(updates)
@@ -0,0 +1,53 @@
+import os
+import sys
+from uuid import uuid4
+
+import pytest
+from django.utils import timezone
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib')))
+
+import task_payloads
+from main.models import Job as JobModel, Task
+
+
+@pytest.fixture
+def archivematica_client(settings):
+    # The tests run with the settings of the dashboard, which don't have the
+    # directories of the client scripts used when importing the module.
+    settings.CLIENT_SCRIPTS_DIRECTORY = os.path.join(THIS_DIR, '../lib/clientScripts')
+    settings.CLIENT_ASSETS_DIRECTORY = os.path.join(THIS_DIR, '../lib/assets')
+    import archivematicaClient
+    return archivematicaClient
+
+
+def test_fail_all_tasks(db, mocker, archivematica_client):
+    job_model = JobModel.objects.create(jobuuid=str(uuid4()), createdtime=timezone.now())
+    tasks = [Task.objects.create(taskuuid=str(uuid4()), job=job_model, createdtime=timezone.now())
+             for _ in range(2)]
+    gearman_job = mocker.Mock(
+        task='test',
+        data=task_payloads.dumps({'tasks': [{'uuid': task.taskuuid} for task in tasks]}))
+
+    payload = archivematica_client.fail_all_tasks(
+        gearman_job, 'Failed', {tasks[0].taskuuid: 0})
+
+    assert task_payloads.loads(payload) == {'task_results': {
+        tasks[0].taskuuid: {'exitCode': 0},
+        tasks[1].taskuuid: {'exitCode': 1},
+    }}
+    # Only the task whose result wasn't recorded is failed in the DB.
+    assert Task.objects.get(taskuuid=tasks[0].taskuuid).exitcode is None
+    failed = Task.objects.get(taskuuid=tasks[1].taskuuid)
+    assert (failed.exitcode, failed.stderror) == (1, 'Failed')
+    assert failed.endtime is not None
+
+
+def test_fail_all_tasks_without_recorded_results(db, mocker, archivematica_client):
+    task_uuid = str(uuid4())
+    gearman_job = mocker.Mock(task='test', data=task_payloads.dumps({'tasks': [{'uuid': task_uuid}]}))
+
+    payload = archivematica_client.fail_all_tasks(gearman_job, 'Failed')
+
+    assert task_payloads.loads(payload) == {'task_results': {task_uuid: {'exitCode': 1}}}
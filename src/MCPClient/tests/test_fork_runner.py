@@ -0,0 +1,143 @@
+import os
+import sys
+import textwrap
+from uuid import uuid4
+
+import pytest
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib')))
+
+import fork_runner
+from job import Job
+
+CLIENT_SCRIPT = textwrap.dedent("""
+    import os
+
+
+    def call(jobs):
+        # Stray prints must not corrupt the responses of the worker.
+        print('Processing %d jobs' % len(jobs))
+        for job in jobs:
+            if job.args[1] == 'raise':
+                raise ValueError('Bad job')
+            job.print_output(os.getpid())
+            job.set_status(0)
+""")
+
+
+@pytest.fixture
+def module_name(tmpdir, monkeypatch):
+    name = 'fork_runner_client_script_%s' % uuid4().hex
+    tmpdir.join(name + '.py').write(CLIENT_SCRIPT)
+    # Workers use the path of this process: make sure that they import the
+    # Django settings used by the tests, and not the MCPClient settings.
+    settings_dir = os.path.dirname(os.path.dirname(sys.modules['settings'].__file__))
+    monkeypatch.setattr(sys, 'path', [settings_dir] + sys.path + [str(tmpdir)])
+    return name
+
+
+def _jobs(count, arg='ok'):
+    return [Job('test', str(uuid4()), [arg]) for _ in range(count)]
+
+
+def _worker_pids(jobs):
+    return set(int(job.get_stdout()) for job in jobs)
+
+
+@pytest.mark.parametrize('job_count, worker_count, min_chunk_size, expected', [
+    (128, 4, 1, 8),
+    (128, 4, 20, 20),
+    # Small batches are still spread across all the workers.
+    (40, 4, 20, 10),
+    (3, 4, 20, 1),
+    (0, 4, 1, 1),
+])
+def test_chunk_size(job_count, worker_count, min_chunk_size, expected):
+    assert fork_runner.chunk_size(job_count, worker_count, min_chunk_size) == expected
+
+
+def test_min_chunk_size(module_name, mocker):
+    try:
+        run = mocker.spy(fork_runner.Worker, 'run')
+        jobs = _jobs(8)
+
+        fork_runner.call(module_name, jobs, task_count=2, min_chunk_size=4)
+
+        assert sorted(len(call[0][1]) for call in run.call_args_list) == [4, 4]
+        assert all(job.get_exit_code() == 0 for job in jobs)
+    finally:
+        fork_runner._pools.pop(module_name).stop()
+
+
+def test_workers_are_reused(module_name):
+    try:
+        jobs = _jobs(20)
+        fork_runner.call(module_name, jobs, task_count=2)
+        pids = _worker_pids(jobs)
+        assert 1 <= len(pids) <= 2
+        assert os.getpid() not in pids
+
+        jobs = _jobs(20)
+        fork_runner.call(module_name, jobs, task_count=2)
+        assert _worker_pids(jobs) <= pids
+    finally:
+        fork_runner._pools.pop(module_name).stop()
+
+
+def test_finished_jobs_are_reported(module_name, mocker):
+    try:
+        jobs = _jobs(8)
+        finished = []
+
+        fork_runner.call(module_name, jobs, task_count=2, finished_callback=finished.append)
+
+        assert sorted(finished) == sorted(jobs)
+        assert all(job.get_stdout() for job in finished)
+    finally:
+        fork_runner._pools.pop(module_name).stop()
+
+
+def test_dead_workers_are_replaced(module_name):
+    try:
+        jobs = _jobs(4)
+        fork_runner.call(module_name, jobs, task_count=1)
+        process = fork_runner._pools[module_name].workers[0].process
+        process.kill()
+        process.wait()
+
+        jobs = _jobs(4)
+        fork_runner.call(module_name, jobs, task_count=1)
+        assert all(job.get_exit_code() == 0 for job in jobs)
+    finally:
+        fork_runner._pools.pop(module_name).stop()
+
+
+def test_uncaught_exceptions_are_raised(module_name):
+    try:
+        with pytest.raises(Exception) as excinfo:
+            fork_runner.call(module_name, _jobs(2, arg='raise'), task_count=1)
+        assert str(excinfo.value) == 'ValueError: Bad job'
+
+        # The worker survives the failure of a batch.
+        jobs = _jobs(2)
+        fork_runner.call(module_name, jobs, task_count=1)
+        assert all(job.get_exit_code() == 0 for job in jobs)
+    finally:
+        fork_runner._pools.pop(module_name).stop()
+
+
+def test_idle_pools_are_stopped(module_name, mocker):
+    try:
+        fork_runner.call(module_name, _jobs(1), task_count=1)
+        pool = fork_runner._pools[module_name]
+        pool.last_used -= fork_runner.POOL_IDLE_TIMEOUT + 1
+        stop = mocker.spy(pool, 'stop')
+
+        fork_runner._get_pool('another_module', 0)
+
+        assert stop.call_count == 1
+        assert module_name not in fork_runner._pools
+    finally:
+        fork_runner._pools.pop(module_name, None)
+        fork_runner._pools.pop('another_module', None)
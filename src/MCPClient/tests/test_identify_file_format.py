@@ -0,0 +1,110 @@
+# -*- coding: utf8
+import json
+import os
+import sys
+
+from django.test import TestCase
+import mock
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib/clientScripts')))
+
+from fpr.models import FormatVersion, IDCommand, IDTool
+from job import Job
+from main import models
+
+import fpr_cache
+import identify_file_format
+
+TIF_UUID = '47813453-6872-442b-9d65-6515be3c5aa1'
+SVG_UUID = '60e5c61b-14ef-4e92-89ec-9b9201e68adb'
+
+
+class TestIdentifyFileFormatBatch(TestCase):
+    """Test identify_file_format with a batch mode IDCommand."""
+
+    fixture_files = ['transfer.json', 'files-transfer.json', 'formats.json']
+    fixtures = [os.path.join(THIS_DIR, 'fixtures', p) for p in fixture_files]
+
+    def setUp(self):
+        fpr_cache.clear()
+        IDCommand.objects.update(enabled=False)
+        tool = IDTool.objects.create(description='Batch tool', version='1.0')
+        self.command = IDCommand.objects.create(
+            tool=tool, description='Identify in batches', config='PUID',
+            script='identify "$@"', script_type='bashScript', batch=True)
+
+    def _jobs(self, *files):
+        return [Job('identify_file_format', 'uuid-{}'.format(uuid),
+                    ['True', path, uuid])
+                for path, uuid in files]
+
+    @mock.patch('identify_file_format.executeOrRun')
+    def test_batch_is_identified_with_one_run(self, execute_or_run):
+        execute_or_run.return_value = (0, json.dumps({
+            '/tmp/G31DS.TIF': 'fmt/353',
+            '/tmp/lion.svg': None,
+        }), '')
+        jobs = self._jobs(('/tmp/G31DS.TIF', TIF_UUID), ('/tmp/lion.svg', SVG_UUID))
+
+        identify_file_format.call(jobs)
+
+        execute_or_run.assert_called_once_with(
+            'bashScript', 'identify "$@"',
+            arguments=['/tmp/G31DS.TIF', '/tmp/lion.svg'],
+            printing=False, capture_output=True)
+        assert [job.get_exit_code() for job in jobs] == [0, 255]
+        ffv = models.FileFormatVersion.objects.get(file_uuid_id=TIF_UUID)
+        assert ffv.format_version.pronom_id == 'fmt/353'
+        assert models.FileID.objects.filter(file_id=TIF_UUID).exists()
+        assert not models.FileFormatVersion.objects.filter(file_uuid_id=SVG_UUID).exists()
+
+    @mock.patch('identify_file_format.executeOrRun')
+    def test_batch_updates_previous_identifications(self, execute_or_run):
+        previous = FormatVersion.objects.get(pronom_id='fmt/1')
+        for file_uuid in (TIF_UUID, SVG_UUID):
+            models.FileFormatVersion.objects.create(file_uuid_id=file_uuid, format_version=previous)
+        execute_or_run.return_value = (0, json.dumps({
+            '/tmp/G31DS.TIF': 'fmt/353',
+            '/tmp/lion.svg': 'fmt/10',
+        }), '')
+        jobs = self._jobs(('/tmp/G31DS.TIF', TIF_UUID), ('/tmp/lion.svg', SVG_UUID))
+
+        identify_file_format.call(jobs)
+
+        assert [job.get_exit_code() for job in jobs] == [0, 0]
+        puids = dict(models.FileFormatVersion.objects.values_list(
+            'file_uuid_id', 'format_version__pronom_id'))
+        assert puids == {TIF_UUID: 'fmt/353', SVG_UUID: 'fmt/10'}
+        assert models.Event.objects.filter(
+            file_uuid_id__in=[TIF_UUID, SVG_UUID], event_type='format identification').count() == 2
+
+    @mock.patch('identify_file_format.executeOrRun')
+    def test_batch_failure_fails_every_job(self, execute_or_run):
+        execute_or_run.return_value = (1, '', 'boom')
+        jobs = self._jobs(('/tmp/G31DS.TIF', TIF_UUID), ('/tmp/lion.svg', SVG_UUID))
+
+        identify_file_format.call(jobs)
+
+        assert [job.get_exit_code() for job in jobs] == [255, 255]
+
+    @mock.patch('identify_file_format.executeOrRun')
+    def test_single_file_mode(self, execute_or_run):
+        self.command.batch = False
+        self.command.save()
+        execute_or_run.return_value = (0, 'fmt/353\n', '')
+        jobs = self._jobs(('/tmp/G31DS.TIF', TIF_UUID), ('/tmp/lion.svg', SVG_UUID))
+
+        identify_file_format.call(jobs)
+
+        assert execute_or_run.call_count == 2
+        assert [job.get_exit_code() for job in jobs] == [0, 0]
+
+    def test_min_chunk_size(self):
+        assert identify_file_format.min_chunk_size() == identify_file_format.BATCH_MIN_CHUNK_SIZE
+
+        self.command.batch = False
+        self.command.save()
+        fpr_cache.clear()
+
+        assert identify_file_format.min_chunk_size() == 1
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sys
+
+import metsrw
+import pytest
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib/clientScripts')))
+
+import mets_cache
+
+METS_PATH = os.path.join(THIS_DIR, 'fixtures', 'mets_no_metadata.xml')
+ORIGINAL_UUID = 'ae8d4290-fe52-4954-b72a-0f591bee2e2f'
+ORIGINAL_PATH = 'objects/evelyn_s_photo.jpg'
+
+
+@pytest.fixture
+def mets_path(tmpdir):
+    mets_cache.clear()
+    path = str(tmpdir.join('METS.xml'))
+    shutil.copy(METS_PATH, path)
+    return path
+
+
+def test_files_are_indexed(mets_path):
+    mets = mets_cache.get(mets_path)
+
+    entry = mets.get_file_by_uuid(ORIGINAL_UUID)
+    assert entry.path == ORIGINAL_PATH
+    assert mets.get_file_by_path(ORIGINAL_PATH) is entry
+    assert mets.get_file_by_uuid('no-such-uuid') is None
+
+    premis_object = mets.get_premis_object(ORIGINAL_UUID)
+    assert premis_object.size == entry.get_premis_objects()[0].size
+    assert mets.get_premis_object(ORIGINAL_UUID) is premis_object
+    assert mets.get_premis_object('no-such-uuid') is None
+
+
+def test_documents_are_parsed_once(mets_path, mocker):
+    fromfile = mocker.spy(metsrw.METSDocument, 'fromfile')
+
+    mets = mets_cache.get(mets_path)
+    assert mets_cache.get(mets_path) is mets
+    assert fromfile.call_count == 1
+
+    # A modified file is parsed again.
+    os.utime(mets_path, (0, 0))
+    assert mets_cache.get(mets_path) is not mets
+    assert fromfile.call_count == 2
+
+
+def test_cache_is_bounded(mets_path, tmpdir, mocker):
+    mocker.patch.object(mets_cache._cache, 'max_documents', 1)
+    other_path = str(tmpdir.join('other-METS.xml'))
+    shutil.copy(METS_PATH, other_path)
+
+    mets = mets_cache.get(mets_path)
+    mets_cache.get(other_path)
+
+    assert len(mets_cache._cache.documents) == 1
+    assert mets_cache.get(mets_path) is not mets
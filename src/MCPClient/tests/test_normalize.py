@@ -0,0 +1,62 @@
+import os
+import sys
+
+from django.db import OperationalError
+import pytest
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib')))
+
+from clientScripts import normalize
+
+
+def test_parse_tool_limits():
+    assert normalize.parse_tool_limits('') == {}
+    assert normalize.parse_tool_limits('FFmpeg:1, inkscape : 2,') == {
+        'ffmpeg': 1,
+        'inkscape': 2,
+    }
+    # Invalid entries are ignored
+    assert normalize.parse_tool_limits('ffmpeg, convert:x, :1, inkscape:0, gs:2') == {
+        'gs': 2,
+    }
+
+
+def _fpcommand(mocker, tool):
+    return mocker.Mock(tool_id='tool-uuid', **{'tool.description': tool})
+
+
+def test_tool_slot_limits_concurrent_commands(mocker, settings, tmpdir):
+    settings.NORMALIZE_TOOL_LIMITS = 'ffmpeg:1'
+    mocker.patch('tempfile.gettempdir', return_value=str(tmpdir))
+    job = mocker.Mock()
+    lock_dir = str(tmpdir.join('archivematica-normalize'))
+
+    with normalize.tool_slot(job, _fpcommand(mocker, 'FFmpeg')):
+        # Another process can't get a slot until the command is done.
+        assert normalize._acquire_slot(lock_dir, 'ffmpeg', 1) is None
+
+        # Tools without a limit don't wait.
+        with normalize.tool_slot(job, _fpcommand(mocker, 'convert')):
+            pass
+
+    lock_file = normalize._acquire_slot(lock_dir, 'ffmpeg', 1)
+    assert lock_file is not None
+    lock_file.close()
+
+
+def test_write_atomically_retries_deadlocks(mocker, db):
+    mocker.patch('time.sleep')
+    callback = mocker.Mock(side_effect=[OperationalError('deadlock'), 'done'])
+
+    assert normalize.write_atomically(callback) == 'done'
+    assert callback.call_count == 2
+
+
+def test_write_atomically_gives_up(mocker, db):
+    mocker.patch('time.sleep')
+    callback = mocker.Mock(side_effect=OperationalError('deadlock'))
+
+    with pytest.raises(OperationalError):
+        normalize.write_atomically(callback)
+    assert callback.call_count == normalize.DB_WRITE_ATTEMPTS
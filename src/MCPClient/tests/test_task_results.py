@@ -0,0 +1,101 @@
+import os
+import sys
+from uuid import uuid4
+
+import pytest
+from django.db import transaction
+from django.utils import timezone
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(THIS_DIR, '../lib')))
+
+import task_results
+from job import Job
+from main.models import Job as JobModel, Task
+
+
+@pytest.fixture
+def jobs(db, settings):
+    settings.CAPTURE_CLIENT_SCRIPT_OUTPUT = True
+    job_model = JobModel.objects.create(jobuuid=str(uuid4()), createdtime=timezone.now())
+    result = []
+    for _ in range(3):
+        task = Task.objects.create(taskuuid=str(uuid4()), job=job_model, createdtime=timezone.now())
+        result.append(Job('test', task.taskuuid, []))
+    return result
+
+
+def _run(job, exit_code):
+    with job.JobContext():
+        job.print_output('exit code', exit_code)
+        job.set_status(exit_code)
+    job.finished()
+
+
+def test_finished_jobs_are_recorded(jobs, mocker):
+    mocker.patch.object(task_results, 'FLUSH_INTERVAL', 0)
+    progress = mocker.Mock()
+    results = task_results.TaskResults(progress_callback=progress)
+    results.track(jobs)
+
+    _run(jobs[0], 2)
+
+    task = Task.objects.get(taskuuid=jobs[0].UUID)
+    assert (task.exitcode, task.stdout) == (2, 'exit code 2\n')
+    assert task.endtime is not None
+    assert Task.objects.filter(endtime__isnull=True).count() == 2
+    progress.assert_called_once_with(1, 3)
+    assert results.recorded_exit_codes() == {jobs[0].UUID: 2}
+
+    _run(jobs[1], 0)
+    jobs[2].set_status(1)
+    update = mocker.spy(task_results.Task.objects, 'filter')
+    results.record_all()
+
+    # Only the job which wasn't recorded yet is written.
+    assert update.call_count == 1
+    assert [Task.objects.get(taskuuid=job.UUID).exitcode for job in jobs] == [2, 0, 1]
+
+
+def test_jobs_are_not_recorded_in_transactions(jobs, mocker):
+    mocker.patch.object(task_results, 'FLUSH_INTERVAL', 0)
+    results = task_results.TaskResults()
+    results.track(jobs)
+
+    with transaction.atomic():
+        _run(jobs[0], 0)
+    assert not results.recorded
+
+    # ... until the next flush.
+    _run(jobs[1], 0)
+    assert set(results.recorded) == {jobs[0].UUID, jobs[1].UUID}
+
+
+def test_jobs_are_flushed_periodically(jobs, mocker):
+    mocker.patch.object(task_results, 'FLUSH_INTERVAL', 3600)
+    results = task_results.TaskResults()
+    results.track(jobs)
+
+    _run(jobs[0], 0)
+
+    assert not results.recorded
+    assert results.finished == [jobs[0]]
+
+
+def test_jobs_finish_once(jobs, mocker):
+    mocker.patch.object(task_results, 'FLUSH_INTERVAL', 0)
+    results = task_results.TaskResults()
+    results.track(jobs)
+
+    # Client scripts may run their jobs in several passes.
+    with jobs[0].JobContext():
+        jobs[0].print_output('first pass')
+    assert not results.recorded
+
+    with jobs[0].JobContext():
+        jobs[0].set_status(3)
+    jobs[0].finished()
+    jobs[0].finished()
+
+    assert results.recorded_exit_codes() == {jobs[0].UUID: 3}
+    assert results.endtimes.keys() == [jobs[0].UUID]
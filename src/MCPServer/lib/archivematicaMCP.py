@@ -68,7 +68,7 @@ from archivematicaFunctions import unicodeToStr
 from databaseFunctions import auto_close_db, createSIP, getUTCDate
 import dicts
 
-from main.models import Job, SIP, Task
+from main.models import Job, SIP, Task, UnitStatus
 
 logger = logging.getLogger("archivematica.mcp.server")
 
@@ -178,7 +178,15 @@ def createUnitAndJobChainThreaded(path, watched_dir, workflow):
 
 
 def watchDirectories(workflow):
-    """Start watching the watched directories defined in the workflow."""
+    """Start watching the watched directories defined in the workflow.
+
+    A single dispatcher thread serves all of them, detecting changes with the
+    backend configured in ``WATCH_DIRECTORY_METHOD``.
+    """
+    backend = watchDirectory.get_backend(
+        django_settings.WATCH_DIRECTORY_METHOD,
+        interval=django_settings.WATCH_DIRECTORY_INTERVAL)
+    dispatcher = watchDirectory.WatchDirectoryDispatcher(backend)
     for watched_dir in workflow.get_wdirs():
         directory = os.path.join(
             django_settings.WATCH_DIRECTORY,
@@ -193,12 +201,13 @@ def watchDirectories(workflow):
                 item = item.decode("utf-8")
             path = os.path.join(six.text_type(directory), item)
             createUnitAndJobChainThreaded(path, watched_dir, workflow)
-        watchDirectory.archivematicaWatchDirectory(
+        dispatcher.watch(
             directory,
             variablesAdded=(watched_dir, workflow),
             callBackFunctionAdded=createUnitAndJobChainThreaded,
-            alertOnFiles=not watched_dir["only_dirs"],
-            interval=django_settings.WATCH_DIRECTORY_INTERVAL)
+            alertOnFiles=not watched_dir["only_dirs"])
+    dispatcher.start()
+    return dispatcher
 
 
 def signal_handler(signalReceived, frame):
@@ -235,6 +244,9 @@ def flushOutputs():
 
 
 def cleanupOldDbEntriesOnNewRun():
+    # The statuses of the units of these jobs are computed again when needed
+    UnitStatus.objects.filter(current_step__in=(
+        Job.STATUS_AWAITING_DECISION, Job.STATUS_EXECUTING_COMMANDS)).delete()
     Job.objects.filter(currentstep=Job.STATUS_AWAITING_DECISION).delete()
     Job.objects.filter(currentstep=Job.STATUS_EXECUTING_COMMANDS).update(currentstep=Job.STATUS_FAILED)
     Task.objects.filter(exitcode=None).update(exitcode=-1, stderror="MCP shut down while processing.")
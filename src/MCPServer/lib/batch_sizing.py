@@ -0,0 +1,129 @@
+"""Sizing of the task groups of file-level links.
+
+The files of a unit are sent to MCP Client in task groups. Instead of cutting
+every group at the same size, groups are sized to take about
+``BATCH_TARGET_DURATION`` seconds, based on how long the recent task groups
+with the same ``execute`` took per file: a group of slow normalizations holds
+a few files, while quick commands still get large groups. The workflow can
+provide a ``seconds_per_file`` estimate for links that haven't run yet.
+
+Groups also shrink toward the end of the unit (guided self-scheduling), so
+that the last files are spread across the idle MCP Clients instead of
+waiting on a single large group.
+"""
+
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings as django_settings
+
+from main.models import Task
+
+LOGGER = logging.getLogger('archivematica.mcp.server')
+
+# Number of recent tasks used to estimate the duration of a task.
+HISTORY_SIZE = 1000
+
+# Seconds during which estimates are reused before querying the tasks again.
+ESTIMATE_TTL = 300
+
+# Once the remaining files of a unit fit in fewer groups of the target size,
+# groups hold this fraction of the remaining files, but are never estimated
+# to take less than this fraction of the target duration.
+TAIL_GROUPS = 4
+
+_estimates = {}
+_estimates_lock = threading.Lock()
+
+
+def _seconds_per_file_from_history(execute):
+    """Estimate the seconds per file taken by the recent task groups of
+    ``execute``, or return ``None`` if there are none."""
+    rows = Task.objects.filter(
+        execution=execute,
+        starttime__isnull=False,
+        endtime__isnull=False,
+    ).order_by('-starttime').values_list('job_id', 'starttime', 'endtime')[:HISTORY_SIZE]
+    rows = list(rows)
+
+    # MCP Client records the same start time for every task of a group.
+    groups = {}
+    for job_id, starttime, endtime in rows:
+        count, last_endtime = groups.get((job_id, starttime), (0, endtime))
+        groups[(job_id, starttime)] = (count + 1, max(last_endtime, endtime))
+    if len(rows) == HISTORY_SIZE:
+        # The oldest group may be missing some of its tasks.
+        _, oldest_starttime, _ = rows[-1]
+        groups = {key: value for key, value in groups.items()
+                  if key[1] != oldest_starttime}
+
+    files = sum(count for count, _ in groups.values())
+    if not files:
+        return None
+    seconds = sum((endtime - starttime).total_seconds()
+                  for (_, starttime), (_, endtime) in groups.items())
+    return max(seconds, 0) / float(files)
+
+
+def get_seconds_per_file(execute):
+    """Return the estimated seconds per file of ``execute``, or ``None`` if
+    it hasn't run recently."""
+    now = time.time()
+    with _estimates_lock:
+        estimate = _estimates.get(execute)
+        if estimate is not None and now - estimate[0] < ESTIMATE_TTL:
+            return estimate[1]
+
+    seconds_per_file = _seconds_per_file_from_history(execute)
+    LOGGER.debug('Estimated %s seconds per file for %s', seconds_per_file, execute)
+    with _estimates_lock:
+        _estimates[execute] = (now, seconds_per_file)
+    return seconds_per_file
+
+
+def clear_estimates():
+    """Forget the estimates, e.g. after the tasks were modified."""
+    with _estimates_lock:
+        _estimates.clear()
+
+
+class BatchSizer(object):
+    """Sizes the task groups of a link.
+
+    :param execute: name of the command run by the link.
+    :param max_size: maximum number of files per task group, also used when
+        the duration of the tasks can't be estimated.
+    :param seconds_per_file: estimate provided by the workflow, used when
+        ``execute`` hasn't run recently.
+    """
+
+    def __init__(self, execute, max_size, seconds_per_file=None):
+        self.max_size = max(max_size, 1)
+        self.target_size = self.max_size
+        self.min_size = self.max_size
+
+        target_duration = django_settings.BATCH_TARGET_DURATION
+        if not target_duration:
+            return
+        estimate = get_seconds_per_file(execute)
+        if estimate is None:
+            estimate = seconds_per_file
+        if estimate is None:
+            return
+
+        self.target_size = self._size_for(target_duration, estimate)
+        self.min_size = self._size_for(target_duration / float(TAIL_GROUPS), estimate)
+
+    def _size_for(self, duration, seconds_per_file):
+        """Number of files processed in ``duration`` seconds."""
+        if seconds_per_file <= 0:
+            return self.max_size
+        return int(min(max(duration / seconds_per_file, 1), self.max_size))
+
+    def size(self, remaining):
+        """Size of the next task group, when ``remaining`` files of the unit
+        are left to dispatch."""
+        tail_size = int(math.ceil(remaining / float(TAIL_GROUPS)))
+        return min(self.target_size, max(tail_size, self.min_size))
@@ -26,7 +26,7 @@ from utils import log_exceptions
 
 from databaseFunctions import auto_close_db, getUTCDate
 
-from main.models import Job
+from main.models import Job, UnitStatus
 
 
 LOGGER = logging.getLogger('archivematica.mcp.server')
@@ -71,7 +71,7 @@ class jobChainLink:
                 unit_id = self.unit.owningUnit.UUID
         except AttributeError:
             unit_id = self.unit.UUID
-        return Job.objects.create(
+        job = Job.objects.create(
             jobuuid=self.UUID,
             jobtype=self.description,
             directory=self.unit.currentPath,
@@ -82,6 +82,8 @@ class jobChainLink:
             createdtime=self.created_at,
             createdtimedec=self._created_at_dec,
             microservicechainlink=self.pk)
+        UnitStatus.objects.job_created(job)
+        return job
 
     @property
     def _created_at_dec(self):
@@ -114,6 +116,7 @@ class jobChainLink:
         except ValueError:
             status_code = 0
         Job.objects.filter(jobuuid=self.UUID).update(currentstep=status_code)
+        UnitStatus.objects.job_step_changed(self.UUID, status_code)
 
     @log_exceptions
     @auto_close_db
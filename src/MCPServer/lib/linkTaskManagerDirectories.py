@@ -39,7 +39,7 @@ class linkTaskManagerDirectories(LinkTaskManager):
         execute = config["execute"]
         arguments = config["arguments"]
 
-        # Used by ``TaskGroup._log_task``.
+        # Used by ``TaskGroup._task_models``.
         self.execute = config["execute"]
 
         if filterSubDir:
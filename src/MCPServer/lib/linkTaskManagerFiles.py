@@ -28,6 +28,7 @@ from django.conf import settings as django_settings
 
 from linkTaskManager import LinkTaskManager
 import archivematicaFunctions
+from batch_sizing import BatchSizer
 from dicts import ReplacementDict
 from main.models import UnitVariable
 
@@ -36,14 +37,19 @@ from taskGroup import TaskGroup
 
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
-# The number of files we'll pack into each MCP Client job.  Chosen somewhat
-# arbitrarily, but benchmarking with larger values (like 512) didn't make much
-# difference to throughput.
+# The maximum number of files we'll pack into each MCP Client job.  Chosen
+# somewhat arbitrarily, but benchmarking with larger values (like 512) didn't
+# make much difference to throughput.
 #
 # Setting this too large will use more memory; setting it too small will hurt
-# throughput.  So the trick is to set it juuuust right.
+# throughput.  So the trick is to set it juuuust right.  Jobs are made smaller
+# for slow commands, see ``batch_sizing``.
 BATCH_SIZE = django_settings.BATCH_SIZE
 
+# Units with more files than this are processed with a lower priority, so
+# that they don't hold back the smaller ones.
+BULK_UNIT_SIZE = 1000
+
 
 class linkTaskManagerFiles(LinkTaskManager):
     def __init__(self, jobChainLink, unit):
@@ -51,7 +57,10 @@ class linkTaskManagerFiles(LinkTaskManager):
 
         unit.reloadFileList()
 
-        # The list of task groups we'll be executing for this batch of files
+        # The task groups we've dispatched for this batch of files that are
+        # still running.  Task groups are sent off to MCP Client as soon as
+        # they're full, so they may start (and finish) while we're still
+        # building the rest of them.
         self.taskGroupsLock = threading.Lock()
         self.taskGroups = {}
 
@@ -59,6 +68,7 @@ class linkTaskManagerFiles(LinkTaskManager):
         # something greater than zero.
         self.exitCode = 0
 
+        # Set once every task group has been dispatched.
         self.clearToNextLink = False
 
         config = self.jobChainLink.link.config
@@ -75,7 +85,7 @@ class linkTaskManagerFiles(LinkTaskManager):
         self.execute = config["execute"]
         self.arguments = config["arguments"]
 
-        # Used by ``TaskGroup._log_task``.
+        # Used by ``TaskGroup._task_models``.
         self.execute = config["execute"]
 
         outputLock = threading.Lock()
@@ -101,10 +111,8 @@ class linkTaskManagerFiles(LinkTaskManager):
         # Escape all values for shell
         for key, value in SIPReplacementDic.items():
             SIPReplacementDic[key] = archivematicaFunctions.escapeForCommand(value)
-        self.taskGroupsLock.acquire()
-
-        currentTaskGroup = None
 
+        files = []
         for file, fileUnit in unit.fileList.items():
             if filterFileEnd:
                 if not file.endswith(filterFileEnd):
@@ -115,7 +123,20 @@ class linkTaskManagerFiles(LinkTaskManager):
             if filterSubDir:
                 if not file.startswith(unit.pathString + filterSubDir):
                     continue
+            files.append(fileUnit)
+
+        # Task groups are sized for the duration of the command, and shrink
+        # as we get to the last files.
+        batchSizer = BatchSizer(self.execute, BATCH_SIZE,
+                                seconds_per_file=config.get("seconds_per_file"))
+        taskGroupSize = batchSizer.size(len(files))
+        priority = TaskGroup.PRIORITY_BULK if len(files) > BULK_UNIT_SIZE \
+            else TaskGroup.PRIORITY_NORMAL
+
+        currentTaskGroup = None
+        dispatchedTaskGroups = 0
 
+        for index, fileUnit in enumerate(files):
             standardOutputFile = self.standardOutputFile
             standardErrorFile = self.standardErrorFile
             arguments = self.arguments
@@ -139,35 +160,53 @@ class linkTaskManagerFiles(LinkTaskManager):
             # Apply unit (SIP/Transfer) replacement values
             arguments, standardOutputFile, standardErrorFile = SIPReplacementDic.replace(arguments, standardOutputFile, standardErrorFile)
 
-            if currentTaskGroup is None or currentTaskGroup.count() > BATCH_SIZE:
-                currentTaskGroup = TaskGroup(self, self.execute)
-                self.taskGroups[currentTaskGroup.UUID] = currentTaskGroup
+            if currentTaskGroup is None:
+                currentTaskGroup = TaskGroup(self, self.execute, priority)
 
             currentTaskGroup.addTask(
                 arguments, standardOutputFile, standardErrorFile,
                 outputLock, commandReplacementDic)
 
-        for taskGroup in self.taskGroups.values():
-            taskGroup.logTaskCreatedSQL()
-            TaskGroupRunner.runTaskGroup(taskGroup, self.taskGroupFinished)
-
-        self.clearToNextLink = True
-        self.taskGroupsLock.release()
-
-        # If the batch of files was empty, we can immediately proceed to the
-        # next job in the chain.  Assume a successful status code.
-        if self.taskGroups == {}:
-            self.jobChainLink.linkProcessingComplete(0)
+            if currentTaskGroup.count() >= taskGroupSize:
+                self._dispatchTaskGroup(currentTaskGroup)
+                dispatchedTaskGroups += 1
+                currentTaskGroup = None
+                taskGroupSize = batchSizer.size(len(files) - index - 1)
+
+        if currentTaskGroup is not None:
+            self._dispatchTaskGroup(currentTaskGroup)
+            dispatchedTaskGroups += 1
+
+        with self.taskGroupsLock:
+            self.clearToNextLink = True
+
+            # If the batch of files was empty, we can immediately proceed to
+            # the next job in the chain.  Assume a successful status code.
+            if dispatchedTaskGroups == 0:
+                self.jobChainLink.linkProcessingComplete(0)
+
+            # Every task group finished before we were done dispatching them,
+            # so ``taskGroupFinished`` left it to us to proceed.
+            elif self.taskGroups == {}:
+                LOGGER.debug('Proceeding to next link %s', self.jobChainLink.UUID)
+                self.jobChainLink.linkProcessingComplete(self.exitCode, self.jobChainLink.passVar)
+
+    def _dispatchTaskGroup(self, taskGroup):
+        """Record the tasks of ``taskGroup`` and send it off to MCP Client."""
+        taskGroup.logTaskCreatedSQL()
+        with self.taskGroupsLock:
+            self.taskGroups[taskGroup.UUID] = taskGroup
+        TaskGroupRunner.runTaskGroup(taskGroup, self.taskGroupFinished)
 
     def taskGroupFinished(self, finishedTaskGroup):
         finishedTaskGroup.write_output()
 
+        self.taskGroupsLock.acquire()
+
         # Exit code is the maximum of all task groups (and each task group's
         # exit code is the maximum of the tasks it contains... turtles all the
         # way down)
         self.exitCode = max([finishedTaskGroup.calculateExitCode(), self.exitCode])
-
-        self.taskGroupsLock.acquire()
         if finishedTaskGroup.UUID in self.taskGroups:
             del self.taskGroups[finishedTaskGroup.UUID]
         else:
@@ -45,7 +45,7 @@ class linkTaskManagerGetMicroserviceGeneratedListInStdOut(LinkTaskManager):
         execute = config["execute"]
         arguments = config["arguments"]
 
-        # Used by ``TaskGroup._log_task``.
+        # Used by ``TaskGroup._task_models``.
         self.execute = config["execute"]
 
         if filterSubDir:
@@ -69,7 +69,8 @@ class linkTaskManagerGetMicroserviceGeneratedListInStdOut(LinkTaskManager):
             commandReplacementDic[key] = archivematicaFunctions.escapeForCommand(value)
         arguments, standardOutputFile, standardErrorFile = commandReplacementDic.replace(arguments, standardOutputFile, standardErrorFile)
 
-        group = TaskGroup(self, execute)
+        # The output lists the choices offered to the user.
+        group = TaskGroup(self, execute, priority=TaskGroup.PRIORITY_INTERACTIVE)
         group.addTask(
             arguments, standardOutputFile, standardErrorFile,
             commandReplacementDic=commandReplacementDic, wants_output=True)
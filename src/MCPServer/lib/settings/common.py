@@ -34,9 +34,13 @@ CONFIG_MAPPING = {
     'rejected_directory': {'section': 'MCPServer', 'option': 'rejectedDirectory', 'type': 'string'},
     'wait_on_auto_approve': {'section': 'MCPServer', 'option': 'waitOnAutoApprove', 'type': 'int'},
     'watch_directory_interval': {'section': 'MCPServer', 'option': 'watchDirectoriesPollInterval', 'type': 'int'},
+    'watch_directory_method': {'section': 'MCPServer', 'option': 'watchDirectoryMethod', 'type': 'string'},
     'secret_key': {'section': 'MCPServer', 'option': 'django_secret_key', 'type': 'string'},
     'search_enabled': {'section': 'MCPServer', 'process_function': process_search_enabled},
     'batch_size': {'section': 'MCPServer', 'option': 'batch_size', 'type': 'int'},
+    'batch_target_duration': {'section': 'MCPServer', 'option': 'batch_target_duration', 'type': 'float'},
+    'task_insert_batch_size': {'section': 'MCPServer', 'option': 'task_insert_batch_size', 'type': 'int'},
+    'max_task_groups_per_unit': {'section': 'MCPServer', 'option': 'max_task_groups_per_unit', 'type': 'int'},
     'storage_service_client_timeout': {'section': 'MCPServer', 'option': 'storage_service_client_timeout', 'type': 'float'},
     'storage_service_client_quick_timeout': {'section': 'MCPServer', 'option': 'storage_service_client_quick_timeout', 'type': 'float'},
     'prometheus_http_server': {'section': 'MCPServer', 'option': 'prometheus_http_server', 'type': 'string'},
@@ -63,10 +67,14 @@ sharedDirectory = /var/archivematica/sharedDirectory/
 processingDirectory = /var/archivematica/sharedDirectory/currentlyProcessing/
 rejectedDirectory = %%sharedPath%%rejected/
 watchDirectoriesPollInterval = 1
+watchDirectoryMethod = poll
 processingXMLFile = processingMCP.xml
 waitOnAutoApprove = 0
 search_enabled = true
 batch_size = 128
+batch_target_duration = 60
+task_insert_batch_size = 128
+max_task_groups_per_unit = 16
 storage_service_client_timeout = 86400
 storage_service_client_quick_timeout = 5
 prometheus_http_server =
@@ -191,9 +199,13 @@ PROCESSING_XML_FILE = config.get('processing_xml_file')
 GEARMAN_SERVER = config.get('gearman_server')
 WAIT_ON_AUTO_APPROVE = config.get('wait_on_auto_approve')
 WATCH_DIRECTORY_INTERVAL = config.get('watch_directory_interval')
+WATCH_DIRECTORY_METHOD = config.get('watch_directory_method')
 LIMIT_TASK_THREADS = config.get('limit_task_threads')
 SEARCH_ENABLED = config.get('search_enabled')
 BATCH_SIZE = config.get('batch_size')
+BATCH_TARGET_DURATION = config.get('batch_target_duration')
+TASK_INSERT_BATCH_SIZE = config.get('task_insert_batch_size')
+MAX_TASK_GROUPS_PER_UNIT = config.get('max_task_groups_per_unit')
 STORAGE_SERVICE_CLIENT_TIMEOUT = config.get('storage_service_client_timeout')
 STORAGE_SERVICE_CLIENT_QUICK_TIMEOUT = config.get('storage_service_client_quick_timeout')
 PROMETHEUS_HTTP_SERVER = config.get('prometheus_http_server')
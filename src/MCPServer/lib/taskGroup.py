@@ -23,13 +23,14 @@
 import threading
 import databaseFunctions
 import uuid
-import cPickle
 import logging
 import os
 
 from databaseFunctions import getUTCDate
+import task_payloads
 from main.models import Task
 
+from django.conf import settings as django_settings
 from django.db import transaction
 from django.utils import six, timezone
 
@@ -38,10 +39,20 @@ LOGGER = logging.getLogger('archivematica.mcp.server.taskGroup')
 
 class TaskGroup():
 
-    def __init__(self, linkTaskManager, execute):
+    # Priority classes, from the most urgent.  See ``TaskGroupRunner``.
+    #
+    # Task groups whose output a user is waiting for, e.g. to be offered a
+    # choice in the dashboard.
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_NORMAL = 1
+    # Task groups of very large units, which shouldn't hold back the others.
+    PRIORITY_BULK = 2
+
+    def __init__(self, linkTaskManager, execute, priority=PRIORITY_NORMAL):
         self.linkTaskManager = linkTaskManager
         self.execute = execute.encode("utf-8")
         self.UUID = str(uuid.uuid4())
+        self.priority = priority
 
         self.finalised = False
 
@@ -85,37 +96,29 @@ class TaskGroup():
 
             def insertTasks():
                 with transaction.atomic():
-                    for task in self.groupTasks:
-                        self._log_task(self.linkTaskManager,
-                                       task.commandReplacementDic,
-                                       task.UUID,
-                                       task.arguments)
+                    Task.objects.bulk_create(
+                        self._task_models(self.linkTaskManager),
+                        batch_size=django_settings.TASK_INSERT_BATCH_SIZE)
 
             databaseFunctions.retryOnFailure("Insert tasks", insertTasks)
 
-    def _log_task(self, taskManager, commandReplacementDic, taskUUID, arguments):
+    def _task_models(self, taskManager):
         """
-        Creates a new entry in the Tasks table using the supplied data.
+        Build the (unsaved) Task entries of this group.
 
         :param MCPServer.linkTaskManager taskManager: A linkTaskManager subclass instance.
-        :param ReplacementDict commandReplacementDic: A ReplacementDict or dict instance. %fileUUID% and %relativeLocation% variables will be looked up from this dict.
-        :param str taskUUID: The UUID to be used for this Task in the database.
-        :param str arguments: The arguments to be passed to the command when it is executed, as a string. Can contain replacement variables; see ReplacementDict for supported values.
         """
         jobUUID = taskManager.jobChainLink.UUID
-        fileUUID = ""
-        if "%fileUUID%" in commandReplacementDic:
-            fileUUID = commandReplacementDic["%fileUUID%"]
         taskexec = taskManager.execute
-        fileName = os.path.basename(os.path.abspath(commandReplacementDic["%relativeLocation%"]))
-
-        Task.objects.create(taskuuid=taskUUID,
-                            job_id=jobUUID,
-                            fileuuid=fileUUID,
-                            filename=fileName,
-                            execution=taskexec,
-                            arguments=arguments,
-                            createdtime=getUTCDate())
+        createdtime = getUTCDate()
+        return [Task(taskuuid=task.UUID,
+                     job_id=jobUUID,
+                     fileuuid=task.fileUUID,
+                     filename=task.fileName,
+                     execution=taskexec,
+                     arguments=task.arguments,
+                     createdtime=createdtime)
+                for task in self.groupTasks]
 
     def calculateExitCode(self):
         """
@@ -132,20 +135,20 @@ class TaskGroup():
 
     def serialize(self):
         """
-        Serialize this TaskGroup into something suitable for MCP Client.
+        Serialize this TaskGroup into something suitable for MCP Client (see
+        ``task_payloads``).
         """
-        result = {'tasks': {}}
-
-        for task in self.groupTasks:
-            task_data = {}
-            task_data["uuid"] = task.UUID
-            task_data["createdDate"] = timezone.now().isoformat(' ')
-            task_data["arguments"] = task.arguments
-            task_data["wants_output"] = task.wants_output
-
-            result['tasks'][task.UUID] = task_data
-
-        return cPickle.dumps(result)
+        return task_payloads.dumps({
+            'createdDate': timezone.now().isoformat(' '),
+            'tasks': [
+                {
+                    'uuid': task.UUID,
+                    'arguments': task.arguments,
+                    'wants_output': task.wants_output,
+                }
+                for task in self.groupTasks
+            ],
+        })
 
     def _write_file_to_disk(self, path, contents):
         """Write the bytes in ``contents`` to ``path`` in append mode.
@@ -194,6 +197,14 @@ class TaskGroup():
             self.UUID = str(uuid.uuid4())
             self.commandReplacementDic = commandReplacementDic
 
+            # Recorded in the Tasks table. %fileUUID% and %relativeLocation%
+            # are looked up from the replacement dict.
+            self.fileUUID = commandReplacementDic.get("%fileUUID%", "")
+            self.fileName = ""
+            relativeLocation = commandReplacementDic.get("%relativeLocation%")
+            if relativeLocation:
+                self.fileName = os.path.basename(os.path.abspath(relativeLocation))
+
             self.wants_output = any((
                 wants_output,
                 standardOutputFile,
@@ -9,6 +9,19 @@ The big idea:
   * Behind the scenes, TaskGroupRunner runs a background thread that takes care
     of scheduling task groups to be run and tracking the status of currently
     executing Gearman requests.  As jobs finish, their callbacks are fired.
+
+  * Task groups are not sent to Gearman as soon as they arrive: each unit may
+    only have MAX_TASK_GROUPS_PER_UNIT task groups in flight, and the units
+    with queued task groups take turns (round-robin), so a very large unit
+    can't starve the others.  Task groups of a higher priority class (see
+    TaskGroup.PRIORITY_*) are submitted first, and get a higher Gearman
+    priority so that MCP Client picks them ahead of the queued ones.
+    Interactive task groups are never held back.
+
+  * Completions are event-driven: while Gearman requests are running, the
+    background thread blocks in a select loop on the Gearman client sockets
+    and wakes up as soon as the server pushes a WORK_COMPLETE or WORK_FAIL
+    packet.  No status requests are sent to the Gearman server.
 """
 
 # This file is part of Archivematica.
@@ -33,7 +46,6 @@ The big idea:
 
 import threading
 import gearman
-import cPickle
 import logging
 from multiprocessing.pool import ThreadPool
 import time
@@ -44,12 +56,16 @@ import math
 from django.conf import settings as django_settings
 from prometheus_client import Gauge
 
+from taskGroup import TaskGroup
+import task_payloads
+
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
 
 class TaskGroupRunner():
 
-    # How often our background thread will wake up and do its thing
+    # The longest our background thread will block waiting for job
+    # completions before it checks for new task groups to submit
     POLL_DELAY_SECONDS = 0.2
 
     # The frequency with which we'll log task stats
@@ -76,6 +92,12 @@ class TaskGroupRunner():
     # Gearman is currently handling for us...)
     TaskGroupJob = collections.namedtuple('Job', ['task_group', 'finished_callback'])
 
+    GEARMAN_PRIORITIES = {
+        TaskGroup.PRIORITY_INTERACTIVE: gearman.PRIORITY_HIGH,
+        TaskGroup.PRIORITY_NORMAL: gearman.PRIORITY_NONE,
+        TaskGroup.PRIORITY_BULK: gearman.PRIORITY_LOW,
+    }
+
     @staticmethod
     def init():
         """Initialize TaskGroupRunner and start its poll thread."""
@@ -99,10 +121,32 @@ class TaskGroupRunner():
         self.pending_task_group_jobs_lock = threading.Lock()
         self.pending_task_group_jobs = []
 
+        # Wakes up the background thread when it is idle and a new TaskGroup
+        # is submitted
+        self.pending_task_group_jobs_event = threading.Event()
+
+        # TaskGroups waiting for their turn to be submitted to the MCP Client:
+        # for each priority class, a queue of TaskGroupJobs for each unit, in
+        # the order the units will be served.
+        self.queued_task_group_jobs = collections.defaultdict(collections.OrderedDict)
+
         # Gearman jobs that are currently waiting on the MCP Client
         self.running_gearman_jobs = []
         self.task_group_jobs_by_uuid = {}
 
+        # The number of submitted TaskGroups of each unit
+        self.running_task_groups_by_unit = collections.Counter()
+        self.queuedTaskGroupsGauge = Gauge(
+            'task_group_runner_queued_task_groups',
+            'Number of task groups waiting to be submitted, by unit',
+            ['unit_uuid'])
+        self.runningTaskGroupsGauge = Gauge(
+            'task_group_runner_running_task_groups',
+            'Number of task groups submitted to MCP Client, by unit',
+            ['unit_uuid'])
+        # Units with a value in the gauges above
+        self.gauge_units = set()
+
         # Track the number of units currently being processed
         self.activeUnitCounts = [0] * TaskGroupRunner.RUNNING_UNIT_SAMPLES
         self.activeUnitCountsIdx = 0
@@ -119,12 +163,16 @@ class TaskGroupRunner():
         # The time we last printed some diagnostics
         self.last_notification_time = 0
 
+        # The time we last sampled the number of active units
+        self.last_sample_time = 0
+
     def submit(self, task_group_job):
         """
         Record a TaskGroupJob that is ready to run.
         """
         with self.pending_task_group_jobs_lock:
             self.pending_task_group_jobs.append(task_group_job)
+        self.pending_task_group_jobs_event.set()
 
     def _start_polling(self):
         """
@@ -136,7 +184,6 @@ class TaskGroupRunner():
 
             while True:
                 try:
-                    time.sleep(TaskGroupRunner.POLL_DELAY_SECONDS)
                     self._poll(gm_client)
                 except Exception as e:
                     LOGGER.error("\n\n*** Uncaught error in event loop: " + str(e) + ": " + str(type(e)))
@@ -160,9 +207,10 @@ class TaskGroupRunner():
 
     def _poll(self, gm_client):
         """
-        Run a single poll loop (get new jobs, monitor running ones).
+        Run a single poll loop (get new jobs, wait for running ones to finish).
         """
         self._submit_pending_task_group_jobs(gm_client)
+        self._wait_for_completions(gm_client)
         self._monitor_running_jobs(gm_client)
 
     def _submit_pending_task_group_jobs(self, gm_client):
@@ -171,46 +219,140 @@ class TaskGroupRunner():
         with self.pending_task_group_jobs_lock:
             pending_task_group_jobs = list(self.pending_task_group_jobs)
             self.pending_task_group_jobs = []
+            self.pending_task_group_jobs_event.clear()
 
-        # ... and send them off
+        # ... queue them behind the other TaskGroups of their unit ...
         for task_group_job in pending_task_group_jobs:
             task_group = task_group_job.task_group
-            self.task_group_jobs_by_uuid[task_group.UUID] = task_group_job
+            units = self.queued_task_group_jobs[task_group.priority]
+            units.setdefault(task_group.unit_uuid(), collections.deque()).append(task_group_job)
 
-            job_request = None
-            while job_request is None:
-                try:
-                    job_request = gm_client.submit_job(
-                        task=task_group.name(),
-                        data=task_group.serialize(),
-                        unique=task_group.UUID,
-                        wait_until_complete=False,
-                        background=False,
-                        max_retries=10)
-                except Exception as e:
-                    LOGGER.warning("Retrying submit for job %s...: %s: %s" % (task_group.UUID, str(e), str(type(e))))
-                    LOGGER.exception(e)
-                    time.sleep(5)
+        # ... and send off the ones whose turn has come
+        for task_group_job in self._next_task_group_jobs():
+            self._submit_task_group_job(gm_client, task_group_job)
 
-                self.running_gearman_jobs.append(job_request)
+        self._update_unit_gauges()
 
-    def _monitor_running_jobs(self, gm_client):
-        statuses = []
-        for job in self.running_gearman_jobs:
+    def _next_task_group_jobs(self):
+        """
+        Take the queued TaskGroupJobs that can be submitted now, by priority
+        class, taking one TaskGroup of each unit in turn.
+        """
+        max_per_unit = django_settings.MAX_TASK_GROUPS_PER_UNIT
+        running = collections.Counter(self.running_task_groups_by_unit)
+        result = []
+
+        for priority in sorted(self.queued_task_group_jobs):
+            units = self.queued_task_group_jobs[priority]
+            limited = max_per_unit > 0 and priority != TaskGroup.PRIORITY_INTERACTIVE
+            while units:
+                served = []
+                for unit_uuid, queue in units.items():
+                    if limited and running[unit_uuid] >= max_per_unit:
+                        continue
+                    result.append(queue.popleft())
+                    running[unit_uuid] += 1
+                    served.append(unit_uuid)
+                if not served:
+                    break
+                # Served units go to the back of the line.
+                for unit_uuid in served:
+                    queue = units.pop(unit_uuid)
+                    if queue:
+                        units[unit_uuid] = queue
+
+        return result
+
+    def _submit_task_group_job(self, gm_client, task_group_job):
+        """
+        Send a TaskGroupJob off to the MCP Client.
+        """
+        task_group = task_group_job.task_group
+        self.task_group_jobs_by_uuid[task_group.UUID] = task_group_job
+        self.running_task_groups_by_unit[task_group.unit_uuid()] += 1
+
+        job_request = None
+        while job_request is None:
             try:
-                status = gm_client.get_job_status(job)
-                statuses.append(status)
-            except KeyError:
-                # There seems to be a race condition here in the Gearman client.
-                # If the job finishes before we get a chance to poll for its
-                # status, a KeyError is thrown.
-                #
-                # Not a huge problem: we can just try again on the next poll.
-                #
-                statuses.append(job)
-
-        finished_jobs = [job for job in statuses if job.complete]
-        still_running_jobs = [job for job in statuses if not job.complete]
+                job_request = gm_client.submit_job(
+                    task=task_group.name(),
+                    data=task_group.serialize(),
+                    unique=task_group.UUID,
+                    priority=TaskGroupRunner.GEARMAN_PRIORITIES.get(task_group.priority),
+                    wait_until_complete=False,
+                    background=False,
+                    max_retries=10)
+            except Exception as e:
+                LOGGER.warning("Retrying submit for job %s...: %s: %s" % (task_group.UUID, str(e), str(type(e))))
+                LOGGER.exception(e)
+                time.sleep(5)
+
+        self.running_gearman_jobs.append(job_request)
+
+    def _queued_task_groups_by_unit(self):
+        result = collections.Counter()
+        for units in self.queued_task_group_jobs.values():
+            for unit_uuid, queue in units.items():
+                result[unit_uuid] += len(queue)
+        return result
+
+    def _update_unit_gauges(self):
+        """
+        Publish the number of queued and running TaskGroups of each unit,
+        dropping the units that have none left.
+        """
+        queued = self._queued_task_groups_by_unit()
+        running = self.running_task_groups_by_unit
+        units = set(queued) | set(unit_uuid for unit_uuid, count in running.items() if count)
+        for unit_uuid in units:
+            self.queuedTaskGroupsGauge.labels(unit_uuid).set(queued[unit_uuid])
+            self.runningTaskGroupsGauge.labels(unit_uuid).set(running[unit_uuid])
+        for unit_uuid in self.gauge_units - units:
+            self.queuedTaskGroupsGauge.remove(unit_uuid)
+            self.runningTaskGroupsGauge.remove(unit_uuid)
+        self.gauge_units = units
+
+    @staticmethod
+    def _is_finished(job_request):
+        """
+        A Gearman request is finished when the server reported its completion
+        or failure, or when we lost the connection it was submitted on (the
+        client resets those requests to JOB_UNKNOWN and we'll never hear back
+        about them).
+        """
+        return job_request.complete or job_request.state == gearman.client.JOB_UNKNOWN
+
+    def _wait_for_completions(self, gm_client):
+        """
+        Block until a running Gearman job finishes, a new TaskGroup is
+        submitted or POLL_DELAY_SECONDS elapse, whichever comes first.
+
+        Completion packets are read from the Gearman client sockets as the
+        server pushes them, so a finished job is noticed immediately.
+        """
+        if not self.running_gearman_jobs:
+            self.pending_task_group_jobs_event.wait(TaskGroupRunner.POLL_DELAY_SECONDS)
+            return
+
+        def continue_while_jobs_running(any_activity):
+            if self.pending_task_group_jobs_event.is_set():
+                return False
+            return not any(self._is_finished(job) for job in self.running_gearman_jobs)
+
+        try:
+            gm_client.poll_connections_until_stopped(
+                gm_client.connection_list,
+                continue_while_jobs_running,
+                timeout=TaskGroupRunner.POLL_DELAY_SECONDS)
+        except gearman.errors.ServerUnavailable:
+            # Every connection is gone: the requests that were running on them
+            # are now in JOB_UNKNOWN state and will be failed by
+            # `_monitor_running_jobs`.
+            LOGGER.warning("Lost connection to the Gearman server while waiting for jobs")
+
+    def _monitor_running_jobs(self, gm_client):
+        finished_jobs = [job for job in self.running_gearman_jobs if self._is_finished(job)]
+        still_running_jobs = [job for job in self.running_gearman_jobs if not self._is_finished(job)]
 
         # Record the jobs that are still running.  We do this here (instead of
         # after dealing with the jobs that have finished) because it ensures we
@@ -228,22 +370,54 @@ class TaskGroupRunner():
 
         for finished_job in finished_jobs:
             task_group_job = self.task_group_jobs_by_uuid.pop(finished_job.gearman_job.unique)
+            unit_uuid = task_group_job.task_group.unit_uuid()
+            self.running_task_groups_by_unit[unit_uuid] -= 1
+            if self.running_task_groups_by_unit[unit_uuid] <= 0:
+                del self.running_task_groups_by_unit[unit_uuid]
             self.pool.apply_async(self._finish_task_group_job, [task_group_job])
+            # The client keeps track of every request it has submitted until
+            # they are reaped by `wait_until_jobs_completed`, which we don't use.
+            gm_client.request_to_rotating_connection_queue.pop(finished_job, None)
 
         now = time.time()
         if (now - self.last_notification_time) > TaskGroupRunner.NOTIFICATION_INTERVAL_SECONDS:
-            LOGGER.debug("%d jobs pending; %d jobs running; %d known task groups",
+            finished_tasks, running_tasks = self._running_tasks_progress()
+            LOGGER.debug("%d jobs pending; %d jobs queued; %d jobs running (%d of %d tasks finished); %d known task groups",
                          len(self.pending_task_group_jobs),
+                         sum(self._queued_task_groups_by_unit().values()),
                          len(self.running_gearman_jobs),
+                         finished_tasks, running_tasks,
                          len(self.task_group_jobs_by_uuid))
             self.last_notification_time = now
 
-        active_count = len(set([task_group.task_group.unit_uuid()
-                                for task_group in self.task_group_jobs_by_uuid.values()]))
+        # The loop runs whenever a job finishes so only take one sample per
+        # POLL_DELAY_SECONDS, as expected by RUNNING_UNIT_SAMPLES.
+        if (now - self.last_sample_time) < TaskGroupRunner.POLL_DELAY_SECONDS:
+            return
+        self.last_sample_time = now
+
+        active_count = len(set(self.running_task_groups_by_unit) |
+                           set(self._queued_task_groups_by_unit()))
         self.activeUnitCounts[self.activeUnitCountsIdx] = active_count
         self.activeUnitCountsIdx = (self.activeUnitCountsIdx + 1) % TaskGroupRunner.RUNNING_UNIT_SAMPLES
         self.activeUnitGauge.set(self.activeUnitCount())
 
+    def _running_tasks_progress(self):
+        """
+        Return the number of finished tasks and the number of tasks of the
+        running Gearman jobs.  MCP Client reports the number of finished tasks
+        of a job with WORK_STATUS packets as it records their results.
+        """
+        finished = total = 0
+        for job_request in self.running_gearman_jobs:
+            task_group_job = self.task_group_jobs_by_uuid.get(job_request.gearman_job.unique)
+            if task_group_job is None:
+                continue
+            total += task_group_job.task_group.count()
+            if job_request.status:
+                finished += job_request.status.get('numerator', 0)
+        return finished, total
+
     def _handle_gearman_response(self, job_request):
         """
         MCP Client will return a map like:
@@ -267,10 +441,16 @@ class TaskGroupRunner():
             # The job completed successfully
             if job_request.result is None:
                 LOGGER.debug("Expected a map containing 'task_results', but got None")
-                LOGGER.debug("Task was: %s", task_group.serialize())
+                LOGGER.debug("Tasks were: %s", [task.arguments for task in task_group.tasks()])
                 return
 
-            job_result = cPickle.loads(job_request.result)
+            try:
+                job_result = task_payloads.loads(job_request.result)
+            except task_payloads.PayloadError as e:
+                LOGGER.error("Unable to decode the results of task group %s: %s", task_group.UUID, e)
+                for task in task_group.tasks():
+                    task.results['exitCode'] = 1
+                return
 
             if 'task_results' not in job_result:
                 LOGGER.debug("Expected a map containing 'task_results', but got: %s" % (job_result))
@@ -296,11 +476,11 @@ class TaskGroupRunner():
             msg = ""
 
             if job_request.timed_out:
-                msg = 'Task %s timed out!' % (job_request.unique)
+                msg = 'Task %s timed out!' % (job_request.job.unique)
             elif job_request.state == gearman.client.JOB_UNKNOWN:
-                msg = 'Task %s connection failed!' % (job_request.unique)
+                msg = 'Task %s connection failed!' % (job_request.job.unique)
             else:
-                msg = 'Task %s failed!' % (job_request.unique)
+                msg = 'Task %s failed!' % (job_request.job.unique)
 
             LOGGER.error(msg)
             for task in task_group.tasks():
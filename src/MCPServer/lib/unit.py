@@ -21,6 +21,7 @@
 
 import logging
 import os
+import time
 
 import archivematicaFunctions
 
@@ -33,6 +34,65 @@ from django.conf import settings as django_settings
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
 
+class DirectoryIndex(object):
+    """Cache of the directory listings of a unit.
+
+    Listings are keyed by their path relative to the root of the unit, so they
+    survive the unit being moved between watched directories. A cached
+    listing is reused as long as the device, inode and mtime of its directory
+    are unchanged, which means that walking an unchanged unit only costs one
+    ``stat`` per directory instead of a ``listdir`` per directory plus a
+    ``stat`` per file.
+    """
+
+    # A listing taken less than this many seconds after the last modification
+    # of its directory is not trusted: a change within the same mtime tick
+    # (one second on some filesystems) would go unnoticed.
+    RACY_SECONDS = 2
+
+    def __init__(self):
+        # {relative directory: (signature, file names, subdirectory names)}
+        self.listings = {}
+
+    def walk(self, root):
+        """Yield ``(relative directory, file names)`` for every directory
+        under ``root``. Like ``os.walk``, unreadable directories are skipped
+        and symbolic links to directories are not followed."""
+        listings = {}
+        pending = [""]
+        while pending:
+            relative = pending.pop()
+            path = os.path.join(root, relative)
+            try:
+                stat = os.stat(path)
+                signature = (stat.st_dev, stat.st_ino, stat.st_mtime)
+                cached = self.listings.get(relative)
+                if cached is not None and cached[0] == signature:
+                    listing = cached
+                else:
+                    listing = self._list(path, signature, stat.st_mtime)
+            except OSError:
+                continue
+            listings[relative] = listing
+            _, files, subdirectories = listing
+            yield relative, files
+            pending.extend(os.path.join(relative, d) for d in subdirectories)
+        self.listings = listings
+
+    def _list(self, path, signature, mtime):
+        listed_at = time.time()
+        files, subdirectories = [], []
+        for name in os.listdir(path):
+            entry = os.path.join(path, name)
+            if not os.path.isdir(entry):
+                files.append(name)
+            elif not os.path.islink(entry):
+                subdirectories.append(name)
+        if listed_at - mtime < self.RACY_SECONDS:
+            signature = None
+        return signature, files, subdirectories
+
+
 class unit:
     """A class to inherit from, to over-ride methods, defininging a processing object at the Job level"""
 
@@ -41,33 +101,36 @@ class unit:
         self.UUID = UUID
 
     def reloadFileList(self):
-        """Match files to their UUID's via their location and the File table's currentLocation"""
+        """Match files to their UUID's via their location and the File table's currentLocation
+
+        Directory listings are cached on the unit between calls, see
+        ``DirectoryIndex``.
+        """
         self.fileList = {}
         # currentPath must be a string to return all filenames as bytestrings,
         # and to safely concatenate with other bytestrings
         currentPath = os.path.join(self.currentPath.replace("%sharedPath%", django_settings.SHARED_DIRECTORY, 1), "").encode('utf-8')
+        if getattr(self, "directoryIndex", None) is None:
+            self.directoryIndex = DirectoryIndex()
         try:
-            for directory, subDirectories, files in os.walk(currentPath):
-                directory = directory.replace(currentPath, self.pathString, 1)
+            for directory, files in self.directoryIndex.walk(currentPath):
                 for file_ in files:
-                    if self.pathString != directory:
-                        filePath = os.path.join(directory, file_)
-                    else:
-                        filePath = directory + file_
+                    filePath = self.pathString + os.path.join(directory, file_)
                     self.fileList[filePath] = unitFile(filePath, owningUnit=self)
 
             if self.unitType == "Transfer":
                 files = File.objects.filter(transfer_id=self.UUID)
             else:
                 files = File.objects.filter(sip_id=self.UUID)
-            for f in files:
-                currentlocation = archivematicaFunctions.unicodeToStr(f.currentlocation)
+            files = files.values_list("uuid", "currentlocation", "filegrpuse")
+            for fileUUID, currentlocation, filegrpuse in files.iterator():
+                currentlocation = archivematicaFunctions.unicodeToStr(currentlocation)
                 if currentlocation in self.fileList:
-                    self.fileList[currentlocation].UUID = f.uuid
-                    self.fileList[currentlocation].fileGrpUse = f.filegrpuse
+                    self.fileList[currentlocation].UUID = fileUUID
+                    self.fileList[currentlocation].fileGrpUse = filegrpuse
                 else:
                     LOGGER.warning('%s %s has file (%s) %s in the database, but file does not exist in the file system',
-                                   self.unitType, self.UUID, f.uuid, f.currentlocation)
+                                   self.unitType, self.UUID, fileUUID, currentlocation)
         except Exception:
             LOGGER.exception('Error reloading file list for %s', currentPath)
             exit(1)
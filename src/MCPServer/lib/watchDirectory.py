@@ -19,16 +19,36 @@
 # @subpackage MCPServer
 # @author Joseph Perry <joseph@artefactual.com>
 # @thanks to http://timgolden.me.uk/python/win32_how_do_i/watch_directory_for_changes.html
+"""Watches the watched directories for new files/directories to process.
+
+All the watched directories are served by a single ``WatchDirectoryDispatcher``
+thread. The dispatcher delegates change detection to a pluggable backend:
+
+  * ``PollingBackend`` lists every watched directory once per interval and
+    diffs the listings. It works on any filesystem, including NFS mounts that
+    are written to by other hosts (e.g. remote MCP Clients).
+
+  * ``InotifyBackend`` blocks on inotify events and reacts immediately to
+    entries created in, moved into, deleted from or moved out of a watched
+    directory. inotify only reports changes made through the local kernel, so
+    it should only be used when every writer of the shared directory runs on
+    the same host as MCPServer. It requires ``pyinotify``.
+"""
 import logging
 import os
-import time
 import threading
+import time
 
 from archivematicaFunctions import unicodeToStr
 from databaseFunctions import auto_close_db
 
 from utils import log_exceptions
 
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
 LOGGER = logging.getLogger('archivematica.mcp.server')
 
 
@@ -41,10 +61,7 @@ class archivematicaWatchDirectory:
                  variablesRemoved=None,
                  callBackFunctionRemoved=None,
                  alertOnDirectories=True,
-                 alertOnFiles=True,
-                 interval=1,
-                 threaded=True):
-        self.run = False
+                 alertOnFiles=True):
         self.variablesAdded = variablesAdded
         self.callBackFunctionAdded = callBackFunctionAdded
         self.variablesRemoved = variablesRemoved
@@ -52,43 +69,21 @@ class archivematicaWatchDirectory:
         self.directory = directory
         self.alertOnDirectories = alertOnDirectories
         self.alertOnFiles = alertOnFiles
-        self.interval = interval
 
         if not os.path.isdir(directory):
-            os.makedirs(directory, mode=770)
+            os.makedirs(directory, mode=0o770)
 
-        if threaded:
-            t = threading.Thread(target=self.start)
-            t.daemon = True
-            t.start()
-        else:
-            self.start()
+    def listdir(self):
+        return set(os.listdir(self.directory))
 
-    @log_exceptions
-    @auto_close_db
-    def start(self):
-        """Based on polling example: http://timgolden.me.uk/python/win32_how_do_i/watch_directory_for_changes.html"""
-        self.run = True
-        LOGGER.info('Watching directory %s (Files: %s)', self.directory, self.alertOnFiles)
-        before = dict([(f, None) for f in os.listdir(self.directory)])
-        while self.run:
-            time.sleep(self.interval)
-            after = dict([(f, None) for f in os.listdir(self.directory)])
-            added = [f for f in after if f not in before]
-            removed = [f for f in before if f not in after]
-            if added:
-                LOGGER.debug('Added %s', added)
-                for i in added:
-                    i = unicodeToStr(i)
-                    directory = unicodeToStr(self.directory)
-                    self.event(os.path.join(directory, i), self.variablesAdded, self.callBackFunctionAdded)
-            if removed:
-                LOGGER.debug('Removed %s', removed)
-                for i in removed:
-                    i = unicodeToStr(i)
-                    directory = unicodeToStr(self.directory)
-                    self.event(os.path.join(directory, i), self.variablesRemoved, self.callBackFunctionRemoved)
-            before = after
+    def added(self, name):
+        self.event(self._path(name), self.variablesAdded, self.callBackFunctionAdded)
+
+    def removed(self, name):
+        self.event(self._path(name), self.variablesRemoved, self.callBackFunctionRemoved)
+
+    def _path(self, name):
+        return os.path.join(unicodeToStr(self.directory), unicodeToStr(name))
 
     def event(self, path, variables, function):
         if not function:
@@ -99,5 +94,215 @@ class archivematicaWatchDirectory:
         if os.path.isfile(path) and self.alertOnFiles:
             function(*args)
 
+
+class PollingBackend(object):
+    """Detects changes by listing every watched directory once per interval."""
+
+    name = 'poll'
+
+    def __init__(self, interval=1):
+        self.interval = interval
+        self.listings = {}
+
+    def add(self, watched):
+        self.listings[watched] = watched.listdir()
+
+    def watched(self):
+        return list(self.listings)
+
+    def wait(self):
+        """Sleep one interval and return the ``(watched, added, removed)``
+        changes found since the previous call."""
+        time.sleep(self.interval)
+        return self.check()
+
+    def check(self):
+        """List every watched directory and diff it against the last listing."""
+        changes = []
+        for watched, before in self.listings.items():
+            try:
+                after = watched.listdir()
+            except OSError:
+                LOGGER.exception('Could not list watched directory %s', watched.directory)
+                continue
+            added = after - before
+            removed = before - after
+            if added or removed:
+                changes.append((watched, sorted(added), sorted(removed)))
+            self.listings[watched] = after
+        return changes
+
+    def close(self):
+        self.listings = {}
+
+
+class InotifyBackend(PollingBackend):
+    """Detects changes with inotify, waking up only when something happened.
+
+    Only the top level of each watched directory is monitored, which matches
+    what ``PollingBackend`` reports. The listings are kept up to date from the
+    events so that, if the kernel queue overflows and events are dropped, a
+    single rescan recovers the changes that were missed.
+    """
+
+    name = 'inotify'
+
+    # Entries appearing in or disappearing from a watched directory.
+    ADDED_MASK = (pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO) if pyinotify else 0
+    REMOVED_MASK = (pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM) if pyinotify else 0
+
+    def __init__(self, interval=1):
+        if pyinotify is None:
+            raise RuntimeError('pyinotify is not installed')
+        super(InotifyBackend, self).__init__(interval=interval)
+        self.watch_manager = pyinotify.WatchManager()
+        # The timeout bounds how long ``wait`` blocks so the dispatcher can
+        # notice that it has been stopped.
+        self.notifier = pyinotify.Notifier(
+            self.watch_manager,
+            default_proc_fun=self._process_event,
+            timeout=int(interval * 1000))
+        self.watched_by_wd = {}
+        self.changes = []
+        self.overflowed = False
+
+    def add(self, watched):
+        wdd = self.watch_manager.add_watch(
+            unicodeToStr(watched.directory),
+            self.ADDED_MASK | self.REMOVED_MASK,
+            quiet=False)
+        for wd in wdd.values():
+            self.watched_by_wd[wd] = watched
+        super(InotifyBackend, self).add(watched)
+
+    def _process_event(self, event):
+        if event.mask & pyinotify.IN_Q_OVERFLOW:
+            self.overflowed = True
+            return
+        watched = self.watched_by_wd.get(event.wd)
+        if watched is None or not event.name:
+            return
+        listing = self.listings[watched]
+        if event.mask & self.ADDED_MASK:
+            listing.add(event.name)
+            self.changes.append((watched, [event.name], []))
+        elif event.mask & self.REMOVED_MASK:
+            listing.discard(event.name)
+            self.changes.append((watched, [], [event.name]))
+
+    def wait(self):
+        """Block until events are available (or the interval elapses) and
+        return the ``(watched, added, removed)`` changes, in arrival order."""
+        if self.notifier.check_events():
+            self.notifier.read_events()
+            self.notifier.process_events()
+        changes, self.changes = self.changes, []
+        if self.overflowed:
+            LOGGER.warning('inotify event queue overflowed, rescanning watched directories')
+            self.overflowed = False
+            changes.extend(self.check())
+        return changes
+
+    def close(self):
+        self.notifier.stop()
+        self.watched_by_wd = {}
+        super(InotifyBackend, self).close()
+
+
+BACKENDS = {
+    PollingBackend.name: PollingBackend,
+    InotifyBackend.name: InotifyBackend,
+}
+
+
+def get_backend(name, interval=1):
+    """Instantiate the backend called ``name``, falling back to polling when
+    the backend is unknown or can't be set up on this system."""
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        LOGGER.warning('Unknown watched directory backend %r, using polling', name)
+        backend_class = PollingBackend
+    try:
+        return backend_class(interval=interval)
+    except Exception:
+        LOGGER.warning('Watched directory backend %r is not available, using polling',
+                       name, exc_info=True)
+        return PollingBackend(interval=interval)
+
+
+class WatchDirectoryDispatcher(object):
+    """Serves every watched directory from one background thread."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.run = False
+        self.thread = None
+
+    def watch(self, directory, **kwargs):
+        """Start watching ``directory``. Keyword arguments are passed to
+        ``archivematicaWatchDirectory``."""
+        watched = archivematicaWatchDirectory(directory, **kwargs)
+        try:
+            self.backend.add(watched)
+        except Exception:
+            if type(self.backend) is PollingBackend:
+                raise
+            # E.g. inotify watch limit reached; move everything to polling.
+            LOGGER.warning('Could not watch %s with %s, switching to polling',
+                           directory, self.backend.name, exc_info=True)
+            self._fallback_to_polling()
+            self.backend.add(watched)
+        LOGGER.info('Watching directory %s (Files: %s)', directory, watched.alertOnFiles)
+        return watched
+
+    def _fallback_to_polling(self):
+        previous = self.backend
+        self.backend = PollingBackend(interval=previous.interval)
+        for watched in previous.watched():
+            self.backend.add(watched)
+        previous.close()
+
+    def start(self):
+        self.run = True
+        self.thread = threading.Thread(target=self.loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @log_exceptions
+    @auto_close_db
+    def loop(self):
+        LOGGER.info('Watched directory dispatcher running (backend: %s)', self.backend.name)
+        while self.run:
+            try:
+                changes = self.backend.wait()
+            except Exception:
+                LOGGER.exception('Error waiting for watched directory changes')
+                time.sleep(self.backend.interval)
+                continue
+            self.dispatch(changes)
+        self.backend.close()
+
+    def dispatch(self, changes):
+        """Fire the callbacks of each watched directory for its changes.
+
+        Callbacks run in the dispatcher thread so they are expected to hand
+        any real work off, e.g. to the ``Executor``.
+        """
+        for watched, added, removed in changes:
+            if added:
+                LOGGER.debug('Added %s', added)
+                for name in added:
+                    self._notify(watched.added, name)
+            if removed:
+                LOGGER.debug('Removed %s', removed)
+                for name in removed:
+                    self._notify(watched.removed, name)
+
+    def _notify(self, callback, name):
+        try:
+            callback(name)
+        except Exception:
+            LOGGER.exception('Watched directory callback failed for %s', name)
+
     def stop(self):
         self.run = False
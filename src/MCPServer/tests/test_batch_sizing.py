@@ -0,0 +1,83 @@
+import datetime
+import uuid
+
+import pytest
+from django.utils import timezone
+
+import batch_sizing
+from batch_sizing import BatchSizer
+from main.models import Job, Task
+
+
+@pytest.fixture
+def settings(settings):
+    batch_sizing.clear_estimates()
+    settings.BATCH_TARGET_DURATION = 60
+    return settings
+
+
+def _task_group(execute, count, seconds):
+    job = Job.objects.create(jobuuid=str(uuid.uuid4()), createdtime=timezone.now())
+    starttime = timezone.now()
+    for _ in range(count):
+        Task.objects.create(
+            taskuuid=str(uuid.uuid4()), job=job, execution=execute,
+            createdtime=starttime, starttime=starttime,
+            endtime=starttime + datetime.timedelta(seconds=seconds))
+
+
+@pytest.mark.django_db
+def test_sizes_without_estimate(settings):
+    sizer = BatchSizer("normalize_v1.0", 128)
+
+    assert [sizer.size(remaining) for remaining in (1000, 100, 1)] == [128, 128, 128]
+
+
+@pytest.mark.django_db
+def test_sizes_from_history(settings):
+    # 10 seconds per file.
+    _task_group("normalize_v1.0", 4, 40)
+    _task_group("normalize_v1.0", 2, 20)
+    _task_group("identify_file_format_v0.0", 128, 1)
+
+    sizer = BatchSizer("normalize_v1.0", 128, seconds_per_file=0.01)
+
+    assert sizer.target_size == 6
+    # Groups shrink toward the end of the unit.
+    assert [sizer.size(remaining) for remaining in (100, 20, 8, 1)] == [6, 5, 2, 1]
+
+
+@pytest.mark.django_db
+def test_quick_commands_use_large_groups(settings):
+    _task_group("identify_file_format_v0.0", 128, 1)
+
+    sizer = BatchSizer("identify_file_format_v0.0", 128)
+
+    assert [sizer.size(remaining) for remaining in (1000, 200, 1)] == [128, 128, 128]
+
+
+@pytest.mark.django_db
+def test_sizes_from_workflow_estimate(settings):
+    sizer = BatchSizer("normalize_v1.0", 128, seconds_per_file=2)
+
+    assert sizer.target_size == 30
+    assert [sizer.size(remaining) for remaining in (1000, 100, 40, 1)] == [30, 25, 10, 7]
+
+
+@pytest.mark.django_db
+def test_dynamic_sizing_can_be_disabled(settings):
+    settings.BATCH_TARGET_DURATION = 0
+
+    sizer = BatchSizer("normalize_v1.0", 128, seconds_per_file=2)
+
+    assert sizer.size(100) == 128
+
+
+@pytest.mark.django_db
+def test_estimates_are_cached(settings, mocker):
+    history = mocker.spy(batch_sizing, "_seconds_per_file_from_history")
+
+    batch_sizing.get_seconds_per_file("normalize_v1.0")
+    batch_sizing.get_seconds_per_file("normalize_v1.0")
+
+    assert history.call_count == 1
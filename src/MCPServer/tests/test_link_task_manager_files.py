@@ -0,0 +1,88 @@
+import pytest
+
+from dicts import ReplacementDict
+import linkTaskManagerFiles
+from linkTaskManagerFiles import linkTaskManagerFiles as LinkTaskManagerFiles
+from taskGroup import TaskGroup
+
+
+def _unit(mocker, count):
+    files = {}
+    for idx in range(count):
+        path = "%SIPDirectory%objects/file-{}.jpg".format(idx)
+        file_unit = mocker.Mock()
+        file_unit.getReplacementDic.return_value = ReplacementDict({
+            "%relativeLocation%": path,
+            "%fileUUID%": "file-{}".format(idx),
+        })
+        files[path] = file_unit
+    return mocker.Mock(
+        UUID="unit-uuid", unitType="SIP", currentPath="%SIPDirectory%",
+        pathString="%SIPDirectory%", fileList=files,
+        **{"getReplacementDic.return_value": ReplacementDict()})
+
+
+def _job_chain_link(mocker):
+    return mocker.Mock(passVar=None, **{"link.config": {
+        "filter_file_end": None,
+        "filter_file_start": None,
+        "filter_subdir": None,
+        "stdout_file": None,
+        "stderr_file": None,
+        "execute": "normalize_v1.0",
+        "arguments": '"%fileUUID%"',
+    }})
+
+
+@pytest.fixture
+def run_task_group(mocker):
+    mocker.patch.object(linkTaskManagerFiles, "BATCH_SIZE", 2)
+    mocker.patch.object(TaskGroup, "logTaskCreatedSQL")
+    return mocker.patch("taskGroupRunner.TaskGroupRunner.runTaskGroup")
+
+
+@pytest.mark.django_db
+def test_task_groups_are_dispatched_as_soon_as_they_are_full(mocker, run_task_group):
+    sizes_when_dispatched = []
+
+    def runTaskGroup(task_group, callback):
+        sizes_when_dispatched.append(task_group.count())
+        # The task group was persisted before being sent off.
+        assert task_group.logTaskCreatedSQL.called
+
+    run_task_group.side_effect = runTaskGroup
+    job_chain_link = _job_chain_link(mocker)
+
+    manager = LinkTaskManagerFiles(job_chain_link, _unit(mocker, 5))
+
+    assert sizes_when_dispatched == [2, 2, 1]
+    assert len(manager.taskGroups) == 3
+    assert manager.clearToNextLink
+    assert not job_chain_link.linkProcessingComplete.called
+
+
+@pytest.mark.django_db
+def test_task_groups_finishing_during_dispatch(mocker, run_task_group):
+    # Every task group finishes as soon as it is submitted.
+    def runTaskGroup(task_group, callback):
+        task_group.tasks()[0].results["exitCode"] = 1
+        callback(task_group)
+
+    run_task_group.side_effect = runTaskGroup
+    mocker.patch.object(TaskGroup, "write_output")
+    job_chain_link = _job_chain_link(mocker)
+
+    manager = LinkTaskManagerFiles(job_chain_link, _unit(mocker, 3))
+
+    assert manager.taskGroups == {}
+    job_chain_link.linkProcessingComplete.assert_called_once_with(1, None)
+
+
+@pytest.mark.django_db
+def test_empty_file_list(mocker, run_task_group):
+    job_chain_link = _job_chain_link(mocker)
+
+    LinkTaskManagerFiles(job_chain_link, _unit(mocker, 0))
+
+    assert not run_task_group.called
+    job_chain_link.linkProcessingComplete.assert_called_once_with(0)
@@ -1,3 +1,8 @@
+import uuid
+
+import pytest
+
+from main.models import Job, Task
 from taskGroup import TaskGroup
 
 
@@ -18,3 +23,28 @@ def test__write_file_to_disk(mocker):
     fp = open_.return_value.__enter__.return_value
     fp.write.assert_called_with("contents")
     chmod.assert_called_with("path", 488)
+
+
+@pytest.mark.django_db
+def test_logTaskCreatedSQL(mocker, settings):
+    settings.TASK_INSERT_BATCH_SIZE = 2
+    job = Job.objects.create(jobuuid=str(uuid.uuid4()), createdtime="2019-01-01T00:00:00Z")
+    manager = mocker.Mock(execute="normalize_v1.0", **{"jobChainLink.UUID": job.jobuuid})
+    bulk_create = mocker.spy(Task.objects, "bulk_create")
+
+    tg = TaskGroup(manager, u"normalize_v1.0")
+    for idx in range(5):
+        tg.addTask("args %d" % idx, None, None, commandReplacementDic={
+            "%fileUUID%": "file-%d" % idx,
+            "%relativeLocation%": "%%SIPDirectory%%objects/file-%d.jpg" % idx,
+        })
+    tg.logTaskCreatedSQL()
+
+    assert bulk_create.call_count == 1
+    assert bulk_create.call_args[1] == {"batch_size": 2}
+    tasks = Task.objects.filter(job=job).order_by("arguments")
+    assert [(t.fileuuid, t.filename, t.arguments, t.execution) for t in tasks] == [
+        ("file-%d" % idx, "file-%d.jpg" % idx, "args %d" % idx, "normalize_v1.0")
+        for idx in range(5)
+    ]
+    assert [t.taskuuid for t in tasks] == [t.UUID for t in tg.tasks()]
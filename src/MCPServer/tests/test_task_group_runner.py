@@ -0,0 +1,192 @@
+import gearman
+import pytest
+
+import task_payloads
+from taskGroup import TaskGroup
+from taskGroupRunner import TaskGroupRunner
+
+
+class FakeJobRequest(object):
+    def __init__(self, unique):
+        self.gearman_job = self.job = gearman.job.GearmanJob(
+            connection=None, handle=None, task="task", unique=unique, data="")
+        self.state = gearman.JOB_CREATED
+        self.status = {}
+        self.timed_out = False
+        self.result = None
+
+    @property
+    def complete(self):
+        return self.state in (gearman.JOB_COMPLETE, gearman.JOB_FAILED)
+
+
+class FakeGearmanClient(object):
+    """Completes the given requests on the first poll, like a server pushing
+    WORK_COMPLETE packets."""
+
+    def __init__(self):
+        self.connection_list = []
+        self.request_to_rotating_connection_queue = {}
+        self.submitted = []
+        self.to_complete = {}
+        self.polls = 0
+
+    def submit_job(self, task, data, unique, **kwargs):
+        request = FakeJobRequest(unique)
+        request.priority = kwargs.get("priority")
+        self.submitted.append(request)
+        self.request_to_rotating_connection_queue[request] = None
+        return request
+
+    def poll_connections_until_stopped(self, connections, callback_fxn, timeout=None):
+        self.polls += 1
+        for request in self.submitted:
+            if request.job.unique in self.to_complete:
+                request.state = gearman.JOB_COMPLETE
+                request.result = self.to_complete[request.job.unique]
+        return callback_fxn(True)
+
+    def get_job_status(self, request):
+        raise AssertionError("Job status should not be polled")
+
+
+@pytest.fixture
+def runner(mocker, settings):
+    settings.LIMIT_TASK_THREADS = 1
+    settings.MAX_TASK_GROUPS_PER_UNIT = 16
+    mocker.patch("taskGroupRunner.Gauge")
+    runner = TaskGroupRunner()
+    mocker.patch.object(TaskGroupRunner, "_instance", runner)
+    mocker.patch.object(runner.pool, "apply_async", side_effect=lambda fn, args: fn(*args))
+    return runner
+
+
+def _task_group(mocker, unit_uuid="unit-uuid", priority=TaskGroup.PRIORITY_NORMAL):
+    manager = mocker.Mock(**{"unit.UUID": unit_uuid})
+    task_group = TaskGroup(manager, u"echo", priority)
+    task_group.addTask("arguments", None, None)
+    return task_group
+
+
+def test_completed_jobs_fire_callbacks_without_status_polling(mocker, runner):
+    gm_client = FakeGearmanClient()
+    task_group = _task_group(mocker)
+    task = task_group.tasks()[0]
+    callback = mocker.Mock()
+    runner.submit(TaskGroupRunner.TaskGroupJob(task_group, callback))
+
+    gm_client.to_complete[task_group.UUID] = task_payloads.dumps(
+        {"task_results": {task.UUID: {"exitCode": 3, "stdout": "out"}}})
+    runner._poll(gm_client)
+
+    callback.assert_called_once_with(task_group)
+    assert task.results["exitCode"] == 3
+    assert task.results["stdout"] == "out"
+    assert runner.running_gearman_jobs == []
+    assert gm_client.request_to_rotating_connection_queue == {}
+
+
+def test_lost_connection_fails_task_group(mocker, runner):
+    gm_client = FakeGearmanClient()
+    task_group = _task_group(mocker)
+    callback = mocker.Mock()
+    runner.submit(TaskGroupRunner.TaskGroupJob(task_group, callback))
+
+    runner._poll(gm_client)
+    assert not callback.called
+    assert len(runner.running_gearman_jobs) == 1
+
+    # The client resets in-flight requests when their connection is lost.
+    gm_client.submitted[0].state = gearman.client.JOB_UNKNOWN
+    runner._poll(gm_client)
+
+    callback.assert_called_once_with(task_group)
+    assert task_group.tasks()[0].results["exitCode"] == 1
+
+
+def test_idle_runner_does_not_poll_gearman(mocker, runner):
+    gm_client = FakeGearmanClient()
+    mocker.patch.object(TaskGroupRunner, "POLL_DELAY_SECONDS", 0)
+
+    runner._poll(gm_client)
+
+    assert gm_client.polls == 0
+
+
+def _submit_task_groups(mocker, runner, units, priority=TaskGroup.PRIORITY_NORMAL):
+    """Submit a task group for each unit UUID, or (unit UUID, priority)
+    pair, in ``units``.  Return the unit UUIDs by task group UUID."""
+    result = {}
+    for unit in units:
+        unit_uuid, priority = unit if isinstance(unit, tuple) else (unit, priority)
+        task_group = _task_group(mocker, unit_uuid, priority)
+        runner.submit(TaskGroupRunner.TaskGroupJob(task_group, mocker.Mock()))
+        result[task_group.UUID] = unit_uuid
+    return result
+
+
+def test_units_take_turns(mocker, runner, settings):
+    settings.MAX_TASK_GROUPS_PER_UNIT = 2
+    gm_client = FakeGearmanClient()
+    units = _submit_task_groups(mocker, runner, ["big"] * 5 + ["small"])
+
+    runner._submit_pending_task_group_jobs(gm_client)
+
+    assert [units[request.job.unique] for request in gm_client.submitted] == ["big", "small", "big"]
+    assert runner._queued_task_groups_by_unit() == {"big": 3}
+    runner.queuedTaskGroupsGauge.labels.assert_any_call("big")
+
+    # A finished task group makes room for the next one of its unit.
+    gm_client.to_complete[gm_client.submitted[0].job.unique] = task_payloads.dumps({"task_results": {}})
+    runner._poll(gm_client)
+    runner._submit_pending_task_group_jobs(gm_client)
+
+    assert [units[request.job.unique] for request in gm_client.submitted] == ["big", "small", "big", "big"]
+    assert runner._queued_task_groups_by_unit() == {"big": 2}
+
+
+def test_higher_priorities_are_submitted_first(mocker, runner, settings):
+    settings.MAX_TASK_GROUPS_PER_UNIT = 1
+    gm_client = FakeGearmanClient()
+    units = _submit_task_groups(mocker, runner, [
+        ("bulk", TaskGroup.PRIORITY_BULK),
+        ("normal", TaskGroup.PRIORITY_NORMAL),
+        ("normal", TaskGroup.PRIORITY_NORMAL),
+        ("normal", TaskGroup.PRIORITY_INTERACTIVE),
+        ("normal", TaskGroup.PRIORITY_INTERACTIVE),
+    ])
+
+    runner._submit_pending_task_group_jobs(gm_client)
+
+    # Interactive task groups are never held back.
+    assert [units[request.job.unique] for request in gm_client.submitted] == ["normal", "normal", "bulk"]
+    assert [request.priority for request in gm_client.submitted] == [
+        gearman.PRIORITY_HIGH, gearman.PRIORITY_HIGH, gearman.PRIORITY_LOW]
+    assert runner._queued_task_groups_by_unit() == {"normal": 2}
+
+
+def test_running_tasks_progress(mocker, runner):
+    gm_client = FakeGearmanClient()
+    for _ in range(2):
+        task_group = _task_group(mocker)
+        task_group.addTask("arguments", None, None)
+        runner.submit(TaskGroupRunner.TaskGroupJob(task_group, mocker.Mock()))
+    runner._submit_pending_task_group_jobs(gm_client)
+
+    # MCP Client recorded the results of one task of the first job.
+    gm_client.submitted[0].status = {"numerator": 1, "denominator": 2}
+
+    assert runner._running_tasks_progress() == (1, 4)
+
+
+def test_undecodable_results_fail_task_group(mocker, runner):
+    gm_client = FakeGearmanClient()
+    task_group = _task_group(mocker)
+    callback = mocker.Mock()
+    runner.submit(TaskGroupRunner.TaskGroupJob(task_group, callback))
+
+    gm_client.to_complete[task_group.UUID] = "(dp0\nS'task_results'\np1\n(dp2\ns."
+    runner._poll(gm_client)
+
+    callback.assert_called_once_with(task_group)
+    assert task_group.tasks()[0].results["exitCode"] == 1
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from main.models import File, SIP
+from unit import DirectoryIndex
+from unitFile import unitFile
+from unitSIP import unitSIP
+
+SIP_UUID = "c4f7a2f4-1c5b-4f3a-9e3e-1b6d0e0b5a11"
+
+
+def _make_sip(tmpdir):
+    sip_dir = tmpdir.mkdir("sip")
+    sip_dir.mkdir("objects").mkdir("sub").join("b.txt").write("b")
+    sip_dir.join("objects", "a.txt").write("a")
+    sip_dir.mkdir("logs")
+    return sip_dir
+
+
+def _old(path):
+    # Make the listing of ``path`` trustworthy for the cache.
+    os.utime(str(path), (0, 0))
+
+
+@pytest.mark.django_db
+def test_reloadFileList(tmpdir, settings):
+    settings.SHARED_DIRECTORY = str(tmpdir) + "/"
+    _make_sip(tmpdir)
+    sip = SIP.objects.create(uuid=SIP_UUID, currentpath="%sharedPath%sip/")
+    File.objects.create(
+        uuid="2b2a5e89-2c4b-4d3c-a1d5-1f0c1c5b9a22", sip=sip,
+        currentlocation="%SIPDirectory%objects/a.txt", filegrpuse="original")
+    File.objects.create(
+        uuid="7d6b2a4e-8f0e-4b7a-9f3c-5c2e8a1d4b33", sip=sip,
+        currentlocation="%SIPDirectory%objects/missing.txt")
+    unit = unitSIP("%sharedPath%sip/", SIP_UUID)
+
+    unit.reloadFileList()
+
+    assert sorted(unit.fileList) == [
+        "%SIPDirectory%objects/a.txt",
+        "%SIPDirectory%objects/sub/b.txt",
+    ]
+    a = unit.fileList["%SIPDirectory%objects/a.txt"]
+    assert (a.UUID, a.fileGrpUse, a.owningUnit) == (
+        "2b2a5e89-2c4b-4d3c-a1d5-1f0c1c5b9a22", "original", unit)
+    b = unit.fileList["%SIPDirectory%objects/sub/b.txt"]
+    assert (b.UUID, b.fileGrpUse) == ("None", "None")
+
+
+def test_directory_index_reuses_unchanged_listings(tmpdir, mocker):
+    sip_dir = _make_sip(tmpdir)
+    for path in (sip_dir, sip_dir.join("objects"), sip_dir.join("objects", "sub"), sip_dir.join("logs")):
+        _old(path)
+    index = DirectoryIndex()
+    root = str(sip_dir) + "/"
+
+    first = sorted(index.walk(root))
+    assert first == [
+        ("", []),
+        ("logs", []),
+        ("objects", ["a.txt"]),
+        ("objects/sub", ["b.txt"]),
+    ]
+
+    listdir = mocker.spy(os, "listdir")
+    assert sorted(index.walk(root)) == first
+    assert listdir.call_count == 0
+
+    # Only the modified directory is listed again.
+    sip_dir.join("objects", "c.txt").write("c")
+    walked = dict(index.walk(root))
+    assert sorted(walked["objects"]) == ["a.txt", "c.txt"]
+    assert listdir.call_count == 1
+
+
+def test_directory_index_does_not_trust_recent_listings(tmpdir, mocker):
+    sip_dir = _make_sip(tmpdir)
+    index = DirectoryIndex()
+    root = str(sip_dir) + "/"
+    list(index.walk(root))
+
+    listdir = mocker.spy(os, "listdir")
+    list(index.walk(root))
+    assert listdir.call_count == 4
+
+
+def test_unit_file_has_no_instance_dict():
+    f = unitFile("%SIPDirectory%objects/a.txt")
+    assert not hasattr(f, "__dict__")
+    assert f.fileList == {"%SIPDirectory%objects/a.txt": f}
+    assert f.pathString == ""
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+import watchDirectory
+from watchDirectory import (
+    InotifyBackend,
+    PollingBackend,
+    WatchDirectoryDispatcher,
+    get_backend,
+)
+
+
+def _dispatcher(backend, tmpdir, only_dirs=False):
+    added, removed = [], []
+    dispatcher = WatchDirectoryDispatcher(backend)
+    dispatcher.watch(
+        str(tmpdir),
+        variablesAdded=("added",),
+        callBackFunctionAdded=lambda path, tag: added.append(os.path.basename(path)),
+        variablesRemoved=("removed",),
+        callBackFunctionRemoved=lambda path, tag: removed.append(os.path.basename(path)),
+        alertOnFiles=not only_dirs)
+    return dispatcher, added, removed
+
+
+def test_polling_backend_reports_added_entries(tmpdir):
+    tmpdir.join("existing").mkdir()
+    dispatcher, added, _ = _dispatcher(PollingBackend(interval=0), tmpdir)
+
+    tmpdir.join("transfer").mkdir()
+    tmpdir.join("package.zip").write("")
+    dispatcher.dispatch(dispatcher.backend.wait())
+
+    assert added == ["package.zip", "transfer"]
+
+    # Nothing changed since the last check.
+    dispatcher.dispatch(dispatcher.backend.wait())
+    assert added == ["package.zip", "transfer"]
+
+
+def test_polling_backend_ignores_files_when_only_dirs(tmpdir):
+    dispatcher, added, _ = _dispatcher(PollingBackend(interval=0), tmpdir, only_dirs=True)
+
+    tmpdir.join("transfer").mkdir()
+    tmpdir.join("package.zip").write("")
+    dispatcher.dispatch(dispatcher.backend.wait())
+
+    assert added == ["transfer"]
+
+
+def test_dispatcher_survives_failing_callback(tmpdir):
+    dispatcher = WatchDirectoryDispatcher(PollingBackend(interval=0))
+    calls = []
+
+    def callback(path):
+        calls.append(path)
+        raise Exception("boom")
+
+    dispatcher.watch(str(tmpdir), variablesAdded=(), callBackFunctionAdded=callback)
+    tmpdir.join("a").mkdir()
+    tmpdir.join("b").mkdir()
+    dispatcher.dispatch(dispatcher.backend.wait())
+
+    assert len(calls) == 2
+
+
+def test_get_backend_falls_back_to_polling(mocker):
+    assert isinstance(get_backend("unknown"), PollingBackend)
+
+    mocker.patch.object(watchDirectory, "pyinotify", None)
+    backend = get_backend("inotify")
+    assert type(backend) is PollingBackend
+
+
+@pytest.mark.skipif(watchDirectory.pyinotify is None, reason="pyinotify is not installed")
+def test_inotify_backend_reports_added_and_removed_entries(tmpdir):
+    dispatcher, added, removed = _dispatcher(InotifyBackend(interval=0.1), tmpdir)
+
+    tmpdir.join("transfer").mkdir()
+    dispatcher.dispatch(dispatcher.backend.wait())
+    assert added == ["transfer"]
+
+    tmpdir.join("transfer").move(tmpdir.join("renamed"))
+    dispatcher.dispatch(dispatcher.backend.wait())
+    assert added == ["transfer", "renamed"]
+
+    dispatcher.backend.close()
+
+
+@pytest.mark.skipif(watchDirectory.pyinotify is None, reason="pyinotify is not installed")
+def test_inotify_backend_rescans_after_overflow(tmpdir):
+    backend = InotifyBackend(interval=0.1)
+    dispatcher, added, _ = _dispatcher(backend, tmpdir)
+
+    tmpdir.join("transfer").mkdir()
+    # Pretend the kernel dropped the events.
+    backend.overflowed = True
+    backend.notifier.check_events = lambda: False
+    dispatcher.dispatch(backend.wait())
+
+    assert added == ["transfer"]
+    backend.close()
@@ -20,16 +20,19 @@
 # @author Joseph Perry <joseph@artefactual.com>
 from __future__ import print_function
 
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 import logging
 import string
 import sys
 import random
+import threading
 import time
 import uuid
 
-from django.db import close_old_connections
-from django.db.models import Q
+from django.db import close_old_connections, transaction
+from django.db.models import Case, Model, Q, Value, When
 from django.utils import six, timezone
 from main.models import (
     Agent, Derivation, Event, File, FPCommandOutput,
@@ -37,6 +40,14 @@ from main.models import (
 
 LOGGER = logging.getLogger('archivematica.common')
 
+# Number of rows inserted by each query when a write buffer is flushed.
+BULK_CREATE_BATCH_SIZE = 500
+# Number of rows updated by each query when a write buffer is flushed. Each
+# row takes a few parameters per field updated.
+BULK_UPDATE_BATCH_SIZE = 100
+
+_write_buffers = threading.local()
+
 
 def auto_close_db(f):
     """Decorator to ensure the db connection is closed when the function returns."""
@@ -49,6 +60,153 @@ def auto_close_db(f):
     return wrapper
 
 
+class WriteBuffer(object):
+    """
+    Rows to be written to the database in bulk.
+
+    While a buffer is active (see ``buffered_writes``), the rows created by
+    ``insertIntoEvents``, ``insertIntoDerivations``,
+    ``insertIntoFPCommandOutput`` and ``create_object``, and the updates made
+    by ``update_object``, are kept in the buffer and written with a few bulk
+    queries when it is flushed. Buffered rows can't be read back from the
+    database before the buffer is flushed.
+    """
+
+    def __init__(self):
+        # Model instances to create, by model.
+        self.objects = OrderedDict()
+        # Agents of the buffered events, by event UUID.
+        self.event_agents = OrderedDict()
+        # Fields to update, by model and primary key.
+        self.updates = OrderedDict()
+        # Results of lookups that don't change during a batch.
+        self.cache = {}
+
+    def add(self, obj):
+        self.objects.setdefault(type(obj), []).append(obj)
+
+    def add_event(self, event, agents):
+        self.add(event)
+        if agents:
+            self.event_agents.setdefault(event.event_id, []).extend(agents)
+
+    def update(self, model, pk, **fields):
+        values = self.updates.setdefault(model, OrderedDict()).setdefault(pk, {})
+        for name, value in fields.items():
+            field = model._meta.get_field(name)
+            if field.rel and isinstance(value, Model):
+                # Updates are made with expressions, which need the value of
+                # the column rather than the related instance.
+                name, value = field.attname, getattr(value, field.rel.field_name)
+            values[name] = value
+
+    def _models_in_dependency_order(self):
+        """Sort the buffered models so that rows are created after the rows
+        they have foreign keys to."""
+        pending = list(self.objects)
+        ordered = []
+        while pending:
+            for model in pending:
+                targets = [field.rel.to for field in model._meta.fields if field.rel]
+                if not any(target in pending and target is not model for target in targets):
+                    break
+            pending.remove(model)
+            ordered.append(model)
+        return ordered
+
+    def _flush_updates(self, model, updates):
+        # Rows updating the same fields are updated together, each field set
+        # with a CASE expression unless it gets the same value in every row.
+        groups = OrderedDict()
+        for pk, fields in updates.items():
+            groups.setdefault(tuple(sorted(fields)), []).append((pk, fields))
+        for names, rows in groups.items():
+            for start in range(0, len(rows), BULK_UPDATE_BATCH_SIZE):
+                batch = rows[start:start + BULK_UPDATE_BATCH_SIZE]
+                values = {}
+                for name in names:
+                    distinct = set(fields[name] for _, fields in batch)
+                    if len(distinct) == 1:
+                        values[name] = distinct.pop()
+                    else:
+                        values[name] = Case(
+                            *[When(pk=pk, then=Value(fields[name])) for pk, fields in batch],
+                            output_field=model._meta.get_field(name))
+                model.objects.filter(pk__in=[pk for pk, _ in batch]).update(**values)
+
+    def flush(self):
+        """Write the buffered rows and empty the buffer."""
+        with transaction.atomic():
+            for model in self._models_in_dependency_order():
+                model.objects.bulk_create(self.objects[model], batch_size=BULK_CREATE_BATCH_SIZE)
+            if self.event_agents:
+                # bulk_create doesn't set the primary keys of the events.
+                event_uuids = list(self.event_agents)
+                event_pks = {}
+                for start in range(0, len(event_uuids), BULK_CREATE_BATCH_SIZE):
+                    event_pks.update(Event.objects.filter(
+                        event_id__in=event_uuids[start:start + BULK_CREATE_BATCH_SIZE],
+                    ).values_list('event_id', 'pk'))
+                Through = Event.agents.through
+                Through.objects.bulk_create([
+                    Through(event_id=event_pks[event_uuid], agent_id=agent)
+                    for event_uuid, agents in self.event_agents.items()
+                    for agent in agents
+                ], batch_size=BULK_CREATE_BATCH_SIZE)
+            for model, updates in self.updates.items():
+                self._flush_updates(model, updates)
+        self.objects.clear()
+        self.event_agents.clear()
+        self.updates.clear()
+
+
+def get_write_buffer():
+    """Return the active ``WriteBuffer`` of the current thread, or None."""
+    return getattr(_write_buffers, 'active', None)
+
+
+@contextmanager
+def buffered_writes():
+    """
+    Buffer the database writes of the block, and flush them when it ends.
+
+    This is meant to wrap the processing of a whole batch of jobs by a client
+    script, inside the transaction of the batch. Nested blocks share the
+    buffer of the outermost one. If the block raises an exception, the
+    buffered rows are discarded.
+    """
+    if get_write_buffer() is not None:
+        yield get_write_buffer()
+        return
+    _write_buffers.active = buffer_ = WriteBuffer()
+    try:
+        yield buffer_
+        buffer_.flush()
+    finally:
+        _write_buffers.active = None
+
+
+def create_object(model, **kwargs):
+    """Create a ``model`` row, or add it to the active write buffer."""
+    obj = model(**kwargs)
+    buffer_ = get_write_buffer()
+    if buffer_ is None:
+        obj.save(force_insert=True)
+    else:
+        buffer_.add(obj)
+    return obj
+
+
+def update_object(model, pk, **fields):
+    """Update the ``model`` row with primary key ``pk``, or add the update to
+    the active write buffer."""
+    buffer_ = get_write_buffer()
+    if buffer_ is None:
+        model.objects.filter(pk=pk).update(**fields)
+    else:
+        buffer_.update(model, pk, **fields)
+
+
 def getUTCDate():
     """Returns a timezone-aware representation of the current datetime in UTC."""
     return timezone.now()
@@ -125,6 +283,12 @@ def getAMAgentsForFile(fileUUID):
         LOGGER.warning('File with UUID %s does not exist in database; unable to fetch Agents', fileUUID)
         return []
 
+    # The agents of the files of a unit don't change during a batch.
+    buffer_ = get_write_buffer()
+    cache_key = ('agents', f.sip_id, f.transfer_id)
+    if buffer_ is not None and cache_key in buffer_.cache:
+        return list(buffer_.cache[cache_key])
+
     # Fetch Agent for the User
     if f.sip:
         try:
@@ -144,6 +308,8 @@ def getAMAgentsForFile(fileUUID):
     # Fetch other Archivematica Agents
     am_agents = Agent.objects.filter(Q(identifiertype='repository code') | Q(identifiertype='preservation system')).values_list('pk', flat=True)
     agents.extend(am_agents)
+    if buffer_ is not None:
+        buffer_.cache[cache_key] = list(agents)
     return agents
 
 
@@ -177,7 +343,7 @@ def insertIntoEvents(fileUUID, eventIdentifierUUID="", eventType="",
     if not eventIdentifierUUID:
         eventIdentifierUUID = str(uuid.uuid4())
 
-    event = Event.objects.create(
+    event = Event(
         event_id=eventIdentifierUUID,
         file_uuid_id=fileUUID,
         event_type=eventType,
@@ -186,6 +352,11 @@ def insertIntoEvents(fileUUID, eventIdentifierUUID="", eventType="",
         event_outcome=eventOutcome,
         event_outcome_detail=eventOutcomeDetailNote
     )
+    buffer_ = get_write_buffer()
+    if buffer_ is not None:
+        buffer_.add_event(event, agents)
+        return
+    event.save(force_insert=True)
     # Splat agents list into multiple arguments
     event.agents.add(*agents)
 
@@ -204,9 +375,9 @@ def insertIntoDerivations(sourceFileUUID, derivedFileUUID, relatedEventUUID=None
     if not derivedFileUUID:
         raise ValueError("derivedFileUUID must be specified")
 
-    Derivation.objects.create(source_file_id=sourceFileUUID,
-                              derived_file_id=derivedFileUUID,
-                              event_id=relatedEventUUID)
+    create_object(Derivation, source_file_id=sourceFileUUID,
+                  derived_file_id=derivedFileUUID,
+                  event_id=relatedEventUUID)
 
 
 def insertIntoFPCommandOutput(fileUUID="", fitsXMLString="", ruleUUID=""):
@@ -219,8 +390,8 @@ def insertIntoFPCommandOutput(fileUUID="", fitsXMLString="", ruleUUID=""):
     :param str fitsXMLString: An XML document, encoded into a string. The name is historical; this can represent XML output from any software.
     :param str ruleUUID: The UUID of the FPR rule used to generate this XML data. Foreign key to FPRule.
     """
-    FPCommandOutput.objects.create(file_id=fileUUID, content=fitsXMLString,
-                                   rule_id=ruleUUID)
+    create_object(FPCommandOutput, file_id=fileUUID, content=fitsXMLString,
+                  rule_id=ruleUUID)
 
 
 def fileWasRemoved(fileUUID, utcDate=None, eventDetail="", eventOutcomeDetailNote="", eventOutcome=""):
@@ -24,6 +24,7 @@ from __future__ import absolute_import
 from __future__ import division
 
 import calendar
+import collections
 import datetime
 import json
 import logging
@@ -44,7 +45,7 @@ import version
 
 from externals import xmltodict
 
-from elasticsearch import Elasticsearch, ImproperlyConfigured
+from elasticsearch import Elasticsearch, ImproperlyConfigured, helpers
 
 
 logger = logging.getLogger('archivematica.common')
@@ -79,6 +80,10 @@ DOC_TYPE = '_doc'
 # Maximun ES result window. Use the scroll API for a better way to get all
 # results or change `index.max_result_window` on each index settings.
 MAX_QUERY_SIZE = 10000
+# Limits of the bulk requests used to index AIP and transfer files. Chunks are
+# sent as soon as either limit is reached.
+BULK_CHUNK_SIZE = 500
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
 
 
 def setup(hosts, timeout=DEFAULT_TIMEOUT, enabled=['aips', 'transfers']):
@@ -476,7 +481,7 @@ def _index_aip_files(client, uuid, mets_path, name, identifiers=[], printfn=prin
             is_part_of = dublincore.findtext('dcterms:isPartOf', namespaces=ns.NSMAP)
 
     # Establish structure to be indexed for each file item
-    fileData = {
+    file_data = {
         'archivematicaVersion': version.get_version(),
         'AIPUUID': uuid,
         'sipName': name,
@@ -486,10 +491,6 @@ def _index_aip_files(client, uuid, mets_path, name, identifiers=[], printfn=prin
         'fileExtension': '',
         'isPartOf': is_part_of,
         'AICID': aic_identifier,
-        'METS': {
-            'dmdSec': {},
-            'amdSec': {},
-        },
         'origin': get_dashboard_uuid(),
         'identifiers': identifiers,
         'transferMetadata': _extract_transfer_metadata(root),
@@ -500,9 +501,33 @@ def _index_aip_files(client, uuid, mets_path, name, identifiers=[], printfn=prin
     metadata_files = root.findall("mets:fileSec/mets:fileGrp[@USE='metadata']/mets:file", namespaces=ns.NSMAP)
     files = original_files + metadata_files
 
-    # Index AIC METS file if it exists
+    _wait_for_cluster_yellow_status(client)
+    return _try_to_bulk_index(
+        client, _generate_aip_file_documents(root, files, file_data),
+        'aipfiles', printfn=printfn)
+
+
+def _generate_aip_file_documents(root, files, file_data):
+    """Yield the document to index for each METS file element in `files`.
+
+    :param root: root element of the AIP's METS file.
+    :param files: METS file elements to index.
+    :param file_data: fields shared by the documents of every file.
+    """
+    # Look up the METS sections of each file in dicts built in one pass,
+    # since searching the whole tree for every file takes quadratic time.
+    amd_sections = _index_elements_by_attribute(root.findall('mets:amdSec', namespaces=ns.NSMAP), 'ID')
+    dmd_sections = _index_elements_by_attribute(root.findall('mets:dmdSec', namespaces=ns.NSMAP), 'ID')
+    file_pointer_divisions = {}
+    for struct_map in root.findall("mets:structMap[@TYPE='physical']", namespaces=ns.NSMAP):
+        for div in struct_map.iter(ns.metsBNS + 'div'):
+            for file_pointer in div.findall('mets:fptr', namespaces=ns.NSMAP):
+                file_pointer_divisions.setdefault(file_pointer.get('FILEID'), div)
+
     for file_ in files:
-        indexData = fileData.copy()  # Deep copy of dict, not of dict contents
+        # The documents are serialized once a whole chunk has been
+        # generated, so every document needs its own METS dict.
+        indexData = dict(file_data, METS={'dmdSec': {}, 'amdSec': {}})
 
         # Get file UUID.  If and ADMID exists, look in the amdSec for the UUID,
         # otherwise parse it out of the file ID.
@@ -519,7 +544,7 @@ def _index_aip_files(client, uuid, mets_path, name, identifiers=[], printfn=prin
             if len(set(uuids)) == 1:
                 fileUUID = uuids[0]
         else:
-            amdSecInfo = root.find("mets:amdSec[@ID='{}']".format(admID), namespaces=ns.NSMAP)
+            amdSecInfo = amd_sections.get(admID)
             fileUUID = amdSecInfo.findtext("mets:techMD/mets:mdWrap/mets:xmlData/premis:object/premis:objectIdentifier/premis:objectIdentifierValue", namespaces=ns.NSMAP)
 
             # Index amdSec information
@@ -529,23 +554,14 @@ def _index_aip_files(client, uuid, mets_path, name, identifiers=[], printfn=prin
         # Get the parent division for the file pointer
         # by searching the physical structural map section (structMap)
         file_id = file_.attrib.get('ID', None)
-        file_pointer_division = root.find(
-            "mets:structMap[@TYPE='physical']//mets:fptr[@FILEID='{}']/..".format(
-                file_id
-            ),
-            namespaces=ns.NSMAP
-        )
+        file_pointer_division = file_pointer_divisions.get(file_id)
         if file_pointer_division is not None:
             # If the parent division has a DMDID attribute then index
             # its data from the descriptive metadata section (dmdSec)
             dmd_section_id = file_pointer_division.attrib.get('DMDID', None)
             if dmd_section_id is not None:
-                dmd_section_info = root.find(
-                    "mets:dmdSec[@ID='{}']/mets:mdWrap/mets:xmlData".format(
-                        dmd_section_id
-                    ),
-                    namespaces=ns.NSMAP
-                )
+                dmd_section_info = dmd_sections[dmd_section_id].find(
+                    'mets:mdWrap/mets:xmlData', namespaces=ns.NSMAP)
                 xml = ElementTree.tostring(dmd_section_info)
                 data = _rename_dict_keys_with_child_dicts(
                     _normalize_dict_values(xmltodict.parse(xml))
@@ -561,17 +577,7 @@ def _index_aip_files(client, uuid, mets_path, name, identifiers=[], printfn=prin
         if fileExtension:
             indexData['fileExtension'] = fileExtension[1:].lower()
 
-        # Index data
-        _wait_for_cluster_yellow_status(client)
-        _try_to_index(client, indexData, 'aipfiles', printfn=printfn)
-
-        # Reset fileData['METS']['amdSec'] and fileData['METS']['dmdSec'],
-        # since they are updated in the loop above.
-        # See http://stackoverflow.com/a/3975388 for explanation
-        fileData['METS']['amdSec'] = {}
-        fileData['METS']['dmdSec'] = {}
-
-    return len(files)
+        yield indexData
 
 
 def index_transfer_and_files(client, uuid, path, status='', printfn=print):
@@ -638,7 +644,16 @@ def _index_transfer_files(client, uuid, path, status='', printfn=print):
     :param printfn: optional print funtion.
     :return: number of files indexed.
     """
-    files_indexed = 0
+    _wait_for_cluster_yellow_status(client)
+    return _try_to_bulk_index(
+        client, _generate_transfer_file_documents(uuid, path, status, printfn),
+        'transferfiles', printfn=printfn)
+
+
+def _generate_transfer_file_documents(uuid, path, status='', printfn=print):
+    """Yield the document to index for each file of the Transfer with UUID
+    `uuid` at path `path`. See `_index_transfer_files`.
+    """
     ingest_date = str(datetime.datetime.today())[0:10]
 
     # Some files should not be indexed.
@@ -707,14 +722,18 @@ def _index_transfer_files(client, uuid, path, status='', printfn=print):
                     'format': formats,
                 }
 
-                _wait_for_cluster_yellow_status(client)
-                _try_to_index(client, indexData, 'transferfiles', printfn=printfn)
-
-                files_indexed = files_indexed + 1
+                yield indexData
             else:
                 printfn('Skipping indexing {}'.format(relative_path))
 
-    return files_indexed
+
+def _index_elements_by_attribute(elements, attribute):
+    """Return a dict of `elements` by the value of their `attribute`. The
+    first element wins when several have the same value, like `find`."""
+    index = {}
+    for element in elements:
+        index.setdefault(element.get(attribute), element)
+    return index
 
 
 def _try_to_index(client, data, index, wait_between_tries=10, max_tries=10, printfn=print):
@@ -737,6 +756,40 @@ def _try_to_index(client, data, index, wait_between_tries=10, max_tries=10, prin
         raise exception
 
 
+def _try_to_bulk_index(client, documents, index, chunk_size=BULK_CHUNK_SIZE, printfn=print):
+    """Index the documents generated by `documents` in `index`.
+
+    The documents are sent through the bulk API in chunks of `chunk_size`
+    as they are generated. Documents rejected by Elasticsearch, or belonging
+    to a chunk that could not be sent, are retried one by one with
+    `_try_to_index`.
+
+    :return: number of documents indexed.
+    """
+    # The bulk helper yields one result per document, in the order the
+    # documents were generated.
+    pending = collections.deque()
+
+    def actions():
+        for document in documents:
+            pending.append(document)
+            yield document
+
+    indexed = 0
+    results = helpers.streaming_bulk(
+        client, actions(), chunk_size=chunk_size,
+        max_chunk_bytes=BULK_MAX_CHUNK_BYTES, raise_on_error=False,
+        raise_on_exception=False, index=index, doc_type=DOC_TYPE)
+    for ok, result in results:
+        document = pending.popleft()
+        if not ok:
+            printfn('ERROR: error trying to bulk index, retrying document.')
+            printfn(result)
+            _try_to_index(client, document, index, printfn=printfn)
+        indexed += 1
+    return indexed
+
+
 # ----------------
 # INDEXING HELPERS
 # ----------------
@@ -1052,6 +1105,27 @@ def get_transfer_file_info(client, field, value):
     return results
 
 
+def get_transfer_file_uuids(client, transfer_uuid):
+    """
+    Get the UUIDs of the files of the transfer `transfer_uuid` from
+    ElasticSearch, by relative path. Files without UUID are left out.
+    """
+    query = {
+        "query": {
+            "term": {
+                "sipuuid": transfer_uuid
+            }
+        },
+        "_source": ["relative_path", "fileuuid"],
+    }
+    documents = search_all_results(client, body=query, index='transferfiles')
+    return {
+        document['_source']['relative_path']: document['_source']['fileuuid']
+        for document in documents['hits']['hits']
+        if document['_source'].get('fileuuid')
+    }
+
+
 # -------
 # DELETES
 # -------
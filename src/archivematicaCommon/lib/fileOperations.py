@@ -28,9 +28,10 @@ import shutil
 
 from databaseFunctions import insertIntoFiles
 from executeOrRunSubProcess import executeOrRun
-from databaseFunctions import insertIntoEvents
+from databaseFunctions import insertIntoEvents, update_object
 import MySQLdb
-from archivematicaFunctions import unicodeToStr, get_setting, get_file_checksum
+from archivematicaFunctions import unicodeToStr, get_setting
+import file_checksums
 
 from main.models import File, Transfer
 
@@ -48,9 +49,10 @@ def updateSizeAndChecksum(fileUUID, filePath, date, eventIdentifierUUID, fileSiz
     if not checksumType:
         checksumType = get_setting('checksum_type', 'sha256')
     if not checksum:
-        checksum = get_file_checksum(filePath, checksumType)
+        checksum = file_checksums.get_file_checksums(
+            filePath, [checksumType], file_uuid=fileUUID)[checksumType]
 
-    File.objects.filter(uuid=fileUUID).update(size=fileSize, checksum=checksum, checksumtype=checksumType)
+    update_object(File, fileUUID, size=fileSize, checksum=checksum, checksumtype=checksumType)
 
     if add_event:
         insertIntoEvents(fileUUID=fileUUID,
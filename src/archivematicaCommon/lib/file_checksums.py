@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Checksum engine shared by the checksum microservices.
+
+Files are read only once, in large reads, to compute the digests requested,
+usually the checksum type configured in the dashboard. The files of a batch
+are read by a pool of threads; ``hashlib`` and file reads release the GIL, so
+they run in parallel.
+
+The digests of the files that have a ``File`` row are stored in the
+``FileChecksum`` table and reused, without reading the file again, for as
+long as its size and modification time don't change: update_size_and_checksum
+computes the digests of its whole batch at once, then each job reuses them
+through ``fileOperations.updateSizeAndChecksum``, as do later runs of the
+microservice on unchanged files. Fixity checks must not trust them and use
+``compute_checksums`` instead.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import io
+from multiprocessing.pool import ThreadPool
+import os
+
+from django.db import IntegrityError, transaction
+
+from main.models import FileChecksum
+
+# Size of the reads, a multiple of the block size of every hashlib
+# algorithm and of the usual file system block sizes.
+READ_SIZE = 4 * 1024 * 1024
+
+# Number of files read in parallel.
+THREADS = 4
+
+# Modification times are stored as floats, which may lose some precision in
+# the database.
+MTIME_TOLERANCE = 0.001
+
+
+def compute_checksums(path, algorithms):
+    """Return a dict of the hex digests of the file at ``path`` for each
+    ``hashlib`` algorithm in ``algorithms``, reading the file once."""
+    hashes = [(algorithm, hashlib.new(algorithm)) for algorithm in set(algorithms)]
+    buffer_ = bytearray(READ_SIZE)
+    view = memoryview(buffer_)
+    with io.open(path, 'rb', buffering=0) as file_:
+        while True:
+            size = file_.readinto(buffer_)
+            if not size:
+                break
+            for _, hash_ in hashes:
+                hash_.update(view[:size])
+    return {algorithm: hash_.hexdigest() for algorithm, hash_ in hashes}
+
+
+def _get_stored_checksums(files):
+    """Return the valid stored digests of ``files``, a list of
+    ``(file_uuid, path, stat)`` tuples, by file UUID."""
+    stats = {file_uuid: stat for file_uuid, _, stat in files if file_uuid}
+    stored = {}
+    for row in FileChecksum.objects.filter(file_id__in=list(stats)):
+        stat = stats[row.file_id]
+        if row.size == stat.st_size and abs(row.modified - stat.st_mtime) < MTIME_TOLERANCE:
+            stored.setdefault(row.file_id, {})[row.algorithm] = row.checksum
+    return stored
+
+
+def _store_checksums(computed):
+    """Replace the stored digests of the files in ``computed``, a list of
+    ``(file_uuid, stat, checksums)`` tuples."""
+    rows = [
+        FileChecksum(file_id=file_uuid, algorithm=algorithm, checksum=checksum,
+                     size=stat.st_size, modified=stat.st_mtime)
+        for file_uuid, stat, checksums in computed
+        for algorithm, checksum in checksums.items()
+    ]
+    if not rows:
+        return
+    try:
+        with transaction.atomic():
+            FileChecksum.objects.filter(
+                file_id__in=[file_uuid for file_uuid, _, _ in computed]).delete()
+            FileChecksum.objects.bulk_create(rows)
+    except IntegrityError:
+        # Stored digests are only an optimization: if another process stored
+        # the digests of the same files, or a file has no ``File`` row, the
+        # digests will be computed again when needed.
+        pass
+
+
+def get_checksums(files, algorithms, threads=THREADS):
+    """Return the digests of several files.
+
+    :param files: iterable of ``(file_uuid, path)`` tuples. ``file_uuid`` is
+        the UUID of the ``File`` row of the file, or ``None`` if it has none;
+        the digests of such files are computed but not stored.
+    :param algorithms: ``hashlib`` algorithms of the digests needed.
+    :param threads: number of files read in parallel.
+    :return: dict of the digests of each file, by algorithm, by path.
+    """
+    algorithms = set(algorithms)
+    files = [(file_uuid, path, os.stat(path)) for file_uuid, path in files]
+    stored = _get_stored_checksums(files)
+
+    results = {}
+    missing = []
+    for file_uuid, path, stat in files:
+        checksums = stored.get(file_uuid, {})
+        if file_uuid and algorithms.issubset(checksums):
+            results[path] = checksums
+        else:
+            missing.append((file_uuid, path, stat))
+    if not missing:
+        return results
+
+    def compute(file_):
+        return compute_checksums(file_[1], algorithms)
+
+    if len(missing) == 1 or threads < 2:
+        computed = [compute(file_) for file_ in missing]
+    else:
+        pool = ThreadPool(min(threads, len(missing)))
+        try:
+            computed = pool.map(compute, missing)
+        finally:
+            pool.close()
+
+    for (_, path, _), checksums in zip(missing, computed):
+        results[path] = checksums
+    _store_checksums([
+        (file_uuid, stat, checksums)
+        for (file_uuid, _, stat), checksums in zip(missing, computed)
+        if file_uuid
+    ])
+    return results
+
+
+def get_file_checksums(path, algorithms, file_uuid=None):
+    """Return a dict of the digests of the file at ``path``, by algorithm.
+
+    See ``get_checksums``.
+    """
+    return get_checksums([(file_uuid, path)], algorithms)[path]
@@ -0,0 +1,162 @@
+# -*- coding: UTF-8 -*-
+"""
+Read-through cache of Format Policy Registry lookups.
+
+The per-file client scripts look up the same few FPR rows (the enabled
+IDCommand, the FormatVersion of a PUID, the FPRules of a format...) for every
+file they process, while the FPR tables barely change. The lookups below keep
+their results for the lifetime of the process.
+
+The whole cache is dropped when the FPR tables change. Changes are detected by
+comparing a fingerprint of the tables (number of rows, highest id and enabled
+rows), taken at most once every ``CHECK_INTERVAL`` seconds. Editing the FPR
+always creates new rows or enables/disables existing ones, so this catches
+changes made from the dashboard without any cross-process signalling.
+
+Cached model instances are shared by every caller: treat them as read-only.
+"""
+
+import threading
+import time
+
+from django.db.models import Case, Count, IntegerField, Max, Sum, When
+
+from fpr.models import FormatVersion, FPCommand, FPRule, IDCommand, IDRule
+
+# Seconds during which the cached lookups are trusted without checking
+# whether the FPR tables changed.
+CHECK_INTERVAL = 10
+
+# Tables whose changes invalidate the cache.
+FINGERPRINT_MODELS = (IDCommand, IDRule, FormatVersion, FPCommand, FPRule)
+
+# Related objects used by the client scripts, fetched along with the rules so
+# that they are cached too.
+FPRULE_RELATED = (
+    'format__format',
+    'command__tool',
+    'command__verification_command',
+    'command__event_detail_command',
+)
+
+
+class FPRCache(object):
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.results = {}
+        self.fingerprint = None
+        self.checked_at = None
+
+    @staticmethod
+    def _fingerprint():
+        enabled_ids = Sum(Case(When(enabled=True, then='id'), default=0, output_field=IntegerField()))
+        return tuple(
+            tuple(sorted(model.objects.aggregate(
+                count=Count('id'), max_id=Max('id'), enabled_ids=enabled_ids).items()))
+            for model in FINGERPRINT_MODELS)
+
+    def _validate(self):
+        now = time.time()
+        if self.checked_at is not None and now - self.checked_at < self.check_interval:
+            return
+        fingerprint = self._fingerprint()
+        if fingerprint != self.fingerprint:
+            self.results = {}
+            self.fingerprint = fingerprint
+        self.checked_at = now
+
+    def get(self, key, load):
+        """Return the cached result for ``key``, calling ``load`` to get it
+        on a cache miss."""
+        with self.lock:
+            self._validate()
+            try:
+                return self.results[key]
+            except KeyError:
+                result = self.results[key] = load()
+                return result
+
+
+_cache = FPRCache()
+
+
+def clear():
+    """Drop every cached lookup."""
+    _cache.clear()
+
+
+def _get_one(model, rows):
+    """Mimic ``QuerySet.get`` on a list of at most two rows."""
+    if not rows:
+        raise model.DoesNotExist(
+            '%s matching query does not exist.' % model._meta.object_name)
+    if len(rows) > 1:
+        raise model.MultipleObjectsReturned(
+            'get() returned more than one %s.' % model._meta.object_name)
+    return rows[0]
+
+
+def _uuid(obj):
+    return getattr(obj, 'uuid', obj)
+
+
+def get_default_idcommand():
+    """Return the enabled ``IDCommand``, or ``None``."""
+    return _cache.get(
+        ('IDCommand',),
+        lambda: IDCommand.active.select_related('tool').first())
+
+
+def get_format_version_by_puid(puid):
+    """Return the enabled ``FormatVersion`` with PRONOM id ``puid``.
+
+    Raises ``FormatVersion.DoesNotExist`` or
+    ``FormatVersion.MultipleObjectsReturned`` like ``QuerySet.get``.
+    """
+    rows = _cache.get(
+        ('FormatVersion', puid),
+        lambda: tuple(FormatVersion.active.select_related('format')
+                      .filter(pronom_id=puid)[:2]))
+    return _get_one(FormatVersion, rows)
+
+
+def get_idrule(command, output):
+    """Return the enabled ``IDRule`` of ``command`` matching its ``output``.
+
+    Raises ``IDRule.DoesNotExist`` or ``IDRule.MultipleObjectsReturned`` like
+    ``QuerySet.get``.
+    """
+    command_uuid = _uuid(command)
+    rows = _cache.get(
+        ('IDRule', command_uuid, output),
+        lambda: tuple(IDRule.active.select_related('format__format')
+                      .filter(command=command_uuid, command_output=output)[:2]))
+    return _get_one(IDRule, rows)
+
+
+def get_fprules(purpose, format_version=None):
+    """Return the enabled ``FPRule``s for ``purpose``, limited to the rules of
+    ``format_version`` (a ``FormatVersion`` or its UUID) if given."""
+    format_uuid = _uuid(format_version)
+
+    def load():
+        rules = FPRule.active.select_related(*FPRULE_RELATED).filter(purpose=purpose)
+        if format_uuid is not None:
+            rules = rules.filter(format=format_uuid)
+        return tuple(rules)
+
+    return _cache.get(('FPRule', purpose, format_uuid), load)
+
+
+def get_fprule(purpose, format_version=None):
+    """Return the single enabled ``FPRule`` for ``purpose`` (and
+    ``format_version`` if given).
+
+    Raises ``FPRule.DoesNotExist`` or ``FPRule.MultipleObjectsReturned`` like
+    ``QuerySet.get``.
+    """
+    return _get_one(FPRule, get_fprules(purpose, format_version))
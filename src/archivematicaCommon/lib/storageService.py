@@ -1,10 +1,12 @@
 from __future__ import absolute_import
 import base64
+import copy
 import logging
 import os
 import platform
 import requests
 from requests.auth import AuthBase
+import threading
 import urllib
 import time
 
@@ -15,6 +17,15 @@ from archivematicaFunctions import get_setting
 
 LOGGER = logging.getLogger("archivematica.common")
 
+# Seconds during which the pipeline and locations fetched from the storage
+# service are reused, and the sessions kept alive.
+CACHE_TTL = 60
+
+# Seconds between the polls of async requests: the delay starts at
+# ASYNC_POLL_SECONDS and doubles after each poll, up to ASYNC_POLL_MAX_SECONDS.
+ASYNC_POLL_SECONDS = 0.25
+ASYNC_POLL_MAX_SECONDS = 8
+
 
 class Error(requests.exceptions.RequestException):
     pass
@@ -57,22 +68,88 @@ def _storage_service_url():
     return storage_service_url
 
 
-def _storage_api_session(timeout=django_settings.STORAGE_SERVICE_CLIENT_QUICK_TIMEOUT):
-    """Return a requests.Session with a customized adapter with timeout support."""
-    class HTTPAdapterWithTimeout(requests.adapters.HTTPAdapter):
-        def __init__(self, timeout=None, *args, **kwargs):
-            self.timeout = timeout
-            super(HTTPAdapterWithTimeout, self).__init__(*args, **kwargs)
+class HTTPAdapterWithTimeout(requests.adapters.HTTPAdapter):
+    def __init__(self, timeout=None, *args, **kwargs):
+        self.timeout = timeout
+        super(HTTPAdapterWithTimeout, self).__init__(*args, **kwargs)
+
+    def send(self, *args, **kwargs):
+        kwargs['timeout'] = self.timeout
+        return super(HTTPAdapterWithTimeout, self).send(*args, **kwargs)
+
+
+class StorageServiceCache(object):
+    """
+    Sessions and lookups reused across calls to the storage service.
+
+    Each thread gets its own sessions, one per timeout, whose connections are
+    kept alive between requests. The results of the lookups that every call
+    starts with (the pipeline, the locations) are shared by all the threads.
+
+    Everything expires after ``ttl`` seconds, so that changes to the storage
+    service settings or to the locations made elsewhere are picked up, or
+    when ``clear`` is called.
+    """
+
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.results = {}
+            # Sessions created before the last clear are dropped
+            self.generation = getattr(self, 'generation', 0) + 1
+
+    def session(self, timeout):
+        sessions = getattr(self.local, 'sessions', None)
+        if sessions is None:
+            sessions = self.local.sessions = {}
+        now = time.time()
+        entry = sessions.get(timeout)
+        if entry is not None:
+            generation, created_at, session = entry
+            if generation == self.generation and now - created_at < self.ttl:
+                return session
+            session.close()
+        session = requests.session()
+        session.auth = ApiKeyAuth()
+        session.mount('http://', HTTPAdapterWithTimeout(timeout=timeout))
+        session.mount('https://', HTTPAdapterWithTimeout(timeout=timeout))
+        sessions[timeout] = (self.generation, now, session)
+        return session
+
+    def get(self, key, load):
+        """Return a copy of the cached result for ``key``, calling ``load`` to
+        get it if it's missing or expired.  Errors aren't cached."""
+        now = time.time()
+        with self.lock:
+            entry = self.results.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            result = entry[1]
+        else:
+            result = load()
+            with self.lock:
+                self.results[key] = (now, result)
+        return copy.deepcopy(result)
+
+
+_cache = StorageServiceCache()
 
-        def send(self, *args, **kwargs):
-            kwargs['timeout'] = self.timeout
-            return super(HTTPAdapterWithTimeout, self).send(*args, **kwargs)
 
-    session = requests.session()
-    session.auth = ApiKeyAuth()
-    session.mount('http://', HTTPAdapterWithTimeout(timeout=timeout))
-    session.mount('https://', HTTPAdapterWithTimeout(timeout=timeout))
-    return session
+def clear_cache():
+    """Drop the cached sessions, pipeline and locations, e.g. after the storage
+    service settings changed."""
+    _cache.clear()
+
+
+def _storage_api_session(timeout=django_settings.STORAGE_SERVICE_CLIENT_QUICK_TIMEOUT):
+    """Return a requests.Session with a customized adapter with timeout support.
+
+    The session is reused by the next calls made from the same thread."""
+    return _cache.session(timeout)
 
 
 def _storage_api_slow_session():
@@ -97,6 +174,20 @@ def _storage_relative_from_absolute(location_path, space_path):
         location_path = location_path[strip:]
     return location_path
 
+
+def _iter_objects(session, url, params):
+    """Yield the objects of a paginated listing, fetching each page as it's
+    needed."""
+    params = dict(params, offset=0)
+    while True:
+        response = session.get(url, params=params)
+        page = response.json()
+        for obj in page['objects']:
+            yield obj
+        if not page['meta']['next']:
+            break
+        params['offset'] += page['meta']['limit']
+
 # ########### PIPELINE #############
 
 
@@ -120,10 +211,15 @@ def create_pipeline(create_default_locations=False, shared_path=None,
     except requests.exceptions.RequestException as e:
         LOGGER.warning('Unable to create Archivematica pipeline in storage service from %s because %s', pipeline, e, exc_info=True)
         raise
+    clear_cache()
     return True
 
 
 def get_pipeline(uuid):
+    return _cache.get(('pipeline', uuid), lambda: _get_pipeline(uuid))
+
+
+def _get_pipeline(uuid):
     url = _storage_service_url() + 'pipeline/' + uuid + '/'
     try:
         response = _storage_api_session().get(url)
@@ -151,10 +247,13 @@ def get_location(path=None, purpose=None, space=None):
     path: Path to location.  If a space is passed in, paths starting with /
         have the space's path stripped.
     """
-    return_locations = []
     if space and path:
         path = _storage_relative_from_absolute(path, space['path'])
         space = space['uuid']
+    return _cache.get(('location', path, purpose, space), lambda: _get_location(path, purpose, space))
+
+
+def _get_location(path, purpose, space):
     pipeline = get_pipeline(get_setting('dashboard_uuid'))
     if pipeline is None:
         return None
@@ -164,21 +263,18 @@ def get_location(path=None, purpose=None, space=None):
         'relative_path': path,
         'purpose': purpose,
         'space': space,
-        'offset': 0,
     }
-    while True:
-        response = _storage_api_session().get(url, params=params)
-        locations = response.json()
-        return_locations += locations['objects']
-        if not locations['meta']['next']:
-            break
-        params['offset'] += locations['meta']['limit']
+    return_locations = list(_iter_objects(_storage_api_session(), url, params))
 
     LOGGER.debug("Storage locations returned: %s", return_locations)
     return return_locations
 
 
 def get_default_location(purpose):
+    return _cache.get(('default_location', purpose), lambda: _get_default_location(purpose))
+
+
+def _get_default_location(purpose):
     url = _storage_service_url() + 'location/default/{}'.format(purpose)
     response = _storage_api_session().get(url)
     response.raise_for_status()
@@ -200,14 +296,15 @@ def browse_location(uuid, path):
     return browse
 
 
-def wait_for_async(response, poll_seconds=2, poll_timeout_seconds=600):
+def wait_for_async(response, poll_seconds=ASYNC_POLL_SECONDS, poll_timeout_seconds=600):
     """
     Poll for results on an async endpoint.
 
     `response` should have a HTTP 202 (Accepted) status code, and is expected to
     contain a Location header telling us where to get our results from.
 
-    `poll_seconds` controls how long we wait between poll requests.
+    `poll_seconds` controls how long we wait before the second poll request.
+    The delay doubles after each poll, up to ASYNC_POLL_MAX_SECONDS.
 
     `poll_timeout_seconds` controls how long we wait for a poll request to
     complete before giving up and throwing an exception.
@@ -215,21 +312,57 @@ def wait_for_async(response, poll_seconds=2, poll_timeout_seconds=600):
     This function may raise exceptions. The caller can expect them to be
     instances of ``requests.exceptions.RequestException``.
     """
-    response.raise_for_status()
-    poll_url = response.headers['Location']
-    while True:
-        poll_response = _storage_api_session(
-            timeout=poll_timeout_seconds).get(poll_url)
-        poll_response.raise_for_status()
-        payload = poll_response.json()
-        if not payload['completed']:
-            time.sleep(poll_seconds)
-            continue
-        if payload['was_error']:
-            errmsg = 'Failure storing file: {}'.format(payload['error'])
-            LOGGER.warning(errmsg)
-            raise WaitForAsyncError(errmsg)
-        return payload['result']
+    result, error = wait_for_async_all([response], poll_seconds, poll_timeout_seconds)[0]
+    if error is not None:
+        raise error
+    return result
+
+
+def wait_for_async_all(responses, poll_seconds=ASYNC_POLL_SECONDS, poll_timeout_seconds=600):
+    """
+    Poll for the results of several async requests at once.
+
+    See ``wait_for_async``. Every round polls each of the requests still
+    running, so waiting for several requests takes as long as the slowest.
+
+    Returns a (result, error) tuple for each of the ``responses``, in order:
+    one failed request doesn't prevent getting the results of the others.
+    """
+    results = [None] * len(responses)
+    poll_urls = {}
+    for idx, response in enumerate(responses):
+        try:
+            response.raise_for_status()
+            poll_urls[idx] = response.headers['Location']
+        except requests.exceptions.RequestException as err:
+            results[idx] = (None, err)
+        except KeyError:
+            results[idx] = (None, Error('No Location header in response to async request'))
+
+    session = _storage_api_session(timeout=poll_timeout_seconds)
+    delay = poll_seconds
+    while poll_urls:
+        for idx, poll_url in sorted(poll_urls.items()):
+            try:
+                poll_response = session.get(poll_url)
+                poll_response.raise_for_status()
+                payload = poll_response.json()
+            except requests.exceptions.RequestException as err:
+                results[idx] = (None, err)
+            else:
+                if not payload['completed']:
+                    continue
+                if payload['was_error']:
+                    errmsg = 'Failure storing file: {}'.format(payload['error'])
+                    LOGGER.warning(errmsg)
+                    results[idx] = (None, WaitForAsyncError(errmsg))
+                else:
+                    results[idx] = (payload['result'], None)
+            del poll_urls[idx]
+        if poll_urls:
+            time.sleep(delay)
+            delay = min(delay * 2, ASYNC_POLL_MAX_SECONDS)
+    return results
 
 
 def copy_files(source_location, destination_location, files):
@@ -304,57 +437,95 @@ def create_file(uuid, origin_location, origin_path, current_location,
     Returns a dict with the decoded JSON response from the SS API. It may raise
     ``RequestException`` if the SS API call fails.
     """
-    pipeline = get_pipeline(get_setting('dashboard_uuid'))
-    if pipeline is None:
-        raise ResourceNotFound('Pipeline not available')
-    if events is None:
-        events = []
-    if agents is None:
-        agents = []
-    new_file = {
+    result, error = create_files([{
         'uuid': uuid,
         'origin_location': origin_location,
         'origin_path': origin_path,
         'current_location': current_location,
         'current_path': current_path,
         'package_type': package_type,
-        'aip_subtype': aip_subtype,
         'size': size,
-        'origin_pipeline': pipeline['resource_uri'],
+        'update': update,
         'related_package_uuid': related_package_uuid,
         'events': events,
-        'agents': agents
-    }
+        'agents': agents,
+        'aip_subtype': aip_subtype,
+    }])[0]
+    if error is not None:
+        raise error
+    return result
 
-    LOGGER.info("Creating file with %s", new_file)
-    errmsg = "Unable to create file from %s because %s"
 
-    ret = None
-    if update:
-        try:
-            session = _storage_api_slow_session()
-            new_file['reingest'] = pipeline['uuid']
-            url = _storage_service_url() + 'file/' + uuid + '/'
-            response = session.put(url, json=new_file)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as err:
-            LOGGER.warning(errmsg, new_file, err)
-            raise
-        else:
-            ret = response.json()
-    else:
+def create_files(packages):
+    """Creates several new files (packages) at once.
+
+    ``packages`` is a list of dicts with the arguments of ``create_file``.
+    New packages are submitted to the async endpoint together, and their
+    results awaited together, see ``wait_for_async_all``. Packages being
+    reingested (``update``) are updated one after the other.
+
+    Returns a (result, error) tuple for each package, in order, where
+    ``result`` is the decoded JSON response from the SS API and ``error`` the
+    ``RequestException`` raised if the SS API call failed. It raises
+    ``ResourceNotFound`` if the pipeline isn't available.
+    """
+    pipeline = get_pipeline(get_setting('dashboard_uuid'))
+    if pipeline is None:
+        raise ResourceNotFound('Pipeline not available')
+
+    errmsg = "Unable to create file from %s because %s"
+    results = [None] * len(packages)
+    new_files = {}
+    async_responses = {}
+    for idx, package in enumerate(packages):
+        new_file = new_files[idx] = _new_file(pipeline, **package)
+        LOGGER.info("Creating file with %s", new_file)
         try:
-            session = _storage_api_session()
-            url = _storage_service_url() + 'file/async/'
-            response = session.post(url, json=new_file, allow_redirects=False)
-            ret = wait_for_async(response)
+            if package.get('update'):
+                new_file['reingest'] = pipeline['uuid']
+                url = _storage_service_url() + 'file/' + new_file['uuid'] + '/'
+                response = _storage_api_slow_session().put(url, json=new_file)
+                response.raise_for_status()
+                results[idx] = (response.json(), None)
+            else:
+                url = _storage_service_url() + 'file/async/'
+                response = _storage_api_session().post(url, json=new_file, allow_redirects=False)
+                async_responses[idx] = response
         except requests.exceptions.RequestException as err:
             LOGGER.warning(errmsg, new_file, err)
-            raise
-
-    LOGGER.info('Status code of create file/package request: %s',
-                response.status_code)
-    return ret
+            results[idx] = (None, err)
+            continue
+        LOGGER.info('Status code of create file/package request: %s',
+                    response.status_code)
+
+    indexes = sorted(async_responses)
+    async_results = wait_for_async_all([async_responses[idx] for idx in indexes])
+    for idx, (result, error) in zip(indexes, async_results):
+        if error is not None:
+            LOGGER.warning(errmsg, new_files[idx], error)
+        results[idx] = (result, error)
+    return results
+
+
+def _new_file(pipeline, uuid, origin_location, origin_path, current_location,
+              current_path, package_type, size, update=False,
+              related_package_uuid=None, events=None, agents=None,
+              aip_subtype=None):
+    """The body of the request creating a package."""
+    return {
+        'uuid': uuid,
+        'origin_location': origin_location,
+        'origin_path': origin_path,
+        'current_location': current_location,
+        'current_path': current_path,
+        'package_type': package_type,
+        'aip_subtype': aip_subtype,
+        'size': size,
+        'origin_pipeline': pipeline['resource_uri'],
+        'related_package_uuid': related_package_uuid,
+        'events': events or [],
+        'agents': agents or [],
+    }
 
 
 def get_file_info(uuid=None, origin_location=None, origin_path=None,
@@ -366,9 +537,22 @@ def get_file_info(uuid=None, origin_location=None, origin_path=None,
     optionally filtered by origin location/path, current location/path, or
     package_type.
     """
+    return_files = list(iter_file_info(
+        uuid=uuid, origin_location=origin_location, origin_path=origin_path,
+        current_location=current_location, current_path=current_path,
+        package_type=package_type, status=status))
+
+    LOGGER.debug("Files returned: %s", return_files)
+    return return_files
+
+
+def iter_file_info(uuid=None, origin_location=None, origin_path=None,
+                   current_location=None, current_path=None, package_type=None,
+                   status=None):
+    """Like ``get_file_info``, but yields the files as the pages of the
+    listing are fetched."""
     # TODO Need a better way to deal with mishmash of relative and absolute
     # paths coming in
-    return_files = []
     url = _storage_service_url() + 'file/'
     params = {
         'uuid': uuid,
@@ -378,18 +562,8 @@ def get_file_info(uuid=None, origin_location=None, origin_path=None,
         'current_path': current_path,
         'package_type': package_type,
         'status': status,
-        'offset': 0,
     }
-    while True:
-        response = _storage_api_slow_session().get(url, params=params)
-        files = response.json()
-        return_files += files['objects']
-        if not files['meta']['next']:
-            break
-        params['offset'] += files['meta']['limit']
-
-    LOGGER.debug("Files returned: %s", return_files)
-    return return_files
+    return _iter_objects(_storage_api_slow_session(), url, params)
 
 
 def download_file_url(file_uuid):
@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+"""
+Wire format of the Gearman payloads exchanged by MCPServer and MCPClient.
+
+Task groups sent by MCPServer and the results sent back by MCPClient are JSON
+documents compressed with zlib, after a header with the format ``VERSION``.
+Unlike pickle, decoding a payload can't run arbitrary code, and compression
+takes care of what the tasks of a group have in common (the same command,
+most of the same arguments and paths), so large groups stay small.
+
+Byte strings that aren't valid UTF-8 (e.g. file names or the output of some
+commands) are sent base64-encoded, so they go through unchanged. Every string
+is decoded as a byte string.
+
+MCPServer and MCPClient must use the same version of the format.
+"""
+
+import base64
+import json
+import zlib
+
+from django.utils import six
+
+VERSION = 1
+
+HEADER = b'AMTP'
+
+# Compression level: the payloads are small, favour speed.
+COMPRESSION_LEVEL = 1
+
+# Key of the objects that hold base64-encoded byte strings.
+BYTES_KEY = '__bytes__'
+
+
+class PayloadError(ValueError):
+    """The payload can't be decoded."""
+
+
+def _to_json(value):
+    if isinstance(value, six.binary_type):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return {BYTES_KEY: base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        return {_to_json(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, six.text_type):
+        return value.encode('utf-8') if six.PY2 else value
+    if isinstance(value, dict):
+        if len(value) == 1 and BYTES_KEY in value:
+            return base64.b64decode(value[BYTES_KEY])
+        return {_from_json(key): _from_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    return value
+
+
+def dumps(data):
+    """Encode ``data``, made of dicts, lists, strings, numbers, booleans and
+    ``None``."""
+    document = json.dumps(_to_json(data), separators=(',', ':'))
+    return HEADER + six.int2byte(VERSION) + zlib.compress(document.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def loads(payload):
+    """Decode a payload encoded by ``dumps``."""
+    if not payload or not payload.startswith(HEADER):
+        raise PayloadError('Not a task payload')
+    version = six.indexbytes(payload, len(HEADER))
+    if version != VERSION:
+        raise PayloadError('Unsupported task payload version: %d' % version)
+    try:
+        document = zlib.decompress(payload[len(HEADER) + 1:])
+        return _from_json(json.loads(document.decode('utf-8')))
+    except (zlib.error, ValueError) as e:
+        raise PayloadError('Invalid task payload: %s' % e)
@@ -3,7 +3,7 @@ import os
 
 import databaseFunctions
 
-from main.models import Event, File
+from main.models import Derivation, Event, File
 
 from django.test import TestCase
 import pytest
@@ -113,6 +113,42 @@ class TestDatabaseFunctions(TestCase):
         assert agents.get(id=2)
         assert agents.get(id=5)
 
+    # buffered_writes
+
+    def test_buffered_writes_are_flushed_in_bulk(self):
+        with databaseFunctions.buffered_writes():
+            databaseFunctions.insertIntoEvents(fileUUID="88c8f115-80bc-4da4-a1e6-0158f5df13b9",
+                                               eventIdentifierUUID="buffered_event_1")
+            databaseFunctions.insertIntoEvents(fileUUID="1f4af873-8d60-4907-a92e-d1889e643524",
+                                               eventIdentifierUUID="buffered_event_2")
+            databaseFunctions.insertIntoDerivations("88c8f115-80bc-4da4-a1e6-0158f5df13b9",
+                                                    "1f4af873-8d60-4907-a92e-d1889e643524",
+                                                    relatedEventUUID="buffered_event_1")
+            databaseFunctions.update_object(File, "88c8f115-80bc-4da4-a1e6-0158f5df13b9",
+                                            size=1, checksum="same")
+            databaseFunctions.update_object(File, "1f4af873-8d60-4907-a92e-d1889e643524",
+                                            size=2, checksum="same")
+            assert not Event.objects.filter(event_id__startswith="buffered_event").exists()
+
+        agents = Event.objects.get(event_id="buffered_event_1").agents
+        assert sorted(agents.values_list('id', flat=True)) == [1, 2, 5]
+        agents = Event.objects.get(event_id="buffered_event_2").agents
+        assert 10 in agents.values_list('id', flat=True)
+        assert Derivation.objects.get(event_id="buffered_event_1").derived_file_id == "1f4af873-8d60-4907-a92e-d1889e643524"
+        assert File.objects.get(uuid="88c8f115-80bc-4da4-a1e6-0158f5df13b9").size == 1
+        assert File.objects.get(uuid="1f4af873-8d60-4907-a92e-d1889e643524").size == 2
+        assert File.objects.filter(checksum="same").count() == 2
+
+    def test_buffered_writes_are_discarded_on_error(self):
+        with pytest.raises(ValueError):
+            with databaseFunctions.buffered_writes():
+                databaseFunctions.insertIntoEvents(fileUUID="88c8f115-80bc-4da4-a1e6-0158f5df13b9",
+                                                   eventIdentifierUUID="discarded_event")
+                raise ValueError()
+
+        assert databaseFunctions.get_write_buffer() is None
+        assert not Event.objects.filter(event_id="discarded_event").exists()
+
     # getAccessionNumberFromTransfer
 
     def test_get_accession_number_from_transfer(self):
@@ -78,10 +78,10 @@ class TestElasticSearchFunctions(unittest.TestCase):
 
     @mock.patch('elasticSearchFunctions.get_dashboard_uuid')
     @mock.patch('elasticSearchFunctions._wait_for_cluster_yellow_status')
-    @mock.patch('elasticSearchFunctions._try_to_index')
+    @mock.patch('elasticSearchFunctions._try_to_bulk_index')
     def test_index_mets_file_metadata(
             self,
-            dummy_try_to_index,
+            dummy_try_to_bulk_index,
             dummy_wait_for_cluster_yellow_status,
             dummy_get_dashboard_uuid,
     ):
@@ -89,15 +89,20 @@ class TestElasticSearchFunctions(unittest.TestCase):
         dummy_get_dashboard_uuid.return_value = 'test-uuid'
         indexed_data = {}
 
-        def get_dublincore_metadata(client, indexData, index, printfn):
-            try:
-                dmd_section = indexData['METS']['dmdSec']
-                metadata_container = dmd_section['ns0:xmlData_dict_list'][0]
-                dc = metadata_container['ns1:dublincore_dict_list'][0]
-            except (KeyError, IndexError):
-                dc = None
-            indexed_data[indexData['filePath']] = dc
-        dummy_try_to_index.side_effect = get_dublincore_metadata
+        def get_dublincore_metadata(client, documents, index, printfn):
+            # Documents are only sent once a chunk is complete, so consume
+            # all of them before looking at their content.
+            documents = list(documents)
+            for indexData in documents:
+                try:
+                    dmd_section = indexData['METS']['dmdSec']
+                    metadata_container = dmd_section['ns0:xmlData_dict_list'][0]
+                    dc = metadata_container['ns1:dublincore_dict_list'][0]
+                except (KeyError, IndexError):
+                    dc = None
+                indexed_data[indexData['filePath']] = dc
+            return len(documents)
+        dummy_try_to_bulk_index.side_effect = get_dublincore_metadata
 
         # This METS file is a cut-down version of the AIP METS produced
         # using the SampleTransfers/DemoTransfer
@@ -121,7 +126,8 @@ class TestElasticSearchFunctions(unittest.TestCase):
         # - 5 checksum and csv files in the metadata directory
         # - 2 files generated in the transfer process
         assert indexed_files_count == 12
-        assert dummy_try_to_index.call_count == 12
+        assert len(indexed_data) == 12
+        assert dummy_wait_for_cluster_yellow_status.call_count == 1
 
         # Metadata should have been indexed only for these content
         # files because they are listed in the metadata.csv file
@@ -185,6 +191,29 @@ class TestElasticSearchFunctions(unittest.TestCase):
             )
             assert indexed_data[path] is None
 
+    @mock.patch('elasticSearchFunctions._try_to_index')
+    def test_try_to_bulk_index(self, dummy_try_to_index):
+        def bulk(body, **kwargs):
+            # Reject the second document of each chunk.
+            items = [{'index': {'status': 201}} for _ in body.splitlines()[::2]]
+            items[1]['index'] = {'status': 400, 'error': 'mapper_parsing_exception'}
+            return {'errors': True, 'items': items}
+        documents = ({'number': number} for number in range(5))
+
+        with mock.patch.object(self.client, 'bulk', side_effect=bulk) as dummy_bulk:
+            indexed = elasticSearchFunctions._try_to_bulk_index(
+                self.client, documents, 'aipfiles', chunk_size=3,
+                printfn=lambda *args: None)
+
+        assert indexed == 5
+        assert dummy_bulk.call_count == 2
+        assert dummy_bulk.call_args[1] == {'index': 'aipfiles', 'doc_type': '_doc'}
+        # Only the rejected documents are retried, one by one.
+        assert dummy_try_to_index.call_args_list == [
+            mock.call(self.client, {'number': 1}, 'aipfiles', printfn=ANY),
+            mock.call(self.client, {'number': 4}, 'aipfiles', printfn=ANY),
+        ]
+
     @patch('elasticSearchFunctions.create_indexes_if_needed')
     def test_default_setup(self, patch):
         elasticSearchFunctions.setup('elasticsearch:9200')
@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import uuid
+
+import pytest
+
+from main.models import File, FileChecksum, Transfer
+
+import file_checksums
+
+CONTENTS = b'checksum engine test' * 1000
+
+
+@pytest.fixture
+def files(db, tmpdir):
+    transfer = Transfer.objects.create(
+        uuid=str(uuid.uuid4()), currentlocation='%sharedPath%transfer/')
+    result = []
+    for name in ('a.txt', 'b.txt', 'c.txt'):
+        path = tmpdir.join(name)
+        path.write(name.encode() + CONTENTS)
+        file_ = File.objects.create(
+            uuid=str(uuid.uuid4()), transfer=transfer,
+            currentlocation='%transferDirectory%' + name)
+        result.append((file_.uuid, str(path)))
+    return result
+
+
+def _digest(algorithm, path):
+    with open(path, 'rb') as f:
+        return hashlib.new(algorithm, f.read()).hexdigest()
+
+
+def test_compute_checksums(tmpdir, mocker):
+    mocker.patch.object(file_checksums, 'READ_SIZE', 1000)
+    path = tmpdir.join('file.txt')
+    path.write(CONTENTS)
+
+    checksums = file_checksums.compute_checksums(str(path), ['sha256', 'md5'])
+
+    assert checksums == {
+        'sha256': _digest('sha256', str(path)),
+        'md5': _digest('md5', str(path)),
+    }
+
+
+def test_checksums_are_stored_and_reused(files, mocker):
+    compute = mocker.spy(file_checksums, 'compute_checksums')
+
+    results = file_checksums.get_checksums(files, ['sha256'], threads=2)
+
+    assert compute.call_count == 3
+    for file_uuid, path in files:
+        assert results[path] == {'sha256': _digest('sha256', path)}
+        assert FileChecksum.objects.filter(file_id=file_uuid).count() == 1
+
+    file_uuid, path = files[0]
+    assert file_checksums.get_file_checksums(path, ['sha256'], file_uuid=file_uuid) == results[path]
+    assert compute.call_count == 3
+
+
+def test_modified_files_are_read_again(files, mocker):
+    file_uuid, path = files[0]
+    file_checksums.get_file_checksums(path, ['sha256'], file_uuid=file_uuid)
+
+    with open(path, 'ab') as f:
+        f.write(b'more')
+    checksums = file_checksums.get_file_checksums(path, ['sha256'], file_uuid=file_uuid)
+
+    assert checksums['sha256'] == _digest('sha256', path)
+    assert FileChecksum.objects.get(file_id=file_uuid, algorithm='sha256').checksum == checksums['sha256']
+    assert FileChecksum.objects.filter(file_id=file_uuid).count() == 1
+
+
+def test_files_without_uuid_are_not_stored(files):
+    _, path = files[0]
+
+    checksums = file_checksums.get_file_checksums(path, ['sha256'])
+
+    assert checksums['sha256'] == _digest('sha256', path)
+    assert not FileChecksum.objects.exists()
@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+from fpr.models import Format, FormatGroup, FormatVersion, FPCommand, FPRule, FPTool
+
+import fpr_cache
+
+
+@pytest.fixture
+def cache():
+    fpr_cache.clear()
+    return fpr_cache
+
+
+@pytest.fixture
+def format_version(db):
+    group = FormatGroup.objects.create(description='Test group')
+    format_ = Format.objects.create(description='Test format', group=group)
+    return FormatVersion.objects.create(
+        format=format_, description='Test format 1.0', pronom_id='test/1')
+
+
+def _rule(format_version, purpose='access'):
+    tool = FPTool.objects.create(description='Test tool', version='1.0')
+    command = FPCommand.objects.create(
+        tool=tool, description='Convert', command='convert',
+        script_type='command', command_usage='normalization')
+    return FPRule.objects.create(
+        purpose=purpose, command=command, format=format_version)
+
+
+def test_lookups_are_cached(cache, format_version):
+    rule = _rule(format_version)
+
+    assert cache.get_format_version_by_puid('test/1') == format_version
+    assert cache.get_fprule('access', format_version) == rule
+
+    with CaptureQueriesContext(connection) as queries:
+        version = cache.get_format_version_by_puid('test/1')
+        assert version == format_version
+        assert version.format.description == 'Test format'
+        cached_rule = cache.get_fprule('access', format_version.uuid)
+        assert cached_rule.command.description == 'Convert'
+    assert len(queries) == 0
+
+
+def test_missing_rows_raise_like_get(cache, format_version):
+    with pytest.raises(FormatVersion.DoesNotExist):
+        cache.get_format_version_by_puid('test/2')
+    with pytest.raises(FPRule.DoesNotExist):
+        cache.get_fprule('access', format_version)
+    assert cache.get_fprules('default_test') == ()
+
+    _rule(format_version, purpose='default_test')
+    _rule(format_version, purpose='default_test')
+    cache.clear()
+    with pytest.raises(FPRule.MultipleObjectsReturned):
+        cache.get_fprule('default_test')
+
+
+def test_cache_is_dropped_when_the_fpr_changes(cache, format_version, mocker):
+    mocker.patch.object(cache._cache, 'check_interval', 0)
+    rule = _rule(format_version)
+    assert cache.get_fprules('access', format_version) == (rule,)
+
+    # Disabling a rule changes the fingerprint of the FPR tables.
+    FPRule.objects.filter(pk=rule.pk).update(enabled=False)
+    assert cache.get_fprules('access', format_version) == ()
+
+    new_rule = _rule(format_version)
+    assert cache.get_fprules('access', format_version) == (new_rule,)
+
+
+def test_changes_are_checked_once_per_interval(cache, format_version, mocker):
+    mocker.patch.object(cache._cache, 'check_interval', 3600)
+    rule = _rule(format_version)
+    assert cache.get_fprules('access', format_version) == (rule,)
+
+    FPRule.objects.filter(pk=rule.pk).update(enabled=False)
+    assert cache.get_fprules('access', format_version) == (rule,)
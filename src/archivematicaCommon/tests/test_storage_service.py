@@ -0,0 +1,152 @@
+# -*- coding: UTF-8 -*-
+import threading
+
+import pytest
+import requests
+
+import storageService as storage_service
+
+
+PIPELINE = {'uuid': 'pipeline-uuid', 'resource_uri': '/api/v2/pipeline/pipeline-uuid/'}
+
+
+def _response(data):
+    response = requests.Response()
+    response.status_code = 200
+    response.json = lambda: data
+    return response
+
+
+def _page(objects, offset, total):
+    return _response({
+        'meta': {'limit': len(objects), 'next': offset + len(objects) < total},
+        'objects': objects,
+    })
+
+
+@pytest.fixture
+def storage_api(request, mocker):
+    mocker.patch('storageService.get_setting', return_value='pipeline-uuid')
+    storage_service.clear_cache()
+    request.addfinalizer(storage_service.clear_cache)
+    pages = {
+        0: _page([{'uuid': 'location-1'}], 0, 2),
+        1: _page([{'uuid': 'location-2'}], 1, 2),
+    }
+
+    def get(session, url, params=None):
+        if '/pipeline/' in url:
+            return _response(PIPELINE)
+        return pages[params['offset']]
+
+    return mocker.patch.object(requests.Session, 'get', autospec=True, side_effect=get)
+
+
+def test_sessions_are_reused_per_thread(storage_api):
+    session = storage_service._storage_api_session()
+    assert storage_service._storage_api_session() is session
+    assert storage_service._storage_api_slow_session() is not session
+
+    other_thread_sessions = []
+    thread = threading.Thread(target=lambda: other_thread_sessions.append(
+        storage_service._storage_api_session()))
+    thread.start()
+    thread.join()
+    assert other_thread_sessions[0] is not session
+
+    storage_service.clear_cache()
+    assert storage_service._storage_api_session() is not session
+
+
+def test_lookups_are_cached(storage_api):
+    locations = storage_service.get_location(purpose='TS')
+    assert locations == [{'uuid': 'location-1'}, {'uuid': 'location-2'}]
+    # One request for the pipeline, two for the pages of locations
+    assert storage_api.call_count == 3
+
+    # Callers get their own copy of the results
+    locations.pop()
+    assert storage_service.get_location(purpose='TS') == [
+        {'uuid': 'location-1'}, {'uuid': 'location-2'}]
+    assert storage_service.get_pipeline('pipeline-uuid') == PIPELINE
+    assert storage_api.call_count == 3
+
+    storage_service.clear_cache()
+    storage_service.get_location(purpose='TS')
+    assert storage_api.call_count == 6
+
+
+def test_lookups_expire(storage_api, mocker):
+    mocker.patch.object(storage_service._cache, 'ttl', 0)
+    storage_service.get_pipeline('pipeline-uuid')
+    storage_service.get_pipeline('pipeline-uuid')
+    assert storage_api.call_count == 2
+
+
+def test_file_listings_are_streamed(storage_api):
+    files = storage_service.iter_file_info(status='DEL_REQ')
+    assert storage_api.call_count == 0
+
+    assert next(files) == {'uuid': 'location-1'}
+    assert storage_api.call_count == 1
+    assert list(files) == [{'uuid': 'location-2'}]
+    assert storage_api.call_count == 2
+
+
+def _accepted(poll_url):
+    response = _response(None)
+    response.status_code = 202
+    response.headers['Location'] = poll_url
+    return response
+
+
+def test_async_requests_are_awaited_together(storage_api, mocker):
+    sleep = mocker.patch('storageService.time.sleep')
+    polls = {
+        '/poll/1/': [{'completed': False}, {'completed': True, 'was_error': False, 'result': 1}],
+        '/poll/2/': [{'completed': False}, {'completed': False},
+                     {'completed': True, 'was_error': True, 'error': 'Full'}],
+        '/poll/3/': [{'completed': True, 'was_error': False, 'result': 3}],
+    }
+    storage_api.side_effect = lambda session, url: _response(polls[url].pop(0))
+    failed = _response(None)
+    failed.status_code = 500
+
+    results = storage_service.wait_for_async_all([
+        _accepted('/poll/1/'), _accepted('/poll/2/'), failed, _accepted('/poll/3/')])
+
+    assert [result for result, _ in results] == [1, None, None, 3]
+    assert isinstance(results[1][1], storage_service.WaitForAsyncError)
+    assert isinstance(results[2][1], requests.exceptions.HTTPError)
+    assert storage_api.call_count == 6
+    # The delay between polls doubles
+    assert sleep.call_args_list == [mocker.call(0.25), mocker.call(0.5)]
+
+
+def test_create_files(storage_api, mocker):
+    mocker.patch('storageService.time.sleep')
+    poll = mocker.patch('storageService.wait_for_async_all', return_value=[
+        ({'uuid': 'aip-1', 'status': 'UPLOADED'}, None),
+        (None, storage_service.WaitForAsyncError('Failure storing file')),
+    ])
+    post = mocker.patch.object(requests.Session, 'post', autospec=True,
+                               side_effect=lambda session, url, **kwargs: _accepted('/poll/'))
+    package = {
+        'origin_location': '/api/v2/location/cp/',
+        'origin_path': 'aip.7z',
+        'current_location': '/api/v2/location/as/',
+        'current_path': 'aip.7z',
+        'package_type': 'AIP',
+        'size': 1,
+    }
+
+    results = storage_service.create_files([
+        dict(package, uuid='aip-1'), dict(package, uuid='aip-2')])
+
+    assert results[0] == ({'uuid': 'aip-1', 'status': 'UPLOADED'}, None)
+    assert isinstance(results[1][1], storage_service.WaitForAsyncError)
+    assert [kwargs['json']['uuid'] for _, kwargs in post.call_args_list] == ['aip-1', 'aip-2']
+    assert post.call_args_list[0][1]['json']['origin_pipeline'] == PIPELINE['resource_uri']
+    # Both registrations are awaited at once
+    assert poll.call_count == 1
+    assert len(poll.call_args[0][0]) == 2
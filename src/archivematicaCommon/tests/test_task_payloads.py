@@ -0,0 +1,63 @@
+# -*- coding: UTF-8 -*-
+import cPickle
+
+import pytest
+
+import task_payloads
+
+
+def test_payloads_round_trip():
+    data = {
+        'createdDate': '2019-01-01 00:00:00+00:00',
+        'tasks': [
+            {
+                'uuid': 'ae8d4290-fe52-4954-b72a-0f591bee2e2f',
+                'arguments': u'"%SIPDirectory%objects/café.jpg"',
+                'wants_output': True,
+            },
+            {
+                'uuid': '1c3ea9fb-3ff5-4a42-8bf0-34d76e0d6dd6',
+                # Not valid UTF-8
+                'arguments': b'"%SIPDirectory%objects/caf\xe9.jpg"',
+                'wants_output': False,
+            },
+        ],
+        'exitCode': 0,
+        'missing': None,
+    }
+
+    decoded = task_payloads.loads(task_payloads.dumps(data))
+
+    assert decoded['tasks'][0]['arguments'] == u'"%SIPDirectory%objects/café.jpg"'.encode('utf-8')
+    assert decoded['tasks'][1]['arguments'] == b'"%SIPDirectory%objects/caf\xe9.jpg"'
+    assert all(isinstance(task['arguments'], bytes) for task in decoded['tasks'])
+    assert decoded['tasks'][1]['wants_output'] is False
+    assert decoded == dict(data, tasks=[
+        dict(data['tasks'][0], arguments=data['tasks'][0]['arguments'].encode('utf-8')),
+        data['tasks'][1],
+    ])
+
+
+def test_large_task_groups_are_compact():
+    data = {'tasks': [
+        {
+            'uuid': 'ae8d4290-fe52-4954-b72a-0f591bee%04d' % idx,
+            'arguments': '"ae8d4290-fe52-4954-b72a-0f591bee%04d" "%%SIPDirectory%%objects/file-%d.jpg" '
+                         '"/var/archivematica/sharedDirectory/currentlyProcessing/sip-uuid/" "preservation"' % (idx, idx),
+            'wants_output': False,
+        }
+        for idx in range(128)
+    ]}
+
+    assert len(task_payloads.dumps(data)) < len(cPickle.dumps(data)) / 4
+
+
+@pytest.mark.parametrize('payload', [
+    None,
+    cPickle.dumps({'task_results': {}}),
+    task_payloads.HEADER + b'\x02' + b'{}',
+    task_payloads.HEADER + b'\x01' + b'not compressed',
+])
+def test_invalid_payloads(payload):
+    with pytest.raises(task_payloads.PayloadError):
+        task_payloads.loads(payload)
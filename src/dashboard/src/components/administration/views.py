@@ -463,6 +463,7 @@ def general(request):
     if all(map(lambda form: form.is_valid(), forms)):
         for item in forms:
             item.save()
+        storage_service.clear_cache()
         messages.info(request, _('Saved.'))
 
     dashboard_uuid = helpers.get_setting('dashboard_uuid')
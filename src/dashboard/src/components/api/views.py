@@ -158,45 +158,24 @@ def get_unit_status(unit_uuid, unit_type):
     :param str unit_type: unitSIP or unitTransfer
     :return: Dict with status info.
     """
-    ret = {}
-    # get jobs for the current unit ordered by created time
-    unit_jobs = models.Job.objects.filter(sipuuid=unit_uuid).filter(unittype=unit_type).order_by('-createdtime', '-createdtimedec')
-    # tentatively choose the job with the latest created time to be the current/last for the unit
-    job = unit_jobs[0]
-
-    ret['microservice'] = job.jobtype
-    if job.currentstep == models.Job.STATUS_AWAITING_DECISION:
-        ret['status'] = 'USER_INPUT'
-    elif 'failed' in job.microservicegroup.lower():
-        ret['status'] = 'FAILED'
-    elif 'reject' in job.microservicegroup.lower():
-        ret['status'] = 'REJECTED'
-    elif job.jobtype == 'Remove the processing directory':  # Done storing AIP
-        ret['status'] = 'COMPLETE'
-    elif models.Job.objects.filter(sipuuid=unit_uuid).filter(jobtype='Create SIP from transfer objects').exists():
-        ret['status'] = 'COMPLETE'
-        # Get SIP UUID
-        sips = models.File.objects.filter(transfer_id=unit_uuid, sip__isnull=False).values('sip').distinct()
-        if sips:
-            ret['sip_uuid'] = sips[0]['sip']
-    elif models.Job.objects.filter(sipuuid=unit_uuid).filter(jobtype='Move transfer to backlog').exists():
-        ret['status'] = 'COMPLETE'
-        ret['sip_uuid'] = 'BACKLOG'
-    else:
-        ret['status'] = 'PROCESSING'
-
-    # The job with the latest created time is not always the last/current
-    # (Ref. https://github.com/archivematica/Issues/issues/262)
-    # As a workaround for SIPs, in case the job with latest created time
-    # is not the one that closes the chain, check if there could be a job
-    # that does so
-    # (a better fix would be to try to use microchain links related tables
-    # to obtain the actual last/current job, but this adds too much complexity)
-    if unit_type == 'unitSIP' and ret['status'] == 'PROCESSING':
-        for x in unit_jobs:
-            if x.jobtype == 'Remove the processing directory':
-                ret['status'] = 'COMPLETE'
-                break
+    unit_status = models.UnitStatus.objects.for_unit(unit_uuid, unit_type)
+    ret = {
+        'microservice': unit_status.microservice,
+        'status': unit_status.status,
+    }
+    if (unit_status.status == models.UnitStatus.STATUS_COMPLETE and
+            unit_status.microservice != 'Remove the processing directory'):
+        if unit_status.sip_created:
+            if not unit_status.sip_uuid:
+                # Get SIP UUID
+                sips = models.File.objects.filter(transfer_id=unit_uuid, sip__isnull=False).values('sip').distinct()
+                if sips:
+                    unit_status.sip_uuid = sips[0]['sip']
+                    unit_status.save(update_fields=['sip_uuid', 'updated_time'])
+            if unit_status.sip_uuid:
+                ret['sip_uuid'] = unit_status.sip_uuid
+        elif unit_status.moved_to_backlog:
+            ret['sip_uuid'] = 'BACKLOG'
 
     return ret
 
@@ -237,7 +216,7 @@ def status(request, unit_uuid, unit_type):
     # Get status (including new SIP uuid, current microservice)
     try:
         status_info = get_unit_status(unit_uuid, unit_type)
-    except IndexError as err:
+    except models.UnitStatus.DoesNotExist as err:
         msg = "Unable to determine the status of the unit {}".format(unit_uuid)
         LOGGER.error("%s (%s)", msg, err)
         return _error_response(msg, status_code=400)
@@ -366,21 +345,27 @@ def _completed_units(unit_type='transfer'):
     """
     model_name = {'transfer': 'Transfer', 'ingest': 'SIP'}.get(unit_type)
     model = getattr(models, model_name)
+    unit_type = 'unit{0}'.format(model_name)
     completed = []
-    units = model.objects.filter(hidden=False)
+    units = model.objects.filter(hidden=False).values_list('uuid', flat=True)
+    # The statuses of all the units are read at once
+    statuses = dict(models.UnitStatus.objects.filter(
+        unit_type=unit_type).values_list('unit_uuid', 'status'))
     status_err = None
-    for unit in units:
-        try:
-            status = get_unit_status(unit.uuid, 'unit{0}'.format(model_name))
-        except IndexError as err:
-            status_err = err
-            continue
-        if status.get('status') == 'COMPLETE':
-            completed.append(unit.uuid)
+    for unit_uuid in units:
+        status = statuses.get(unit_uuid)
+        if status is None:
+            try:
+                status = models.UnitStatus.objects.for_unit(unit_uuid, unit_type).status
+            except models.UnitStatus.DoesNotExist as err:
+                status_err = err
+                continue
+        if status == models.UnitStatus.STATUS_COMPLETE:
+            completed.append(unit_uuid)
     if status_err:
         LOGGER.warning(
             "Unable to determine status of at least one unit,"
-            " e.g.: unit %s (%s)", unit.uuid, model_name)
+            " e.g.: unit %s (%s)", unit_uuid, model_name)
     return completed
 
 
@@ -544,6 +529,7 @@ def reingest(request, target):
     # TODO Clear DB of residual stuff related to SIP
     models.Task.objects.filter(job__sipuuid=sip_uuid).delete()
     models.Job.objects.filter(sipuuid=sip_uuid).delete()
+    models.UnitStatus.objects.filter(unit_uuid=sip_uuid).delete()  # Computed from the jobs
     models.SIP.objects.filter(uuid=sip_uuid).delete()  # Delete is cascading
     models.RightsStatement.objects.filter(metadataappliestoidentifier=sip_uuid).delete()  # Not actually a foreign key
     models.DublinCore.objects.filter(metadataappliestoidentifier=sip_uuid).delete()
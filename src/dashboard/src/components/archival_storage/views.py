@@ -372,13 +372,11 @@ def send_thumbnail(request, fileuuid):
 def aips_pending_deletion():
     aip_uuids = []
     try:
-        aips = storage_service.get_file_info(status='DEL_REQ')
+        for aip in storage_service.iter_file_info(status='DEL_REQ'):
+            aip_uuids.append(aip['uuid'])
     except Exception as e:
         # TODO this should be messages.warning, but we need 'request' here
         logger.warning("Error retrieving AIPs pending deletion: is the storage server running?  Error: {}".format(e))
-    else:
-        for aip in aips:
-            aip_uuids.append(aip['uuid'])
     return aip_uuids
 
 
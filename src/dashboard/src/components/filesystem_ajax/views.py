@@ -25,7 +25,7 @@ import tempfile
 import uuid
 
 from django.conf import settings as django_settings
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 import django.http
 import django.template.defaultfilters
 from django.utils.translation import ugettext as _, ungettext
@@ -37,6 +37,7 @@ from main import models
 
 import archivematicaFunctions
 import databaseFunctions
+import elasticSearchFunctions
 import storageService as storage_service
 
 # for unciode sorting support
@@ -52,6 +53,10 @@ ORIGINAL_DIR = os.path.join(SHARED_DIRECTORY_ROOT, 'www', 'AIPsStore', 'transfer
 DEFAULT_BACKLOG_PATH = 'originals/'
 DEFAULT_ARRANGE_PATH = '/arrange/'
 
+# Number of SIPArrange entries inserted per query when copying to the
+# arrangement.
+BULK_CREATE_SIZE = 500
+
 TRANSFER_TYPE_DIRECTORIES = {
     'standard': 'standardTransfer',
     'unzipped bag': 'baggitDirectory',
@@ -146,12 +151,12 @@ def arrange_contents(request, path=None):
     if not base_path.startswith(DEFAULT_ARRANGE_PATH):
         base_path = DEFAULT_ARRANGE_PATH
 
-    # Query SIP Arrangement for results
-    # Get all the paths that are not in SIPs and start with base_path.  We don't
-    # need the objects, just the arrange_path
-    paths = models.SIPArrange.objects.filter(sip_created=False).filter(aip_created=False).filter(arrange_path__startswith=base_path).order_by('arrange_path')
+    # Query SIP Arrangement for the entries directly within base_path that are
+    # not in SIPs
+    children = list(models.SIPArrange.objects.children(base_path))
 
-    if len(paths) == 0 and base_path != DEFAULT_ARRANGE_PATH:
+    if not children and base_path != DEFAULT_ARRANGE_PATH and not models.SIPArrange.objects.filter(
+            arrange_path_hash=models.SIPArrange.path_hash(base_path)).exists():
         response = {
             'success': False,
             'message': _('No files or directories found under path: %(path)s') % {'path': base_path}
@@ -163,24 +168,17 @@ def arrange_contents(request, path=None):
     entries = set()
     directories = set()
     properties = {}
-    for item in paths:
-        # Strip common prefix
-        path_parts = item.arrange_path.replace(base_path, '', 1).split('/')
-        entry = path_parts[0]
-        if not entry:
-            continue
+    for item in children:
+        entry = os.path.basename(item.arrange_path.rstrip('/'))
         entries.add(entry)
         # Specify level of description if set
         if item.level_of_description:
-            properties[entry] = properties.get(entry, {})  # Default empty dict
-            # Don't overwrite if already exists
-            properties[entry]['levelOfDescription'] = properties[entry].get('levelOfDescription') or item.level_of_description
-        if len(path_parts) > 1:  # Path is a directory
+            properties.setdefault(entry, {})['levelOfDescription'] = item.level_of_description
+        if item.arrange_path.endswith('/'):  # Path is a directory
             directories.add(entry)
-            # Don't add directories to the object count
-            if path_parts[-1]:
-                properties[entry] = properties.get(entry, {})  # Default empty dict
-                properties[entry]['object count'] = properties[entry].get('object count', 0) + 1  # Increment object count
+            object_count = models.SIPArrange.objects.get_object_count(item)
+            if object_count:
+                properties.setdefault(entry, {})['object count'] = object_count
 
     response = {'entries': list(entries), 'directories': list(directories), 'properties': properties}
     response = _prepare_browse_response(response)
@@ -202,6 +200,7 @@ def delete_arrange(request, filepath=None):
     # Delete access mapping if found
     models.SIPArrangeAccessMapping.objects.filter(arrange_path=filepath).delete()
     models.SIPArrange.objects.filter(arrange_path__startswith=filepath).delete()
+    models.SIPArrange.objects.invalidate_object_counts(filepath)
     return helpers.json_response({'message': _('Delete successful.')})
 
 
@@ -355,22 +354,28 @@ def create_arranged_sip(staging_sip_path, files, sip_uuid):
         sip.diruuids = diruuids
         sip.save()
 
-    # Update currentLocation of files
+    # Update currentLocation of files, in bulk
     # Also get all directory paths implicit in all of the file paths
     directories = set()
-    for file_ in files:
-        if file_.get('uuid'):
-            # Strip 'arrange/sip_name' from file path
-            in_sip_path = '/'.join(file_['destination'].split('/')[2:])
-            currentlocation = '%SIPDirectory%' + in_sip_path
-            models.File.objects.filter(uuid=file_['uuid']).update(
-                sip=sip_uuid, currentlocation=currentlocation)
-            # Get all ancestor directory paths of the file's destination.
-            subdir = os.path.dirname(currentlocation)
-            while subdir:
-                directory = subdir.replace('%SIPDirectory%', '%SIPDirectory%objects/')
-                directories.add(directory)
-                subdir = os.path.dirname(subdir)
+    with databaseFunctions.buffered_writes():
+        for file_ in files:
+            if file_.get('uuid'):
+                # Strip 'arrange/sip_name' from file path
+                in_sip_path = '/'.join(file_['destination'].split('/')[2:])
+                currentlocation = '%SIPDirectory%' + in_sip_path
+                databaseFunctions.update_object(
+                    models.File, file_['uuid'],
+                    sip=sip_uuid, currentlocation=currentlocation)
+                # Get all ancestor directory paths of the file's destination,
+                # up to the first one already found for another file: its
+                # ancestors were found too.
+                subdir = os.path.dirname(currentlocation)
+                while subdir:
+                    directory = subdir.replace('%SIPDirectory%', '%SIPDirectory%objects/')
+                    if directory in directories:
+                        break
+                    directories.add(directory)
+                    subdir = os.path.dirname(subdir)
 
     if diruuids:
         # Create new Directory models for all subdirectories in the newly
@@ -508,6 +513,7 @@ def copy_from_arrange_to_completed_common(filepath, sip_uuid, sip_name):
                 arranged_entry.sip_id = sip_uuid
                 arranged_entry.sip_created = True
                 arranged_entry.save()
+            models.SIPArrange.objects.invalidate_object_counts(filepath)
 
     if error is not None:
         response = {
@@ -574,7 +580,11 @@ def move_files_within_arrange(sourcepath, destination):
                 entry.arrange_path = entry.arrange_path.replace(source_parent, destination, 1)
                 entry.save()
         else:  # source is a file
-            models.SIPArrange.objects.filter(arrange_path=sourcepath).update(arrange_path=destination + os.path.basename(sourcepath))
+            for entry in models.SIPArrange.objects.filter(arrange_path_hash=models.SIPArrange.path_hash(sourcepath)):
+                entry.arrange_path = destination + os.path.basename(sourcepath)
+                entry.save()
+        models.SIPArrange.objects.invalidate_object_counts(sourcepath)
+        models.SIPArrange.objects.invalidate_object_counts(destination)
     else:  # destination is a file (this should have been caught by JS)
         raise ValueError(_('You cannot drag and drop onto a file.'))
 
@@ -585,6 +595,25 @@ def _get_arrange_directory_tree(backlog_uuid, original_path, arrange_path):
 
     Helper function for copy_to_arrange.
     """
+    ret = _browse_arrange_directory_tree(backlog_uuid, original_path, arrange_path)
+
+    # Look up the UUIDs of all the files at once
+    relative_paths = [
+        entry['original_path'].replace(DEFAULT_BACKLOG_PATH, '', 1)
+        for entry in ret if entry['original_path'] is not None]
+    file_info = _get_backlog_file_info(relative_paths)
+    for entry in ret:
+        if entry['original_path'] is not None:
+            relative_path = entry['original_path'].replace(DEFAULT_BACKLOG_PATH, '', 1)
+            entry['file_uuid'], entry['transfer_uuid'] = file_info[relative_path]
+
+    return ret
+
+
+def _browse_arrange_directory_tree(backlog_uuid, original_path, arrange_path):
+    """ Lists the tree of original_path from backlog_uuid, with the paths of
+    its files and directories in arrange_path but without the file UUIDs.
+    """
     # TODO Use ElasticSearch, since that's where we're getting the original info from now?  Could be easier to get file UUID that way
     ret = []
     browse = storage_service.browse_location(backlog_uuid, original_path)
@@ -593,20 +622,11 @@ def _get_arrange_directory_tree(backlog_uuid, original_path, arrange_path):
     entries = [e for e in browse['entries'] if e not in browse['directories']]
     for entry in entries:
         if entry not in ('processingMCP.xml'):
-            path = os.path.join(original_path, entry)
-            relative_path = path.replace(DEFAULT_BACKLOG_PATH, '', 1)
-            try:
-                file_info = storage_service.get_file_metadata(relative_path=relative_path)[0]
-            except storage_service.ResourceNotFound:
-                logger.warning('No file information returned from the Storage Service for file at relative_path: %s', relative_path)
-                raise
-            file_uuid = file_info['fileuuid']
-            transfer_uuid = file_info['sipuuid']
             ret.append({
-                'original_path': path,
+                'original_path': os.path.join(original_path, entry),
                 'arrange_path': os.path.join(arrange_path, entry),
-                'file_uuid': file_uuid,
-                'transfer_uuid': transfer_uuid,
+                'file_uuid': None,
+                'transfer_uuid': None,
             })
 
     # Add directories and recurse, adding their children too
@@ -622,11 +642,95 @@ def _get_arrange_directory_tree(backlog_uuid, original_path, arrange_path):
                 'file_uuid': None,
                 'transfer_uuid': None,
             })
-            ret.extend(_get_arrange_directory_tree(backlog_uuid, original_dir, arrange_dir))
+            ret.extend(_browse_arrange_directory_tree(backlog_uuid, original_dir, arrange_dir))
+
+    return ret
+
+
+def _get_backlog_file_info(relative_paths):
+    """ Returns the file and transfer UUIDs of the files at relative_paths in
+    the backlog, by relative path.
+
+    The UUIDs of the files of each transfer are fetched from the transfer
+    files index at once if it's enabled, the Storage Service is only asked
+    about the others.
+    """
+    ret = {}
+    uuid_regex = r'-(?P<uuid>[\w]{8}(-[\w]{4}){3}-[\w]{12})$'
+    transfer_uuids = set()
+    for relative_path in relative_paths:
+        match = re.search(uuid_regex, relative_path.split('/', 1)[0])
+        if match:
+            transfer_uuids.add(match.group('uuid'))
+    if transfer_uuids and 'transfers' in django_settings.SEARCH_ENABLED:
+        try:
+            es_client = elasticSearchFunctions.get_client()
+            for transfer_uuid in transfer_uuids:
+                file_uuids = elasticSearchFunctions.get_transfer_file_uuids(es_client, transfer_uuid)
+                ret.update((path, (file_uuid, transfer_uuid)) for path, file_uuid in file_uuids.items())
+        except Exception:
+            logger.warning('Unable to fetch the file UUIDs of transfers %s from the index', transfer_uuids, exc_info=True)
+
+    for relative_path in relative_paths:
+        if relative_path in ret:
+            continue
+        try:
+            file_info = storage_service.get_file_metadata(relative_path=relative_path)[0]
+        except storage_service.ResourceNotFound:
+            logger.warning('No file information returned from the Storage Service for file at relative_path: %s', relative_path)
+            raise
+        ret[relative_path] = (file_info['fileuuid'], file_info['sipuuid'])
 
     return ret
 
 
+def _create_arrange_entries(entries):
+    """ Creates the SIPArrange entries for the dicts in entries, in bulk.
+
+    Files already in the arrangement are skipped, since a file can only be in
+    one SIP.
+    """
+    file_uuids = [entry['file_uuid'] for entry in entries if entry['file_uuid']]
+    arranged = set()
+    for start in range(0, len(file_uuids), BULK_CREATE_SIZE):
+        arranged.update(models.SIPArrange.objects.filter(
+            file_uuid__in=file_uuids[start:start + BULK_CREATE_SIZE],
+        ).values_list('file_uuid', flat=True))
+
+    new_entries = []
+    for entry in entries:
+        if entry['file_uuid'] in arranged:
+            logger.info('Skipping file already arranged: %s', entry)
+            continue
+        if entry['file_uuid']:
+            arranged.add(entry['file_uuid'])
+        sip_arrange = models.SIPArrange(
+            original_path=entry['original_path'],
+            arrange_path=entry['arrange_path'],
+            file_uuid=entry['file_uuid'],
+            transfer_uuid=entry['transfer_uuid'],
+        )
+        # bulk_create doesn't send the pre_save signal
+        sip_arrange.update_path_hashes()
+        new_entries.append(sip_arrange)
+
+    try:
+        with transaction.atomic():
+            models.SIPArrange.objects.bulk_create(new_entries, batch_size=BULK_CREATE_SIZE)
+    except IntegrityError:
+        # The files were arranged concurrently: insert the entries one by one
+        for sip_arrange in new_entries:
+            try:
+                # TODO enforce uniqueness on arrange panel?
+                with transaction.atomic():
+                    sip_arrange.save()
+            except IntegrityError:
+                # FIXME Expecting this to catch duplicate original_paths, which
+                # we want to ignore since a file can only be in one SIP.  Needs
+                # to be updated not to ignore other classes of IntegrityErrors.
+                logger.exception('Integrity error inserting: %s', sip_arrange)
+
+
 def copy_files_to_arrange(sourcepath, destination, fetch_children=False, backlog_uuid=None):
     sourcepath = sourcepath.lstrip('/')  # starts with 'originals/', not '/originals/'
     # Insert each file into the DB
@@ -695,20 +799,8 @@ def copy_files_to_arrange(sourcepath, destination, fetch_children=False, backlog
     logger.info('arrange_path: %s', arrange_path)
     logger.debug('files to be added: %s', to_add)
 
-    for entry in to_add:
-        try:
-            # TODO enforce uniqueness on arrange panel?
-            models.SIPArrange.objects.create(
-                original_path=entry['original_path'],
-                arrange_path=entry['arrange_path'],
-                file_uuid=entry['file_uuid'],
-                transfer_uuid=entry['transfer_uuid'],
-            )
-        except IntegrityError:
-            # FIXME Expecting this to catch duplicate original_paths, which
-            # we want to ignore since a file can only be in one SIP.  Needs
-            # to be updated not to ignore other classes of IntegrityErrors.
-            logger.exception('Integrity error inserting: %s', entry)
+    _create_arrange_entries(to_add)
+    models.SIPArrange.objects.invalidate_object_counts(arrange_path)
 
 
 def copy_to_arrange(request, sources=None, destinations=None, fetch_children=False):
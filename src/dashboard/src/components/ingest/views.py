@@ -47,6 +47,7 @@ from components import helpers
 from components import decorators
 from components.ingest import forms as ingest_forms
 from components.ingest.views_NormalizationReport import getNormalizationReportQuery
+from components.filesystem_ajax.views import DEFAULT_BACKLOG_PATH
 from main import forms, models
 
 import archivematicaFunctions
@@ -55,6 +56,9 @@ import storageService as storage_service
 
 logger = logging.getLogger('archivematica.dashboard')
 
+# Number of file UUIDs looked up per query in the SIP arrangement.
+ARRANGED_FILES_QUERY_SIZE = 500
+
 """ @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
       Ingest
     @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@ """
@@ -573,12 +577,10 @@ def transfer_backlog(request, ui):
     directory_map = {}
     # _es_results_to_directory_tree requires that paths MUST be sorted
     results.sort(key=lambda x: x['relative_path'])
+    arranged_paths = _arranged_backlog_paths(results)
     for path in results:
         # If a path is in SIPArrange.original_path, then it shouldn't be draggable
-        not_draggable = False
-        if models.SIPArrange.objects.filter(
-                original_path__endswith=path['relative_path']).exists():
-            not_draggable = True
+        not_draggable = path['relative_path'] in arranged_paths
         if ui == 'legacy':
             _es_results_to_directory_tree(path['relative_path'], return_list, not_draggable=not_draggable)
         else:
@@ -596,6 +598,41 @@ def transfer_backlog(request, ui):
     return helpers.json_response(response)
 
 
+def _arranged_backlog_paths(results):
+    """Return the relative paths of the backlog files in ``results`` (transfer
+    files search results) that were copied to the arrangement.
+
+    Files are matched by UUID, using the index on ``SIPArrange.file_uuid``.
+    The arranged files without UUID, and all of them if some results have no
+    UUID, are matched by their path in the backlog.
+    """
+    paths_by_uuid = {}
+    for result in results:
+        if result.get('fileuuid'):
+            paths_by_uuid[result['fileuuid']] = result['relative_path']
+
+    arranged_paths = set()
+    file_uuids = list(paths_by_uuid)
+    for start in range(0, len(file_uuids), ARRANGED_FILES_QUERY_SIZE):
+        arranged_uuids = models.SIPArrange.objects.filter(
+            file_uuid__in=file_uuids[start:start + ARRANGED_FILES_QUERY_SIZE],
+        ).values_list('file_uuid', flat=True)
+        arranged_paths.update(paths_by_uuid[file_uuid] for file_uuid in arranged_uuids)
+
+    relative_paths = set(result['relative_path'] for result in results)
+    arranged = models.SIPArrange.objects.filter(original_path__isnull=False)
+    if len(paths_by_uuid) == len(results):
+        arranged = arranged.filter(file_uuid__isnull=True)
+    for original_path in arranged.values_list('original_path', flat=True).iterator():
+        relative_path = original_path.lstrip('/')
+        if relative_path.startswith(DEFAULT_BACKLOG_PATH):
+            relative_path = relative_path[len(DEFAULT_BACKLOG_PATH):]
+        if relative_path in relative_paths:
+            arranged_paths.add(relative_path)
+
+    return arranged_paths
+
+
 def transfer_file_download(request, uuid):
     # get file basename
     try:
@@ -67,7 +67,7 @@ class IDToolForm(forms.ModelForm):
 class IDCommandForm(forms.ModelForm):
     class Meta:
         model = fprmodels.IDCommand
-        fields = ('tool', 'description', 'config', 'script_type', 'script',)
+        fields = ('tool', 'description', 'config', 'script_type', 'script', 'batch',)
 
 
 # ########## ID RULES ############
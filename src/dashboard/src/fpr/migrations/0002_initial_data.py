@@ -3,13 +3,14 @@ from __future__ import unicode_literals
 
 import os
 
-from django.core.management import call_command
 from django.db import migrations
 
+from fpr.utils import load_fixture
+
 
 def load_fixtures(apps, schema_editor):
     fixture_file = os.path.join(os.path.dirname(__file__), 'initial_data.json')
-    call_command('loaddata', fixture_file, app_label='main')
+    load_fixture(apps, fixture_file)
 
 
 class Migration(migrations.Migration):
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fpr', '0029_update_inkscape_svg_command'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idcommand',
+            name='batch',
+            field=models.BooleanField(default=False, help_text='Run the script once for a whole batch of files. The script receives every file path as an argument and prints a JSON object mapping each path to its output, or to null if it could not be identified.', verbose_name='batch mode'),
+        ),
+    ]
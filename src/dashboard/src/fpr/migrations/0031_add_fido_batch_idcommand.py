@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Add a batch mode Fido identification command.
+
+The command identifies a whole batch of files with a single Fido process, so
+the PRONOM signatures are only loaded once per batch instead of once per file.
+It is disabled by default; it can be enabled from the FPR.
+"""
+
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+FIDO_TOOL_UUID = 'c33c9d4d-121f-4db1-aa31-3d248c705e44'
+FIDO_BATCH_CMD_UUID = '1f46c928-6bff-4cd2-b207-d0490040114f'
+
+FIDO_BATCH_SCRIPT = r"""
+import json
+import os.path
+import re
+import subprocess
+import sys
+
+# Fido prints a record for each match (or one if there is no match). Fields
+# and records are separated by NUL bytes, which can't be part of a path.
+MATCH_FORMAT = r'OK\x00%(info.filename)s\x00%(info.puid)s\x00'
+NO_MATCH_FORMAT = r'KO\x00%(info.filename)s\x00\x00'
+
+
+def file_tool(path):
+    return subprocess.check_output(['file', path]).strip()
+
+
+class FidoFailed(Exception):
+    def __init__(self, stderr, retcode):
+        message = "Fido exited {retcode}.\nstderr: {stderr}".format(
+            stderr=stderr, retcode=retcode)
+        super(FidoFailed, self).__init__(message)
+
+
+def identify(paths):
+    # The default buffer size fido uses, 256KB, is too small to be able to detect certain formats
+    # Formats like office documents and Adobe Illustrator .ai files will be identified as other, less-specific formats
+    # This larger buffer size is a bit slower and consumes more RAM, so some users may wish to customize this to reduce the buffer size
+    # See: https://projects.artefactual.com/issues/5941, https://projects.artefactual.com/issues/5731
+    cmd = ['fido', '-q', '-bufsize', '1048576',
+           '-loadformats', '/usr/lib/archivematica/archivematicaCommon/externals/fido/archivematica_format_extensions.xml',
+           '-matchprintf', MATCH_FORMAT, '-nomatchprintf', NO_MATCH_FORMAT]
+    cmd.extend(paths)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise FidoFailed(stderr, process.returncode)
+
+    fields = stdout.split('\x00')
+    puids = {}
+    for status, path, puid in zip(fields[0::3], fields[1::3], fields[2::3]):
+        # Like the single file command, only the first match is used.
+        if path not in puids:
+            puids[path] = puid if status == 'OK' else None
+    return puids
+
+
+def output_for(path, puid):
+    if puid is None:
+        # FIDO can't currently identify text files with no extension, and this
+        # is a common enough usecase to special-case it
+        try:
+            if 'text' in file_tool(path):
+                return 'x-fmt/111'
+        except subprocess.CalledProcessError:
+            pass
+        return None
+    if re.match('(.+)?fmt\/\d+', puid):
+        return puid
+    print >> sys.stderr, "{path} identified as non-standard Fido code: {id}".format(path=path, id=puid)
+    return ""
+
+
+def main(argv):
+    try:
+        puids = identify([os.path.abspath(path) for path in argv[1:]])
+    except Exception as e:
+        return e
+    print json.dumps({path: output_for(path, puids.get(os.path.abspath(path)))
+                      for path in argv[1:]})
+    return 0
+
+if __name__ == '__main__':
+    exit(main(sys.argv))
+"""
+
+
+def data_migration_up(apps, schema_editor):
+    IDCommand = apps.get_model('fpr', 'IDCommand')
+
+    IDCommand.objects.create(
+        uuid=FIDO_BATCH_CMD_UUID,
+        tool_id=FIDO_TOOL_UUID,
+        description='Identify using Fido 1.3.12 (batch mode)',
+        config='PUID',
+        script=FIDO_BATCH_SCRIPT,
+        script_type='pythonScript',
+        batch=True,
+        enabled=False)
+
+
+def data_migration_down(apps, schema_editor):
+    IDCommand = apps.get_model('fpr', 'IDCommand')
+
+    IDCommand.objects.filter(uuid=FIDO_BATCH_CMD_UUID).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fpr', '0030_idcommand_batch'),
+    ]
+
+    operations = [
+        migrations.RunPython(data_migration_up, data_migration_down),
+    ]
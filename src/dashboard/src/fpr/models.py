@@ -211,6 +211,7 @@ class IDCommand(VersionedModel, models.Model):
     )
     script_type = models.CharField(_('script type'), max_length=16, choices=SCRIPT_TYPE_CHOICES)
     tool = models.ForeignKey('IDTool', to_field='uuid', null=True, verbose_name=_('the related tool'))
+    batch = models.BooleanField(_('batch mode'), default=False, help_text=_("Run the script once for a whole batch of files. The script receives every file path as an argument and prints a JSON object mapping each path to its output, or to null if it could not be identified."))
 
     class Meta:
         verbose_name = _("Format identification command")
@@ -1,6 +1,9 @@
+# stdlib, alphabetical
+import json
+
 # Django core, alphabetical
 from django.contrib import messages
-from django.db import models
+from django.db import connection, models
 from django.utils.translation import ugettext as _
 
 # External dependencies, alphabetical
@@ -100,3 +103,31 @@ def get_current_revision_using_ancestor(model, ancestor_uuid):
         return descendants[0]
     else:
         return None
+
+
+# ########## MIGRATIONS ############
+
+def load_fixture(apps, fixture_file):
+    """ Load a JSON fixture in a data migration.
+
+    Unlike the loaddata command, which uses the current models, the objects
+    are built from the historical models in 'apps'. Fields added to the models
+    by later migrations don't exist in the database yet at this point. """
+    with open(fixture_file) as f:
+        items = json.load(f)
+    table_names = set()
+    with connection.constraint_checks_disabled():
+        for item in items:
+            model = apps.get_model(item['model'])
+            obj = model(pk=model._meta.pk.to_python(item['pk']))
+            for name, value in item['fields'].items():
+                field = model._meta.get_field(name)
+                if field.is_relation:
+                    # Foreign keys are given by the value of their to_field
+                    setattr(obj, field.attname, value)
+                else:
+                    setattr(obj, name, field.to_python(value))
+            # Saved as is, like loaddata does: e.g. slugs aren't generated
+            obj.save_base(raw=True)
+            table_names.add(model._meta.db_table)
+    connection.check_constraints(table_names=table_names)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0067_delete_workflow_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileChecksum',
+            fields=[
+                ('id', models.AutoField(serialize=False, editable=False, primary_key=True, db_column=b'pk')),
+                ('algorithm', models.CharField(max_length=36)),
+                ('checksum', models.CharField(max_length=128)),
+                ('size', models.BigIntegerField()),
+                ('modified', models.FloatField()),
+                ('file', models.ForeignKey(to='main.File', db_column=b'fileUUID')),
+            ],
+            options={
+                'db_table': 'FilesChecksums',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='filechecksum',
+            unique_together=set([('file', 'algorithm')]),
+        ),
+    ]
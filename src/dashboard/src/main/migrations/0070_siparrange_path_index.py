@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Index the arrangement tree by path and parent directory.
+
+Also creates the entries of the directories that only existed implicitly, as
+the prefix of the paths of other entries, so that they are listed by their
+parent directory.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import os
+
+from django.db import migrations, models
+
+
+ARRANGE_PATH = '/arrange/'
+
+
+def _path_hash(path):
+    if isinstance(path, type(u'')):
+        path = path.encode('utf-8')
+    return hashlib.sha1(path).hexdigest()
+
+
+def _parent_path(path):
+    return os.path.join(os.path.dirname(path.rstrip('/')), '')
+
+
+def data_migration(apps, schema_editor):
+    SIPArrange = apps.get_model('main', 'SIPArrange')
+    paths = set()
+    directories = set()
+    for entry in SIPArrange.objects.only('arrange_path', 'sip_created', 'aip_created').iterator():
+        path = entry.arrange_path
+        SIPArrange.objects.filter(pk=entry.pk).update(
+            arrange_path_hash=_path_hash(path),
+            parent_path_hash=_path_hash(_parent_path(path)))
+        if entry.sip_created or entry.aip_created or not path.startswith(ARRANGE_PATH):
+            continue
+        paths.add(path)
+        path = _parent_path(path)
+        while path.startswith(ARRANGE_PATH) and path != ARRANGE_PATH:
+            directories.add(path)
+            path = _parent_path(path)
+
+    for path in sorted(directories - paths):
+        SIPArrange.objects.create(
+            arrange_path=path,
+            arrange_path_hash=_path_hash(path),
+            parent_path_hash=_path_hash(_parent_path(path)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0069_task_execution_starttime_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siparrange',
+            name='arrange_path_hash',
+            field=models.CharField(default=b'', max_length=40, editable=False, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='siparrange',
+            name='object_count',
+            field=models.IntegerField(default=None, null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='siparrange',
+            name='parent_path_hash',
+            field=models.CharField(default=b'', max_length=40, editable=False, db_index=True),
+        ),
+        migrations.RunPython(data_migration, migrations.RunPython.noop),
+    ]
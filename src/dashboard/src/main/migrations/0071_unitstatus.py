@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Add the table of the statuses of units.
+
+The statuses of existing units are computed from their jobs the first time
+they are needed.
+"""
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0070_siparrange_path_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitStatus',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('unit_uuid', models.CharField(max_length=36)),
+                ('unit_type', models.CharField(max_length=50)),
+                ('status', models.CharField(default=b'PROCESSING', max_length=10, choices=[(b'PROCESSING', 'Processing'), (b'USER_INPUT', 'Awaiting decision'), (b'FAILED', 'Failed'), (b'REJECTED', 'Rejected'), (b'COMPLETE', 'Complete')])),
+                ('job_uuid', django_extensions.db.fields.UUIDField(default=None, editable=False, max_length=36, blank=True, null=True, db_index=True)),
+                ('microservice', models.CharField(max_length=250, blank=True)),
+                ('microservice_group', models.CharField(max_length=50, blank=True)),
+                ('current_step', models.IntegerField(default=0, choices=[(0, 'Unknown'), (1, 'Awaiting decision'), (2, 'Completed successfully'), (3, 'Executing command(s)'), (4, 'Failed')])),
+                ('sip_created', models.BooleanField(default=False)),
+                ('moved_to_backlog', models.BooleanField(default=False)),
+                ('processing_directory_removed', models.BooleanField(default=False)),
+                ('sip_uuid', models.CharField(max_length=36, blank=True)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('updated_time', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='unitstatus',
+            unique_together=set([('unit_uuid', 'unit_type')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='unitstatus',
+            index_together=set([('unit_type', 'status')]),
+        ),
+    ]
@@ -20,13 +20,15 @@
 # Feel free to rename the models, but don't rename db_table values or field names.
 
 # stdlib, alphabetical by import source
+import hashlib
 import logging
+import os
 import re
 
 # Core Django, alphabetical by import source
 from django.contrib.auth.models import User
-from django.db import models, transaction
-from django.db.models.signals import post_save
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 from django.utils import six
@@ -353,10 +355,48 @@ class Transfer(models.Model):
             "Transfer", self.uuid, user_id)
 
 
+class SIPArrangeManager(models.Manager):
+
+    def children(self, path):
+        """Entries directly within the directory ``path``, not in a SIP yet."""
+        return self.get_queryset().filter(
+            parent_path_hash=SIPArrange.path_hash(path),
+            sip_created=False, aip_created=False)
+
+    def get_object_count(self, directory):
+        """Number of files within the ``directory`` entry, computed and
+        stored if it isn't known."""
+        if directory.object_count is None:
+            directory.object_count = self.get_queryset().filter(
+                sip_created=False, aip_created=False,
+                arrange_path__startswith=directory.arrange_path,
+            ).exclude(arrange_path__endswith='/').count()
+            self.get_queryset().filter(pk=directory.pk).update(
+                object_count=directory.object_count)
+        return directory.object_count
+
+    def invalidate_object_counts(self, path):
+        """Forget the object counts of the directories containing ``path``,
+        after entries are added to or removed from it."""
+        paths = [path]
+        while path not in ('/', ''):
+            path = SIPArrange.parent_path(path)
+            paths.append(path)
+        self.get_queryset().filter(
+            arrange_path_hash__in=[SIPArrange.path_hash(p) for p in paths],
+        ).update(object_count=None)
+
+
 class SIPArrange(models.Model):
     """ Information about arranged files: original and arranged location, current status. """
     original_path = BlobTextField(null=True, blank=True, default=None)
     arrange_path = BlobTextField()
+    # Hashes of arrange_path and of the path of its parent directory, to look
+    # up entries and the children of directories using an index.
+    arrange_path_hash = models.CharField(max_length=40, db_index=True, default='', editable=False)
+    parent_path_hash = models.CharField(max_length=40, db_index=True, default='', editable=False)
+    # Number of files within directories, None if it must be computed again.
+    object_count = models.IntegerField(null=True, default=None, editable=False)
     file_uuid = UUIDField(auto=False, null=True, blank=True, default=None, unique=True)
     transfer_uuid = UUIDField(auto=False, null=True, blank=True, default=None)
     sip = models.ForeignKey(SIP, to_field='uuid', null=True, blank=True, default=None)
@@ -364,6 +404,8 @@ class SIPArrange(models.Model):
     sip_created = models.BooleanField(default=False)
     aip_created = models.BooleanField(default=False)
 
+    objects = SIPArrangeManager()
+
     class Meta:
         verbose_name = _("Arranged SIPs")
 
@@ -373,6 +415,26 @@ class SIPArrange(models.Model):
             'arrange': self.arrange_path
         })
 
+    @staticmethod
+    def path_hash(path):
+        if isinstance(path, six.text_type):
+            path = path.encode('utf-8')
+        return hashlib.sha1(path).hexdigest()
+
+    @staticmethod
+    def parent_path(path):
+        """Path of the directory containing ``path``, ending with /."""
+        return os.path.join(os.path.dirname(path.rstrip('/')), '')
+
+    def update_path_hashes(self):
+        self.arrange_path_hash = self.path_hash(self.arrange_path)
+        self.parent_path_hash = self.path_hash(self.parent_path(self.arrange_path))
+
+
+@receiver(pre_save, sender=SIPArrange)
+def update_sip_arrange_path_hashes(sender, instance, **kwargs):
+    instance.update_path_hashes()
+
 
 class SIPArrangeAccessMapping(models.Model):
     """ Maps directories within SIPArrange to descriptive objects in a remote archival management system. """
@@ -526,6 +588,25 @@ class FileFormatVersion(models.Model):
         })
 
 
+class FileChecksum(models.Model):
+    """
+    Message digest of a File, kept by the checksum engine so that later
+    microservices can reuse it instead of reading the file again.
+    """
+    id = models.AutoField(primary_key=True, db_column='pk', editable=False)
+    file = models.ForeignKey('File', db_column='fileUUID', to_field='uuid')
+    algorithm = models.CharField(max_length=36)
+    checksum = models.CharField(max_length=128)
+    # Size and modification time of the file when the digest was computed,
+    # used to tell whether the digest is still valid.
+    size = models.BigIntegerField()
+    modified = models.FloatField()
+
+    class Meta:
+        db_table = u'FilesChecksums'
+        unique_together = ('file', 'algorithm')
+
+
 class JobQuerySet(models.QuerySet):
 
     def get_directory_name(self):
@@ -592,6 +673,129 @@ class Job(models.Model):
             pass
 
 
+class UnitStatusManager(models.Manager):
+
+    def for_unit(self, unit_uuid, unit_type):
+        """Return the status of the unit, computed from its jobs and stored if
+        it isn't known yet. Raises ``UnitStatus.DoesNotExist`` if the unit has
+        no jobs."""
+        try:
+            return self.get_queryset().get(
+                unit_uuid=unit_uuid, unit_type=unit_type)
+        except UnitStatus.DoesNotExist:
+            pass
+        status = UnitStatus(unit_uuid=unit_uuid, unit_type=unit_type)
+        jobs = Job.objects.filter(sipuuid=unit_uuid, unittype=unit_type).order_by(
+            'createdtime', 'createdtimedec')
+        for job in jobs:
+            status.apply_job(job)
+        if status.job_uuid is None:
+            raise UnitStatus.DoesNotExist(
+                'Unit {} has no jobs'.format(unit_uuid))
+        try:
+            with transaction.atomic():
+                status.save(force_insert=True)
+        except IntegrityError:
+            # Stored concurrently, e.g. by MCPServer
+            return self.get_queryset().get(
+                unit_uuid=unit_uuid, unit_type=unit_type)
+        return status
+
+    def job_created(self, job):
+        """Make ``job`` the current job of its unit."""
+        status = self.for_unit(job.sipuuid, job.unittype)
+        status.apply_job(job)
+        status.save()
+        return status
+
+    def job_step_changed(self, job_uuid, currentstep):
+        """Update the status of the unit of the job, if it is its current
+        job."""
+        for status in self.get_queryset().filter(job_uuid=job_uuid):
+            status.current_step = currentstep
+            status.update_status()
+            status.save()
+
+
+class UnitStatus(models.Model):
+    """ Status of a SIP or Transfer, following its current job.
+
+    MCPServer updates it as the jobs of the unit run, so that the status of
+    units can be read without going through their jobs. It must be deleted
+    along with the jobs of the unit, e.g. before a reingest reuses its UUID,
+    to be computed again from the new jobs.
+    """
+    STATUS_PROCESSING = 'PROCESSING'
+    STATUS_USER_INPUT = 'USER_INPUT'
+    STATUS_FAILED = 'FAILED'
+    STATUS_REJECTED = 'REJECTED'
+    STATUS_COMPLETE = 'COMPLETE'
+    STATUS = (
+        (STATUS_PROCESSING, _('Processing')),
+        (STATUS_USER_INPUT, _('Awaiting decision')),
+        (STATUS_FAILED, _('Failed')),
+        (STATUS_REJECTED, _('Rejected')),
+        (STATUS_COMPLETE, _('Complete')),
+    )
+    unit_uuid = models.CharField(max_length=36)
+    unit_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS, default=STATUS_PROCESSING)
+    # Current job of the unit, the one created last
+    job_uuid = UUIDField(auto=False, null=True, default=None, db_index=True)
+    microservice = models.CharField(max_length=250, blank=True)
+    microservice_group = models.CharField(max_length=50, blank=True)
+    current_step = models.IntegerField(choices=Job.STATUS, default=Job.STATUS_UNKNOWN)
+    # Jobs of the unit that make it complete, whatever job comes after them
+    sip_created = models.BooleanField(default=False)
+    moved_to_backlog = models.BooleanField(default=False)
+    processing_directory_removed = models.BooleanField(default=False)
+    # SIP created from the transfer, once its files are in it
+    sip_uuid = models.CharField(max_length=36, blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    objects = UnitStatusManager()
+
+    class Meta:
+        unique_together = ('unit_uuid', 'unit_type')
+        index_together = ('unit_type', 'status')
+
+    def apply_job(self, job):
+        """Make ``job`` the current job of the unit."""
+        self.job_uuid = job.jobuuid
+        self.microservice = job.jobtype
+        self.microservice_group = job.microservicegroup
+        self.current_step = job.currentstep
+        if job.jobtype == 'Create SIP from transfer objects':
+            self.sip_created = True
+        elif job.jobtype == 'Move transfer to backlog':
+            self.moved_to_backlog = True
+        elif job.jobtype == 'Remove the processing directory':
+            self.processing_directory_removed = True
+        self.update_status()
+
+    def update_status(self):
+        group = self.microservice_group.lower()
+        if self.current_step == Job.STATUS_AWAITING_DECISION:
+            self.status = self.STATUS_USER_INPUT
+        elif 'failed' in group:
+            self.status = self.STATUS_FAILED
+        elif 'reject' in group:
+            self.status = self.STATUS_REJECTED
+        elif self.microservice == 'Remove the processing directory':  # Done storing AIP
+            self.status = self.STATUS_COMPLETE
+        elif self.sip_created:
+            self.status = self.STATUS_COMPLETE
+        elif self.moved_to_backlog:
+            self.status = self.STATUS_COMPLETE
+        # The job created last is not always the one that closes the chain
+        # (Ref. https://github.com/archivematica/Issues/issues/262)
+        elif self.unit_type == 'unitSIP' and self.processing_directory_removed:
+            self.status = self.STATUS_COMPLETE
+        else:
+            self.status = self.STATUS_PROCESSING
+
+
 class Task(models.Model):
     taskuuid = models.CharField(max_length=36, primary_key=True, db_column='taskUUID')
     job = models.ForeignKey('Job', db_column='jobuuid', to_field='jobuuid')
@@ -616,6 +820,8 @@ class Task(models.Model):
 
     class Meta:
         db_table = u'Tasks'
+        # Used by MCPServer to estimate the duration of the recent tasks.
+        index_together = (('execution', 'starttime'),)
 
 
 class Agent(models.Model):
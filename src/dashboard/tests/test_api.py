@@ -1,5 +1,6 @@
 import json
 import os
+import shutil
 import tempfile
 
 from django.conf import settings
@@ -7,11 +8,12 @@ from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import Client
+from django.utils import timezone
 from lxml import etree
 
 from components.api import views
 from components import helpers
-from main.models import SIP, Transfer
+from main.models import Job, SIP, Transfer, UnitStatus
 from processing import install_builtin_config
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -158,6 +160,66 @@ class TestAPI(TestCase):
         assert status['status'] == 'COMPLETE'
         assert len(completed) == 1
 
+    def test_unit_status_follows_jobs(self):
+        """The status is updated as MCPServer creates and updates jobs."""
+        load_fixture(['jobs-processing.json'])
+        transfer_uuid = '3e1e56ed-923b-4b53-84fe-c5c1c0b0cf8e'
+        assert views.get_unit_status(transfer_uuid, 'unitTransfer')['status'] == 'PROCESSING'
+
+        def create_job(jobtype, currentstep):
+            job = Job.objects.create(
+                jobtype=jobtype, sipuuid=transfer_uuid, unittype='unitTransfer',
+                microservicegroup='Create SIP from Transfer',
+                createdtime=timezone.now(), currentstep=currentstep)
+            UnitStatus.objects.job_created(job)
+            return job
+
+        job = create_job('Move to SIP creation directory', Job.STATUS_EXECUTING_COMMANDS)
+        UnitStatus.objects.job_step_changed(job.jobuuid, Job.STATUS_AWAITING_DECISION)
+        assert views.get_unit_status(transfer_uuid, 'unitTransfer') == {
+            'microservice': 'Move to SIP creation directory', 'status': 'USER_INPUT'}
+
+        create_job('Move transfer to backlog', Job.STATUS_EXECUTING_COMMANDS)
+        # Only the current job of the unit changes its status
+        UnitStatus.objects.job_step_changed(job.jobuuid, Job.STATUS_AWAITING_DECISION)
+        with self.assertNumQueries(1):
+            assert views.get_unit_status(transfer_uuid, 'unitTransfer') == {
+                'microservice': 'Move transfer to backlog', 'status': 'COMPLETE',
+                'sip_uuid': 'BACKLOG'}
+
+    def test__completed_units_queries(self):
+        load_fixture(['jobs-transfer-complete.json'])
+        assert views._completed_units() == ["3e1e56ed-923b-4b53-84fe-c5c1c0b0cf8e"]
+        assert UnitStatus.objects.count() == 1
+
+        # Once known, the statuses are read with the units
+        with self.assertNumQueries(2):
+            assert views._completed_units() == ["3e1e56ed-923b-4b53-84fe-c5c1c0b0cf8e"]
+
+    @e2e
+    def test_reingest_resets_unit_status(self):
+        load_fixture(['jobs-sip-complete.json'])
+        sip_uuid = '4060ee97-9c3f-4822-afaf-ebdf838284c3'
+        assert views.get_unit_status(sip_uuid, 'unitSIP')['status'] == 'COMPLETE'
+        shared_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared_directory)
+        os.makedirs(os.path.join(shared_directory, 'tmp', 'sip-' + sip_uuid))
+        os.makedirs(os.path.join(shared_directory, 'watchedDirectories', 'system', 'reingestAIP'))
+
+        with self.settings(SHARED_DIRECTORY=shared_directory):
+            resp = self.client.post('/api/ingest/reingest', {
+                'name': 'sip-' + sip_uuid, 'uuid': sip_uuid})
+        assert resp.status_code == 200
+
+        # MCPServer starts the reingest with the same UUID
+        job = Job.objects.create(
+            jobtype='Approve AIP reingest', sipuuid=sip_uuid, unittype='unitSIP',
+            microservicegroup='Reingest AIP', createdtime=timezone.now(),
+            currentstep=Job.STATUS_EXECUTING_COMMANDS)
+        UnitStatus.objects.job_created(job)
+        assert views.get_unit_status(sip_uuid, 'unitSIP') == {
+            'microservice': 'Approve AIP reingest', 'status': 'PROCESSING'}
+
     @e2e
     def test_status(self):
         load_fixture(['jobs-transfer-complete.json'])
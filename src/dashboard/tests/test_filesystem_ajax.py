@@ -1,12 +1,17 @@
 import base64
+import uuid
 import json
 import os
 
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+import mock
 from django.test.client import Client
 
 from components import helpers
+from components.filesystem_ajax import views
 from main import models
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -148,3 +153,93 @@ class TestSIPArrange(TestCase):
         assert base64.b64encode('subsip') in response_dict['entries']
         assert base64.b64encode('newsip') in response_dict['entries']
         assert len(response_dict['entries']) == 2
+
+    def _object_counts(self, path):
+        response = self.client.get(reverse('components.filesystem_ajax.views.arrange_contents'), {'path': base64.b64encode(path)}, follow=True)
+        properties = json.loads(response.content)['properties']
+        return {base64.b64decode(entry): props.get('object count') for entry, props in properties.items()}
+
+    def test_arrange_contents_queries(self):
+        self._object_counts('/arrange/')
+        # Once the object counts are known, browsing only fetches the children
+        with CaptureQueriesContext(connection) as queries:
+            assert self._object_counts('/arrange/') == {'newsip': 2, 'toplevel': 1}
+        arrange_queries = [q['sql'] for q in queries if 'main_siparrange' in q['sql']]
+        assert len(arrange_queries) == 1
+        assert 'parent_path_hash' in arrange_queries[0]
+
+    def test_object_counts_follow_changes(self):
+        assert self._object_counts('/arrange/') == {'newsip': 2, 'toplevel': 1}
+        # Move a file to another directory
+        response = self.client.post(reverse('components.filesystem_ajax.views.copy_to_arrange'), data={'filepath': base64.b64encode('/arrange/newsip/objects/evelyn_s_photo.jpg'), 'destination': base64.b64encode('/arrange/toplevel/subsip/')}, follow=True)
+        assert response.status_code == 201
+        assert self._object_counts('/arrange/') == {'newsip': 1, 'toplevel': 2}
+        assert self._object_counts('/arrange/toplevel/') == {'subsip': 2}
+        # Delete a directory
+        self.client.post(reverse('components.filesystem_ajax.views.delete_arrange'), data={'filepath': base64.b64encode('/arrange/newsip/objects/evelyn_s_second_photo/')}, follow=True)
+        assert self._object_counts('/arrange/') == {'toplevel': 2}
+
+    @override_settings(SEARCH_ENABLED=['transfers'])
+    @mock.patch('storageService.get_file_metadata')
+    @mock.patch('elasticSearchFunctions.get_transfer_file_uuids')
+    @mock.patch('elasticSearchFunctions.get_client')
+    @mock.patch('storageService.browse_location')
+    def test_copy_directory_from_backlog(self, browse_location, get_client, get_transfer_file_uuids, get_file_metadata):
+        transfer_uuid = 'a29e7e86-eca9-43b6-b059-6f23a9802dc8'
+        transfer_path = 'originals/transfer-{}/'.format(transfer_uuid)
+        browse_location.side_effect = lambda location, path: {
+            transfer_path: {'entries': ['objects', 'logs'], 'directories': ['objects', 'logs']},
+            transfer_path + 'objects/': {'entries': ['a.jpg', 'b.jpg', 'sub'], 'directories': ['sub']},
+            transfer_path + 'objects/sub/': {'entries': ['c.jpg'], 'directories': []},
+        }[path]
+        get_transfer_file_uuids.return_value = {
+            'transfer-{}/objects/a.jpg'.format(transfer_uuid): 'e2cd1c66-b3e5-4d2a-9d0b-4fcd4b6e3a3e',
+            # Already arranged
+            'transfer-{}/objects/sub/c.jpg'.format(transfer_uuid): '4fa8f739-b633-4c0f-8833-d108a4f4e88d',
+        }
+        # Not in the index
+        get_file_metadata.return_value = [{'fileuuid': '9c4d7b7a-d8b1-4b1b-8d3c-3a6e0c5b0a2b', 'sipuuid': transfer_uuid}]
+
+        views.copy_files_to_arrange(transfer_path, '/arrange/', fetch_children=True, backlog_uuid='backlog-uuid')
+
+        get_transfer_file_uuids.assert_called_once_with(get_client.return_value, transfer_uuid)
+        get_file_metadata.assert_called_once_with(relative_path='transfer-{}/objects/b.jpg'.format(transfer_uuid))
+        entries = models.SIPArrange.objects.filter(arrange_path__startswith='/arrange/transfer/')
+        assert {(entry.arrange_path, entry.file_uuid) for entry in entries} == {
+            ('/arrange/transfer/', None),
+            ('/arrange/transfer/objects/', None),
+            ('/arrange/transfer/objects/a.jpg', 'e2cd1c66-b3e5-4d2a-9d0b-4fcd4b6e3a3e'),
+            ('/arrange/transfer/objects/b.jpg', '9c4d7b7a-d8b1-4b1b-8d3c-3a6e0c5b0a2b'),
+            ('/arrange/transfer/objects/sub/', None),
+        }
+        assert self._object_counts('/arrange/transfer/') == {'objects': 2}
+
+
+def test_create_arranged_sip(db, tmpdir, settings):
+    settings.SHARED_DIRECTORY = str(tmpdir)
+    staging = tmpdir.mkdir('staging').mkdir('sip')
+    tmpdir.mkdir('watchedDirectories').mkdir('SIPCreation').mkdir('SIPsUnderConstruction')
+    files = []
+    for idx, destination in enumerate(['objects/a.jpg', 'objects/dir/b.jpg', 'objects/dir/sub/c.jpg', 'objects/dir/sub/d.jpg']):
+        file_uuid = str(uuid.uuid4())
+        models.File.objects.create(uuid=file_uuid, currentlocation='%transferDirectory%' + destination)
+        files.append({
+            'source': 'originals/transfer/' + destination,
+            'destination': 'staging/sip/' + destination,
+            'uuid': file_uuid,
+        })
+    sip_uuid = str(uuid.uuid4())
+
+    with CaptureQueriesContext(connection) as queries:
+        assert views.create_arranged_sip('staging/sip/', files, sip_uuid) is None
+
+    # The files are relocated by a single query
+    assert len([q for q in queries if 'UPDATE "Files"' in q['sql']]) == 1
+    assert sorted(models.File.objects.filter(sip_id=sip_uuid).values_list('currentlocation', flat=True)) == [
+        '%SIPDirectory%objects/a.jpg',
+        '%SIPDirectory%objects/dir/b.jpg',
+        '%SIPDirectory%objects/dir/sub/c.jpg',
+        '%SIPDirectory%objects/dir/sub/d.jpg',
+    ]
+    assert not staging.check()
+    assert tmpdir.join('watchedDirectories', 'SIPCreation', 'SIPsUnderConstruction', 'sip', 'logs', 'arrange.log').check()
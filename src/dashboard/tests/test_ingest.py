@@ -89,3 +89,28 @@ class TestIngest(TestCase):
             '</h1>',
         ])
         assert title in response.content
+
+
+@pytest.mark.django_db
+def test_arranged_backlog_paths():
+    from components.ingest.views import _arranged_backlog_paths
+    from main.models import SIPArrange
+    SIPArrange.objects.create(
+        original_path='originals/transfer-1/objects/a.jpg',
+        arrange_path='/arrange/sip/a.jpg',
+        file_uuid='4fa8f739-b633-4c0f-8833-d108a4f4e88d')
+    SIPArrange.objects.create(
+        original_path='originals/transfer-1/objects/b.jpg',
+        arrange_path='/arrange/sip/b.jpg')
+    results = [
+        {'relative_path': 'transfer-1/objects/a.jpg', 'fileuuid': '4fa8f739-b633-4c0f-8833-d108a4f4e88d'},
+        {'relative_path': 'transfer-1/objects/b.jpg', 'fileuuid': '7f889d5d-7849-490e-a8e6-ccb9595445d7'},
+        {'relative_path': 'transfer-1/objects/c.jpg', 'fileuuid': '0fa7d499-24b9-4cd1-afb2-997eba5351bd'},
+    ]
+
+    assert _arranged_backlog_paths(results) == {
+        'transfer-1/objects/a.jpg', 'transfer-1/objects/b.jpg'}
+    # Files without UUID are matched by path
+    results[0]['fileuuid'] = ''
+    assert _arranged_backlog_paths(results) == {
+        'transfer-1/objects/a.jpg', 'transfer-1/objects/b.jpg'}